@@ -1,31 +1,61 @@
 # Command for executing fast api -> uvicorn main:app --reload
 
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import os
-from typing import List, Optional, Dict , Any
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Dict , Any
 from pathlib import Path
+from pydantic import ValidationError
 
-from langchain_community.vectorstores import FAISS
-from src.document_ingestion.data_ingestion import (
-    DocHandler,
-    DocumentComparator,
-    ChatIngestor,
-    FaissManager
-)
+# Only light modules are imported here. Ingestion, analysis, comparison and chat pull in langchain,
+# the provider SDKs, FAISS and pandas, so endpoints import them on first use: the app starts (and
+# /health answers) without paying for them. Check with: python -m utils.import_budget
+from src.document_ingestion.progress import ingest_progress
+from model.models import RetrievalOptions
+from utils.config_loader import load_config
+from utils.deadline import ClientDisconnected, Deadline, DeadlineExceeded, run_until_disconnect
+from utils.file_io import StoredUpload, generate_session_id, save_uploaded_files
+from utils.job_queue import TERMINAL, JobQueue
+from utils.parse_cache import pdf_text
+from utils.warmup import WarmUp
+
+if TYPE_CHECKING:
+    from src.document_ingestion.data_ingestion import DocHandler
 
-from src.document_analyzer.data_analysis import DocumentAnalyzer
-from src.document_compare.document_comparator import DocumentCompareLM
-from src.document_chat.retrieval import ConversationalRAG
-# BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).resolve().parent.parent
 
 FAISS_BASE = os.getenv("FAISS_BASE","fiass_index")
 UPLOAD_BASE = os.getenv("UPLOAD_BASE","data")
 
-app = FastAPI(title=" Document Portal API", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Job workers, then warm-up (see GET /ready), run for the life of the app; they stop in reverse
+    order, and the jobs still running on shutdown go back to the queue.
+    """
+    jobs, warmup = _jobs(), _warmup()
+    if jobs.config.get("enabled", True):
+        await jobs.start()
+    try:
+        await warmup.start()
+        try:
+            yield
+        finally:
+            await warmup.stop()
+    finally:
+        await jobs.stop()
+
+app = FastAPI(title=" Document Portal API", version="0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,8 +66,8 @@ app.add_middleware(
 )
 
 # serve static and templates
-app.mount("/static",StaticFiles(directory="../static"), name="static")
-templates = Jinja2Templates(directory="../templates")
+app.mount("/static",StaticFiles(directory=BASE_DIR / "static"), name="static")
+templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
 @app.get("/",response_class=HTMLResponse)
 async def serve_ui(request:Request): # to render index.html
@@ -45,8 +75,27 @@ async def serve_ui(request:Request): # to render index.html
 
 @app.get("/health")
 def health()-> Dict[str,str]:
+    """Liveness: the process answers. Route traffic on /ready instead."""
     return {"status" : "ok", "service": "document-portal"}
 
+@app.get("/ready")
+def ready()-> JSONResponse:
+    """Readiness: 200 once warm-up (config, modules, models, pools) is done, 503 before; with stage timings."""
+    report = _warmup().report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content={**report, "service": "document-portal"})
+
+@app.get("/metrics/parse")
+def parse_metrics()-> Dict[str, Any]:
+    """Structured output parses per parser: clean / repaired locally / fixed by the LLM / failed."""
+    from utils.json_repair import PARSE_OUTCOMES
+    return {"parse_outcomes": PARSE_OUTCOMES.snapshot()}
+
+@app.get("/metrics/providers")
+def provider_metrics()-> Dict[str, Any]:
+    """Provider gates: calls in flight, token budget left, time spent waiting, coalesced calls."""
+    from utils.call_gateway import GATEWAY
+    return {"gateway": GATEWAY.stats()}
+
 class FastAPIFileAdapter:
     def __init__(self,uf:UploadFile):
         self._uf = uf
@@ -55,7 +104,26 @@ class FastAPIFileAdapter:
         self._uf.file.seek(0)
         return self._uf.file.read()
     
-def read_pdf_via_handler(handler:DocHandler, path:str)-> Any:
+@lru_cache(maxsize=1)
+def _config() -> Dict[str, Any]:
+    return load_config()
+
+def request_deadline(name: str, timeout_s: Optional[float]) -> Deadline:
+    """Request budget from config.yaml `deadlines.<name>`, `timeout_s` overrides it per request."""
+    return Deadline.from_config(_config(), name, timeout_s)
+
+def deadline_error(e: DeadlineExceeded, deadline: Deadline) -> HTTPException:
+    return HTTPException(status_code=504, detail={"error": str(e), "stage": e.stage, "timings": deadline.report()})
+
+# nginx convention for "client closed request"; nobody reads it, it keeps access logs honest
+CLIENT_CLOSED = 499
+
+def check_length_unit(length_unit: Optional[str]) -> None:
+    from src.document_ingestion.text_splitter import LENGTH_UNITS
+    if length_unit and length_unit not in LENGTH_UNITS:
+        raise HTTPException(status_code=400, detail=f"length_unit must be one of {', '.join(LENGTH_UNITS)}")
+
+def read_pdf_via_handler(handler:"DocHandler", path:str)-> Any:
     """Helper function to read PDF using DocHandler"""
     try:
         if hasattr(handler, "read_pdf"):
@@ -66,33 +134,95 @@ def read_pdf_via_handler(handler:DocHandler, path:str)-> Any:
         raise HTTPException(status_code=500, detail =f"Error reading PDF:{str(e)}") 
 
 @app.post("/analyze")
-async def analyze_document(file:UploadFile=File(...)) -> Any:
+async def analyze_document(request: Request, file:UploadFile=File(...), timeout_s: Optional[float] = Form(None)) -> Any:
+    deadline = request_deadline("analyze", timeout_s)
     try:
+        from src.document_ingestion.data_ingestion import DocHandler
+        from src.document_analyzer.data_analysis import DocumentAnalyzer
         doc_handler = DocHandler()
         save_path = doc_handler.save_pdf(FastAPIFileAdapter(file))
-        text = read_pdf_via_handler(doc_handler,save_path)
+        text = await deadline.run_sync("read", read_pdf_via_handler, doc_handler, save_path)
         doc_analyzer = DocumentAnalyzer()
-        result = doc_analyzer.analyze_document(text)
+        result = await run_until_disconnect(request.is_disconnected, doc_analyzer.aanalyze_document(text, deadline))
         return JSONResponse(content = result)
     
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise deadline_error(e, deadline)
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED)
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Analysis failed : {e}")
 
+@app.post("/analyze/batch")
+async def analyze_documents(
+    files: List[UploadFile] = File(...),
+    max_concurrency: Optional[int] = Form(None),
+    timeout_s: Optional[float] = Form(None)
+    ) -> Any:
+    """
+    Analyze many PDFs at once. The response is NDJSON: one line per document as its analysis
+    completes ({"index", "file_name", "status": ok | error | timeout, "result" | "error", timings}),
+    then a {"summary": ...} line. Failed documents do not fail the batch.
+    """
+    try:
+        max_files = _config().get("analysis_batch", {}).get("max_files")
+        if max_files and len(files) > max_files:
+            raise HTTPException(status_code=400, detail=f"At most {max_files} files per batch")
+        batch_dir = Path(UPLOAD_BASE) / "analysis_batch" / generate_session_id("batch")
+        rejected, accepted = [], []
+        for index, f in enumerate(files):
+            if Path(f.filename or "").suffix.lower() == ".pdf":
+                accepted.append((index, f))
+            else:
+                rejected.append({"index": index, "file_name": f.filename, "status": "error", "stage": "upload", "error": "Invalid file type. Upload PDF file..."})
+        saved = save_uploaded_files([FastAPIFileAdapter(f) for _, f in accepted], batch_dir)
+        from src.document_analyzer.batch_analysis import BatchAnalyzer
+        batch = BatchAnalyzer(max_concurrency=max_concurrency, timeout_s=timeout_s)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Batch analysis failed : {e}")
+
+    async def lines():
+        started = time.monotonic()
+        counts = {"ok": 0, "error": len(rejected), "timeout": 0}
+        for item in rejected:
+            yield json.dumps(item) + "\n"
+        async for item in batch.analyze([(index, f.filename, path) for (index, f), path in zip(accepted, saved)]):
+            counts[item["status"]] += 1
+            yield json.dumps(item, default=str) + "\n"
+        summary = {"documents": len(files), **counts, "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.post("/compare")
-async def compare_document(reference : UploadFile = File(...), actual : UploadFile = File(...)) -> Any:
+async def compare_document(
+    request: Request,
+    reference : UploadFile = File(...),
+    actual : UploadFile = File(...),
+    timeout_s: Optional[float] = Form(None)
+    ) -> Any:
+    deadline = request_deadline("compare", timeout_s)
     try:
+        from src.document_ingestion.data_ingestion import DocumentComparator
+        from src.document_compare.document_comparator import DocumentCompareLM
         doc_comparator = DocumentComparator()
         ref_path, act_path = doc_comparator.save_uploaded_files(FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
         _ = ref_path, act_path
-        combined_text = doc_comparator.combine_documents()
+        combined_text = await deadline.run_sync("read", doc_comparator.combine_documents)
         doc_compare = DocumentCompareLM()
-        result = doc_compare.compare_document(combined_text)
-        return {"rows": result.to_dict(orient="records"), "session_id": doc_compare.session_id}
+        result = await run_until_disconnect(request.is_disconnected, doc_compare.acompare_document(combined_text, deadline))
+        return {"rows": result.to_dict(orient="records"), "session_id": doc_comparator.session_id}
     
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise deadline_error(e, deadline)
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED)
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Comparison failed : {e}")
     
@@ -103,48 +233,478 @@ async def chat_build_index(
     use_session_dirs:bool=Form(True),
     chunk_size:int=Form(1000),
     chunk_overlap:int=Form(200),
-    k:int =Form(5)
+    k:int =Form(5),
+    replace_sources:Optional[str] = Form(None),
+    length_unit:Optional[str] = Form(None)
     ) -> Any:
     try:
+        check_length_unit(length_unit)
         wrapped =[ FastAPIFileAdapter(f) for f in files]
+        # comma separated sources / file names superseded by this upload
+        replaced = [s.strip() for s in (replace_sources or "").split(",") if s.strip()]
+        from src.document_ingestion.data_ingestion import ChatIngestor
         chat_ingestor = ChatIngestor(
             temp_base=UPLOAD_BASE,
             faiss_base=FAISS_BASE,
-            use_session_dirs=use_session_dirs,
+            use_session_dir=use_session_dirs,
             session_id =session_id or None
         )
-        chat_ingestor.build_retriever(wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
-        return {"session_id":chat_ingestor.session_id,"k":k,"use_session_dirs":use_session_dirs}
+        chat_ingestor.build_retriever(
+            wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k, replace_sources=replaced,
+            length_unit=length_unit
+        )
+        return {
+            "session_id":chat_ingestor.session_id,
+            "k":k,
+            "use_session_dirs":use_session_dirs,
+            "progress": chat_ingestor.progress.snapshot(events=False)
+        }
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Indexing failed : {e}")
     
-@app.post("/chat/query")
-async def chat_query(
-    question: str = Form(...),
+@app.get("/chat/index/progress")
+def chat_index_progress(session_id: str, events: bool = False) -> Any:
+    """
+    Live progress of the latest indexing run of a session in this process: stage, totals, time per
+    stage, embedding batch timings and chunks/sec (`events=true` adds the event log).
+    Indexing queued as a job reports the same events through /jobs/{job_id}.
+    """
+    progress = ingest_progress(session_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"No indexing run found for session: {session_id}")
+    return progress.snapshot(events=events)
+
+@app.post("/chat/delete")
+async def chat_delete_source(
+    source: str = Form(...),
     session_id: Optional[str] = Form(None),
-    use_session_dirs: bool = Form(True),
-    k: int = Form(5)
-        ) -> Any:
+    use_session_dirs: bool = Form(True)
+    ) -> Any:
+    """Remove a document (source path or file name) from a session index."""
+    try:
+        if use_session_dirs and not session_id:
+            raise HTTPException(status_code=400, detail= "session_id isrequired when use_session_dirs=True")
+        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
+        if not os.path.isdir(index_dir):
+            raise HTTPException(status_code=404, detail=f"FAISS index not found at:{index_dir}")
+        from src.document_ingestion.data_ingestion import FaissManager
+        removed = FaissManager(index_dir).delete_source(source)
+        if not removed:
+            raise HTTPException(status_code=404, detail=f"Source not found in index: {source}")
+        return {"session_id": session_id, "source": source, "removed": removed}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Delete failed : {e}")
+
+@app.get("/chat/sources")
+def chat_sources(session_id: Optional[str] = None, use_session_dirs: bool = True) -> Any:
+    """Documents in a session index with chunk counts and page ranges, for building metadata filters."""
     try:
         if use_session_dirs and not session_id:
             raise HTTPException(status_code=400, detail= "session_id isrequired when use_session_dirs=True")
         index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
         if not os.path.isdir(index_dir):
             raise HTTPException(status_code=404, detail=f"FAISS index not found at:{index_dir}")
-        rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir)
+        from src.document_ingestion.data_ingestion import FaissManager
+        return {"session_id": session_id, "sources": FaissManager(index_dir).sources()}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Listing sources failed : {e}")
+
+@app.post("/chat/merge")
+async def chat_merge_sessions(
+    session_ids: str = Form(...),
+    max_chunks: Optional[int] = Form(None)
+    ) -> Any:
+    """Merge small session indexes into the shared index used by federation=shared queries."""
+    try:
+        from src.document_ingestion.data_ingestion import SHARED_INDEX_NAME, FaissManager
+        ids = [s.strip() for s in session_ids.split(",") if s.strip()]
+        sessions = {sid: os.path.join(FAISS_BASE, sid) for sid in ids}
+        missing = [sid for sid, path in sessions.items() if not os.path.isdir(path)]
+        if not ids or missing:
+            raise HTTPException(status_code=404, detail=f"FAISS index not found for sessions: {missing or session_ids}")
+        fm = FaissManager(os.path.join(FAISS_BASE, SHARED_INDEX_NAME))
+        added = fm.merge_sessions(sessions, max_chunks=max_chunks)
+        return {"added": added, "shared_index": SHARED_INDEX_NAME, "sessions": fm.fingerprints.merged_sessions()}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Merge failed : {e}")
+
+@app.post("/chat/query")
+async def chat_query(
+    request: Request,
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    session_ids: Optional[str] = Form(None),
+    federation: str = Form("parallel"),
+    use_session_dirs: bool = Form(True),
+    k: Optional[int] = Form(None),
+    search_type: Optional[str] = Form(None),
+    fetch_k: Optional[int] = Form(None),
+    lambda_mult: Optional[float] = Form(None),
+    score_threshold: Optional[float] = Form(None),
+    retrieval_mode: Optional[str] = Form(None),
+    vector_weight: Optional[float] = Form(None),
+    max_context_tokens: Optional[int] = Form(None),
+    compress: Optional[bool] = Form(None),
+    rerank: Optional[bool] = Form(None),
+    rerank_candidates: Optional[int] = Form(None),
+    metadata_filter: Optional[str] = Form(None),
+    timeout_s: Optional[float] = Form(None)
+        ) -> Any:
+    deadline = request_deadline("chat_query", timeout_s)
+    try:
+        from src.document_ingestion.data_ingestion import SHARED_INDEX_NAME
+        from src.document_chat.retrieval import ConversationalRAG
+        # session_ids (comma separated) queries several sessions at once, see federation
+        federated = [s.strip() for s in (session_ids or "").split(",") if s.strip()]
+        if federated and federation not in ("parallel", "shared"):
+            raise HTTPException(status_code=400, detail="federation must be 'parallel' or 'shared'")
+        if federated:
+            index_dir = os.path.join(FAISS_BASE, SHARED_INDEX_NAME)
+            required = [os.path.join(FAISS_BASE, sid) for sid in federated] if federation == "parallel" else [index_dir]
+        else:
+            if use_session_dirs and not session_id:
+                raise HTTPException(status_code=400, detail= "session_id isrequired when use_session_dirs=True")
+            index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
+            required = [index_dir]
+        missing = [d for d in required if not os.path.isdir(d)]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"FAISS index not found at:{', '.join(missing)}")
+        # unset fields fall back to config.yaml `retriever`
+        overrides = {
+            name: value for name, value in {
+                "k": k,
+                "search_type": search_type,
+                "fetch_k": fetch_k,
+                "lambda_mult": lambda_mult,
+                "score_threshold": score_threshold,
+                "mode": retrieval_mode,
+                "vector_weight": vector_weight,
+                "max_context_tokens": max_context_tokens,
+                "compress": compress,
+                "rerank": rerank,
+                "rerank_candidates": rerank_candidates
+            }.items() if value is not None
+        }
+        try:
+            # JSON, e.g. {"file_name": "a1b2c3d4.pdf", "page": {"$gte": 2, "$lte": 5}}
+            if metadata_filter:
+                overrides["filter"] = json.loads(metadata_filter)
+            RetrievalOptions(**overrides)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"metadata_filter is not valid JSON: {e}")
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid retrieval options: {e}")
+        rag = ConversationalRAG(session_id=session_id or ",".join(federated))
+        if federated:
+            rag.load_retriever_from_sessions(
+                {sid: os.path.join(FAISS_BASE, sid) for sid in federated},
+                federation=federation,
+                shared_index_path=index_dir,
+                **overrides
+            )
+        else:
+            rag.load_retriever_from_faiss(index_dir, **overrides)
         
-        response = rag.invoke(question, chat_history=[])
+        response = await run_until_disconnect(request.is_disconnected, rag.ainvoke(question, chat_history=[], deadline=deadline))
         return {
             "answer":response,
             "session_id": session_id,
-            "k":k,
-            "engine":"LCEL-RAG"
+            "session_ids": federated or None,
+            "federation": federation if federated else None,
+            "k":rag.options.k,
+            "retrieval": rag.options.model_dump(),
+            "rerank": rag.last_rerank,
+            "compression": rag.last_compression,
+            "engine":"LCEL-RAG",
+            "timings": deadline.report()
         }
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise deadline_error(e, deadline)
+    except ClientDisconnected:
+        return Response(status_code=CLIENT_CLOSED)
     except Exception as e:
-        raise HTTPException(status_code=500,detail=f"Query failed : {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500,detail=f"Query failed : {e}")
+
+# ---------- Background jobs ----------
+def _index_job(job_id: str, payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    progress("indexing", files=len(payload["files"]))
+    from src.document_ingestion.data_ingestion import ChatIngestor
+    chat_ingestor = ChatIngestor(
+        temp_base=UPLOAD_BASE,
+        faiss_base=FAISS_BASE,
+        use_session_dir=payload["use_session_dirs"],
+        session_id=payload["session_id"],
+        # ingest events become the job's progress (and its cancellation point)
+        on_progress=lambda event: progress(event["stage"], **{key: value for key, value in event.items() if key != "stage"})
+    )
+    chat_ingestor.build_retriever(
+        [StoredUpload(path, name) for path, name in payload["files"]],
+        chunk_size=payload["chunk_size"], chunk_overlap=payload["chunk_overlap"], k=payload["k"],
+        replace_sources=payload["replace_sources"], length_unit=payload["length_unit"]
+    )
+    return {
+        "session_id": chat_ingestor.session_id,
+        "k": payload["k"],
+        "use_session_dirs": payload["use_session_dirs"],
+        "progress": chat_ingestor.progress.snapshot(events=False)
+    }
+
+async def _analyze_job(job_id: str, payload: Dict[str, Any], progress) -> Any:
+    progress("reading")
+    deadline = request_deadline("analyze", payload.get("timeout_s"))
+    text = await deadline.run_sync("read", pdf_text, payload["files"][0][0])
+    progress("analyzing")
+    from src.document_analyzer.data_analysis import DocumentAnalyzer
+    return await DocumentAnalyzer().aanalyze_document(text, deadline)
+
+async def _compare_job(job_id: str, payload: Dict[str, Any], progress) -> Dict[str, Any]:
+    progress("reading")
+    deadline = request_deadline("compare", payload.get("timeout_s"))
+    from src.document_ingestion.data_ingestion import DocumentComparator
+    from src.document_compare.document_comparator import DocumentCompareLM
+    doc_comparator = DocumentComparator(session_id=job_id)
+    # server-side names: the client's file names never reach the filesystem, and reference sorts first
+    for position, (path, _) in enumerate(payload["files"]):
+        shutil.copyfile(path, doc_comparator.session_dir / f"{position}_{Path(path).name}")
+    combined_text = await deadline.run_sync("read", doc_comparator.combine_documents)
+    progress("comparing")
+    doc_compare = DocumentCompareLM()
+    result = await doc_compare.acompare_document(combined_text, deadline)
+    return {"rows": result.to_dict(orient="records"), "session_id": doc_comparator.session_id}
+
+@lru_cache(maxsize=1)
+def _jobs() -> JobQueue:
+    jobs = JobQueue(_config().get("jobs"))
+    jobs.register("chat_index", _index_job)
+    jobs.register("analyze", _analyze_job)
+    jobs.register("compare", _compare_job)
+    return jobs
+
+# Warm-up stages (config.yaml -> warmup), run once after startup; see GET /ready
+
+# modules api.main imports on first use only (see utils.import_budget), imported here instead
+WARM_MODULES = (
+    "src.document_ingestion.data_ingestion",
+    "src.document_chat.retrieval",
+    "src.document_analyzer.batch_analysis",
+    "src.document_compare.document_comparator",
+)
+
+def _warm_config(progress) -> None:
+    progress(sections=sorted(_config()))
+
+def _warm_modules(progress) -> None:
+    import importlib
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    progress(modules=len(WARM_MODULES))
+
+def _warm_models(progress) -> None:
+    """Create the embedding and LLM clients in the process-wide model registry."""
+    from utils.model_loader import ModelLoader, registered_models
+    model_loader = ModelLoader()
+    model_loader.load_embedding()
+    model_loader.load_llm()
+    progress(models=registered_models())
+
+def _warm_pools(progress) -> None:
+    """Open the parse cache, start the PDF parse processes and open the job store."""
+    from utils.parse_cache import get_parse_cache
+    cache = get_parse_cache()
+    progress(parse_cache=str(cache.path) if cache is not None else None)
+    if _warmup().config["pool_workers"]:
+        from src.document_analyzer.batch_analysis import DEFAULT_BATCH, _parse_pool
+        workers = max(1, int({**DEFAULT_BATCH, **(_config().get("analysis_batch", {}) or {})}["parse_workers"]))
+        pool = _parse_pool(workers)
+        # processes are started on demand: one short task per worker, all in flight at once, starts them all now
+        for future in [pool.submit(time.sleep, 0.05) for _ in range(workers)]:
+            future.result()
+        progress(parse_workers=workers)
+    progress(jobs=str(_jobs().store.path))
+
+def _warm_indexes(progress) -> None:
+    """Open the hot session indexes into the index cache and fault their pages in."""
+    import numpy as np
+    from src.document_chat.index_cache import INDEX_CACHE
+    from src.document_ingestion.data_ingestion import SHARED_INDEX_NAME
+    from src.document_ingestion.vector_store import mmap_enabled
+    from utils.model_loader import ModelLoader
+    config = _warmup().config
+    sessions = list(config["hot_sessions"] or []) + ([SHARED_INDEX_NAME] if config["shared_index"] else [])
+    faiss_config = _config().get("faiss", {}) or {}
+    INDEX_CACHE.max_size = int(faiss_config.get("index_cache_size", INDEX_CACHE.max_size))
+    embedding = ModelLoader().load_embedding()
+    loaded: Dict[str, Any] = {}
+    for session_id in sessions:
+        index_dir = os.path.join(FAISS_BASE, session_id)
+        started = time.perf_counter()
+        if not os.path.isdir(index_dir):
+            loaded[session_id] = {"status": "missing"}
+        else:
+            try:
+                store = INDEX_CACHE.get(
+                    index_dir,
+                    embedding,
+                    mmap=mmap_enabled(faiss_config),
+                    cache_size=int(faiss_config.get("chunk_cache_size", 1024))
+                )
+                # one search touches a flat index end to end, so the first query finds it in the page cache
+                if store.index.ntotal:
+                    store.index.search(np.zeros((1, store.index.d), dtype="float32"), 1)
+                loaded[session_id] = {"status": "loaded", "vectors": int(store.index.ntotal),
+                                      "ms": round((time.perf_counter() - started) * 1000, 1)}
+            except Exception as e:
+                loaded[session_id] = {"status": "failed", "error": str(e)}
+        progress(indexes=dict(loaded))
+    failed = [sid for sid, entry in loaded.items() if entry["status"] == "failed"]
+    if failed:
+        raise RuntimeError(f"Hot indexes failed to load: {', '.join(failed)}")
+
+@lru_cache(maxsize=1)
+def _warmup() -> WarmUp:
+    warmup = WarmUp(_config().get("warmup"))
+    warmup.add("config", _warm_config)
+    warmup.add("modules", _warm_modules)
+    warmup.add("models", _warm_models)
+    warmup.add("pools", _warm_pools)
+    warmup.add("indexes", _warm_indexes, required=bool(warmup.config["wait_for_indexes"]))
+    return warmup
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job as returned to clients (the payload only holds server-side paths and form fields)."""
+    return {key: value for key, value in job.items() if key not in ("payload", "worker")}
+
+def queue_job(kind: str, uploads: List[UploadFile], payload: Dict[str, Any], tenant: str, priority: int) -> JSONResponse:
+    """Keep the uploads with the job (so it survives a restart) and queue it; 202 with the job id."""
+    jobs = _jobs()
+    job_id = uuid.uuid4().hex
+    names: Dict[str, str] = {}
+    paths = save_uploaded_files([FastAPIFileAdapter(f) for f in uploads], jobs.files_dir(job_id), names=names)
+    payload["files"] = [[str(p), names[str(p)]] for p in paths]
+    jobs.submit(kind, payload, tenant=tenant, priority=priority, job_id=job_id)
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        **{key: payload[key] for key in ("session_id",) if key in payload}
+    })
+
+def _require_pdf(*uploads: UploadFile) -> None:
+    for f in uploads:
+        if Path(f.filename or "").suffix.lower() != ".pdf":
+            raise HTTPException(status_code=400, detail=f"Invalid file type: {f.filename}. Upload PDF file...")
+
+@app.post("/jobs/chat/index", status_code=202)
+async def queue_chat_index(
+    files:List[UploadFile] = File(...),
+    session_id:Optional[str] = Form(None),
+    use_session_dirs:bool=Form(True),
+    chunk_size:int=Form(1000),
+    chunk_overlap:int=Form(200),
+    k:int =Form(5),
+    replace_sources:Optional[str] = Form(None),
+    length_unit:Optional[str] = Form(None),
+    tenant:str = Form("default"),
+    priority:int = Form(0)
+    ) -> Any:
+    """/chat/index as a background job; the session id is assigned now so clients can poll and query it."""
+    try:
+        check_length_unit(length_unit)
+        payload = {
+            "session_id": session_id or generate_session_id(),
+            "use_session_dirs": use_session_dirs,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "k": k,
+            "replace_sources": [s.strip() for s in (replace_sources or "").split(",") if s.strip()],
+            "length_unit": length_unit
+        }
+        return queue_job("chat_index", files, payload, tenant, priority)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Queueing indexing failed : {e}")
+
+@app.post("/jobs/analyze", status_code=202)
+async def queue_analyze(
+    file:UploadFile=File(...),
+    timeout_s: Optional[float] = Form(None),
+    tenant:str = Form("default"),
+    priority:int = Form(0)
+    ) -> Any:
+    try:
+        _require_pdf(file)
+        return queue_job("analyze", [file], {"timeout_s": timeout_s}, tenant, priority)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Queueing analysis failed : {e}")
+
+@app.post("/jobs/compare", status_code=202)
+async def queue_compare(
+    reference : UploadFile = File(...),
+    actual : UploadFile = File(...),
+    timeout_s: Optional[float] = Form(None),
+    tenant:str = Form("default"),
+    priority:int = Form(0)
+    ) -> Any:
+    try:
+        _require_pdf(reference, actual)
+        return queue_job("compare", [reference, actual], {"timeout_s": timeout_s}, tenant, priority)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500,detail=f"Queueing comparison failed : {e}")
+
+@app.get("/jobs")
+def list_jobs(tenant: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> Any:
+    return {"jobs": [_job_view(job) for job in _jobs().store.list(tenant=tenant, status=status, limit=limit)]}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str) -> Any:
+    job = _jobs().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return _job_view(job)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> Any:
+    status = _jobs().cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return {"job_id": job_id, "status": status}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str) -> Any:
+    """Server-sent events: the job state each time it changes, until it succeeds, fails or is cancelled."""
+    jobs = _jobs()
+    if jobs.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def events():
+        last = None
+        while not await request.is_disconnected():
+            job = await asyncio.to_thread(jobs.store.get, job_id)
+            if job["updated_at"] != last:
+                last = job["updated_at"]
+                yield f"event: {job['status']}\ndata: {json.dumps(_job_view(job), default=str)}\n\n"
+            if job["status"] in TERMINAL:
+                break
+            await asyncio.sleep(min(jobs.config["poll_interval_s"], 0.5))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
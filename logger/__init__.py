@@ -0,0 +1,3 @@
+from logger.custom_logger import CustomLogger
+
+GLOBAL_LOGGER = CustomLogger().get_Logger("document_portal")
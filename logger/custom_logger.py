@@ -90,7 +90,8 @@ class CustomLogger:
         file_formatter = logging.Formatter("%(message)s")
         console_formatter = logging.Formatter("%(message)s")
 
-        file_handler = logging.FileHandler(self.log_file_path)
+        # opened on the first record, so importing a module that creates a logger writes no file
+        file_handler = logging.FileHandler(self.log_file_path, delay=True)
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(file_formatter) 
 
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, RootModel
-from typing import List, Union
+from pydantic import BaseModel, Field, RootModel
+from typing import Any, Dict, List, Literal, Optional, Union
 from enum import Enum
 
 class Metadata(BaseModel):
@@ -24,4 +24,39 @@ class PromptType(str, Enum):
     DOCUMENT_ANALYSIS = "document_analysis"
     DOCUMENT_COMPARISON = "document_comparison"
     CONTEXTUALIZE_QUESTION = "contextualize_question"
-    CONTEXT_QA = "context_qa"
\ No newline at end of file
+    CONTEXT_QA = "context_qa"
+
+class RetrievalOptions(BaseModel):
+    """Per-query retrieval settings; unset fields fall back to config.yaml `retriever`."""
+    k: int = Field(4, ge=1, le=50)
+    search_type: Literal["similarity", "mmr", "similarity_score_threshold"] = "similarity"
+    fetch_k: int = Field(20, ge=1, le=500)
+    lambda_mult: float = Field(0.5, ge=0, le=1)
+    score_threshold: Optional[float] = Field(None, ge=0, le=1)
+    mode: Literal["vector", "bm25", "hybrid"] = "vector"
+    vector_weight: float = Field(0.5, ge=0, le=1)
+    max_context_tokens: Optional[int] = Field(None, ge=1)
+    compress: bool = False
+    rerank: bool = False
+    rerank_candidates: int = Field(20, ge=1, le=200)
+    # LangChain FAISS filter syntax; source / file_name / doc_type / page / session_id are pre-filtered
+    filter: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_config(cls, retriever_config: Dict[str, Any], **overrides: Any) -> "RetrievalOptions":
+        hybrid = retriever_config.get("hybrid", {}) or {}
+        values = {
+            "k": retriever_config.get("top_k"),
+            "search_type": retriever_config.get("search_type"),
+            "fetch_k": retriever_config.get("fetch_k"),
+            "lambda_mult": retriever_config.get("lambda_mult"),
+            "score_threshold": retriever_config.get("score_threshold"),
+            "mode": retriever_config.get("mode"),
+            "vector_weight": hybrid.get("vector_weight"),
+            "max_context_tokens": retriever_config.get("max_context_tokens"),
+            "compress": (retriever_config.get("compression", {}) or {}).get("enabled"),
+            "rerank": (retriever_config.get("rerank", {}) or {}).get("enabled"),
+            "rerank_candidates": (retriever_config.get("rerank", {}) or {}).get("candidates"),
+        }
+        values.update(overrides)
+        return cls(**{key: value for key, value in values.items() if value is not None})
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from logger import GLOBAL_LOGGER as log
+from utils.config_loader import load_config
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.parse_cache import pdf_text
+from src.document_analyzer.data_analysis import DocumentAnalyzer
+
+DEFAULT_BATCH = {"max_files": 50, "max_concurrency": 4, "parse_workers": 4}
+
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def _parse_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process-wide pool for PDF text extraction, which is CPU bound and would hold the GIL on threads.
+    Workers are spawned, not forked: a fork of the running server copies its threads' held locks.
+    """
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            _PARSE_POOL = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+        return _PARSE_POOL
+
+
+def _reset_parse_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died, so the next parse starts a fresh one."""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is pool:
+            _PARSE_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _ms(since: float) -> float:
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+class BatchAnalyzer:
+    """
+    Analysis of many PDFs in one request (config.yaml -> analysis_batch): texts are extracted in a
+    process pool, at most `max_concurrency` LLM analyses run at once (provider limits still apply
+    through the call gateway), and results are yielded one per document as each completes.
+    A document that fails yields an error item; the rest of the batch carries on.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, timeout_s: Optional[float] = None):
+        self.config = load_config()
+        self.batch_config = {**DEFAULT_BATCH, **(self.config.get("analysis_batch", {}) or {})}
+        limit = self.batch_config["max_concurrency"]
+        # a request may lower the concurrency, not raise it above the configured limit
+        self.max_concurrency = max(1, min(max_concurrency or limit, limit))
+        self.timeout_s = timeout_s
+        self.analyzer = DocumentAnalyzer()
+
+    async def _parse(self, path: Path) -> str:
+        pool = _parse_pool(self.batch_config["parse_workers"])
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, pdf_text, str(path))
+        except BrokenProcessPool:
+            _reset_parse_pool(pool)
+            raise
+
+    async def _analyze_one(self, index: int, file_name: str, path: Path, slots: asyncio.Semaphore) -> Dict[str, Any]:
+        item: Dict[str, Any] = {"index": index, "file_name": file_name}
+        started = time.monotonic()
+        stage = "parse"
+        try:
+            text = await self._parse(path)
+            item["parse_ms"] = _ms(started)
+            queued = time.monotonic()
+            async with slots:
+                item["queued_ms"] = _ms(queued)
+                stage = "analyze"
+                # the request budget applies per document, from the moment its analysis starts
+                deadline = Deadline.from_config(self.config, "analyze", self.timeout_s)
+                try:
+                    item["result"] = await self.analyzer.aanalyze_document(text, deadline)
+                finally:
+                    item["timings"] = deadline.report()
+            item["status"] = "ok"
+        except DeadlineExceeded as e:
+            item.update(status="timeout", stage=e.stage, error=str(e))
+        except Exception as e:
+            item.update(status="error", stage=stage, error=str(e))
+            log.error("Batch document analysis failed", file_name=file_name, stage=stage, error=str(e))
+        item["elapsed_ms"] = _ms(started)
+        return item
+
+    async def analyze(self, files: List[Tuple[int, str, Path]]) -> AsyncIterator[Dict[str, Any]]:
+        """Analyze (index, file name, saved path) triples; yields item dicts in completion order."""
+        slots = asyncio.Semaphore(self.max_concurrency)
+        tasks = [asyncio.ensure_future(self._analyze_one(index, name, path, slots)) for index, name, path in files]
+        log.info("Batch analysis started", documents=len(tasks), max_concurrency=self.max_concurrency)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # the consumer went away (client disconnect): stop the analyses still queued or running
+            for task in tasks:
+                task.cancel()
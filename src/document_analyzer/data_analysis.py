@@ -2,9 +2,11 @@ from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import *
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
 from langchain.output_parsers import OutputFixingParser
 from prompt.prompt_library import PROMPT_REGISTRY
+from utils.deadline import Deadline
+from utils.json_repair import RepairingJsonOutputParser
 
 class DocumentAnalyzer:
     """
@@ -18,8 +20,11 @@ class DocumentAnalyzer:
             self.model_loader = ModelLoader()
             self.llm = self.model_loader.load_llm()
 
-            self.parser = JsonOutputParser(pydantic_object= Metadata)
-            self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser,llm=self.llm)
+            # local repair (think tags, fences, trailing commas...) first, the LLM fix only when that fails
+            self.fixing_parser = OutputFixingParser.from_llm(
+                parser=RepairingJsonOutputParser(pydantic_object= Metadata, record=False), llm=self.llm
+            )
+            self.parser = RepairingJsonOutputParser(pydantic_object= Metadata, fixer=self.fixing_parser, label="analysis")
 
             self.prompt = PROMPT_REGISTRY["document_analysis"]
 
@@ -32,7 +37,7 @@ class DocumentAnalyzer:
     def analyze_document(self, document:str)-> dict:
         """Extract the text from the document and extract structured metadata and summary"""
         
-        chain = self.prompt | self.llm | self.fixing_parser
+        chain = self.prompt | self.llm | self.parser
 
         self.log.info("Rag chain is successfully initialized.")
 
@@ -43,3 +48,22 @@ class DocumentAnalyzer:
         
         self.log.info('Metadata extraction successful', keys=list(response.keys()))
         return response
+
+    async def aanalyze_document(self, document:str, deadline: Optional[Deadline] = None)-> dict:
+        """
+        analyze_document under a request deadline: generation and the OutputFixingParser repair
+        round trip are separate stages ("generate", "fix"), each cancelled when time runs out.
+        """
+        deadline = deadline or Deadline()
+        message = await deadline.run("generate", (self.prompt | self.llm).ainvoke({
+            "format_instructions":self.parser.get_format_instructions(),
+            "document_text": document
+            }))
+        try:
+            response = self.parser.parse_local(message.content)
+        except OutputParserException as e:
+            self.log.warning("Model output is not repairable JSON, asking the model to fix it")
+            response = await deadline.run("fix", self.parser.afix(message.content, e))
+
+        self.log.info('Metadata extraction successful', keys=list(response.keys()), timings_ms=deadline.timings)
+        return response
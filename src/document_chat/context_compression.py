@@ -0,0 +1,134 @@
+from __future__ import annotations
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.token_utils import estimate_tokens
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])|\n{2,}")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s and s.strip()]
+
+
+class SentenceEmbeddingCache:
+    """Process-wide LRU of sentence embeddings, keyed by embedding model and sentence hash."""
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def embed(self, embedding: Embeddings, sentences: Sequence[str]) -> np.ndarray:
+        """Unit-normalized embeddings for `sentences`; only cache misses hit the embedding model."""
+        model = str(getattr(embedding, "model", type(embedding).__name__))
+        keys = [self._key(model, s) for s in sentences]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        missing = list({key: i for i, key in enumerate(keys) if key not in found}.items())
+        if missing:
+            vectors = _normalize(np.array(embedding.embed_documents([sentences[i] for _, i in missing]), dtype=np.float32))
+            with self._lock:
+                for (key, _), vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._data[key] = vector
+                    self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([found[key] for key in keys])
+
+
+SENTENCE_CACHE = SentenceEmbeddingCache()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class ContextCompressor:
+    """
+    Shrinks retrieved chunks to the sentences relevant to the question before the QA prompt.
+    Sentences are scored by embedding cosine to the question; near-duplicates across chunks are dropped.
+    """
+    def __init__(
+        self,
+        embedding: Embeddings,
+        similarity_threshold: float = 0.5,
+        min_sentences_per_chunk: int = 1,
+        redundancy_threshold: float = 0.92,
+        cache: SentenceEmbeddingCache = SENTENCE_CACHE
+    ):
+        self.embedding = embedding
+        self.similarity_threshold = similarity_threshold
+        self.min_sentences_per_chunk = min_sentences_per_chunk
+        self.redundancy_threshold = redundancy_threshold
+        self.cache = cache
+
+    def compress(self, question: str, docs: Sequence[Document]) -> Tuple[List[Document], Dict[str, Any]]:
+        """Return the compressed documents (rank order kept) and per-query stats."""
+        per_doc = [split_sentences(d.page_content) for d in docs]
+        sentences = [s for doc_sentences in per_doc for s in doc_sentences]
+        original_tokens = sum(estimate_tokens(d.page_content) for d in docs)
+        if not sentences:
+            return list(docs), self._stats(len(docs), len(docs), 0, 0, original_tokens, original_tokens)
+
+        query = _normalize(np.array(self.embedding.embed_query(question), dtype=np.float32))
+        vectors = self.cache.embed(self.embedding, sentences)
+        scores = vectors @ query
+
+        compressed: List[Document] = []
+        kept_vectors: List[np.ndarray] = []
+        kept_sentences = 0
+        offset = 0
+        for doc, doc_sentences in zip(docs, per_doc):
+            idx = range(offset, offset + len(doc_sentences))
+            offset += len(doc_sentences)
+            best = sorted(idx, key=lambda i: scores[i], reverse=True)[: self.min_sentences_per_chunk]
+            selected = []
+            for i in idx:
+                if scores[i] < self.similarity_threshold and i not in best:
+                    continue
+                if kept_vectors and float(np.max(np.vstack(kept_vectors) @ vectors[i])) >= self.redundancy_threshold:
+                    continue
+                kept_vectors.append(vectors[i])
+                selected.append(sentences[i])
+            if selected:
+                kept_sentences += len(selected)
+                compressed.append(Document(
+                    id=doc.id,
+                    page_content=" ".join(selected),
+                    metadata={**doc.metadata, "compressed": True}
+                ))
+
+        compressed_tokens = sum(estimate_tokens(d.page_content) for d in compressed)
+        stats = self._stats(len(docs), len(compressed), len(sentences), kept_sentences, original_tokens, compressed_tokens)
+        return compressed, stats
+
+    @staticmethod
+    def _stats(chunks_in, chunks_out, sentences_in, sentences_out, tokens_in, tokens_out) -> Dict[str, Any]:
+        return {
+            "chunks_in": chunks_in,
+            "chunks_out": chunks_out,
+            "sentences_in": sentences_in,
+            "sentences_out": sentences_out,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "compression_ratio": round(tokens_in / tokens_out, 2) if tokens_out else None
+        }
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Tuple, Union
+
+from langchain_core.embeddings import Embeddings
+
+from src.document_ingestion.docstore import DEFAULT_CACHE_SIZE
+from src.document_ingestion.recovery import index_lock, needs_recovery, recover_index
+from src.document_ingestion.vector_store import DEFAULT_MMAP, PortalFAISS, read_version
+
+
+class IndexCache:
+    """
+    Process-wide LRU of opened session indexes, so repeated and federated queries skip the open.
+    An entry is reopened when the index on disk changes (re-index, merge, compression), in this or
+    another worker process: its version stamp is checked on every get. Stores are opened memory-mapped
+    by default, so workers share one copy of the index in the page cache.
+    """
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[str, bool], Tuple[Any, PortalFAISS]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(index_path: Path) -> Any:
+        version = read_version(index_path)
+        if version is not None:
+            return version
+        # folders saved before manifests
+        stat = (index_path / "index.faiss").stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(
+        self,
+        index_path: Union[str, Path],
+        embedding: Embeddings,
+        *,
+        mmap: bool = DEFAULT_MMAP,
+        cache_size: int = DEFAULT_CACHE_SIZE
+    ) -> PortalFAISS:
+        path = Path(index_path).resolve()
+        key = (str(path), mmap)
+        stamp = self._stamp(path) if (path / "index.faiss").exists() else None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._data.move_to_end(key)
+                return entry[1]
+
+        if needs_recovery(path):
+            # a writer crashed mid-save (or is saving right now): wait for the write lock, then repair
+            with index_lock(path):
+                recover_index(path)
+        # opened outside the lock; two racing opens of the same folder are harmless
+        store = PortalFAISS.load_local(
+            str(path), embedding, mmap=mmap, cache_size=cache_size, allow_dangerous_deserialization=True
+        )
+        with self._lock:
+            self._data[key] = (store.version if store.version is not None else self._stamp(path), store)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return store
+
+    def evict(self, index_path: Union[str, Path]) -> None:
+        path = str(Path(index_path).resolve())
+        with self._lock:
+            for key in [k for k in self._data if k[0] == path]:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+INDEX_CACHE = IndexCache()
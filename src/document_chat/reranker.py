@@ -0,0 +1,124 @@
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from logger import GLOBAL_LOGGER as log
+from src.document_ingestion.bm25_index import tokenize
+from src.document_chat.context_compression import SENTENCE_CACHE
+from src.document_ingestion.vector_store import QUERY_VECTORS
+
+# Scoring runs off the request thread, so the request stops waiting once the latency budget is spent.
+# A running scorer cannot be interrupted: one that overruns finishes on this pool and its result is dropped.
+_RERANK_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rerank")
+
+
+class OnnxCrossEncoder:
+    """Small cross-encoder exported to ONNX (model.onnx + tokenizer.json); needs onnxruntime and tokenizers."""
+    def __init__(self, model_dir: str, max_length: int = 512):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @classmethod
+    def load(cls, model_dir: Optional[str]) -> Optional["OnnxCrossEncoder"]:
+        if not model_dir or not os.path.exists(os.path.join(model_dir, "model.onnx")):
+            return None
+        try:
+            return cls(model_dir)
+        except ImportError:
+            log.warning("ONNX cross-encoder configured but onnxruntime/tokenizers not installed", model_dir=model_dir)
+            return None
+
+    def score(self, question: str, texts: Sequence[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch([(question, t) for t in texts])
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.input_names})[0]
+        return np.asarray(logits, dtype=np.float32).reshape(len(texts), -1)[:, 0]
+
+
+class LocalReranker:
+    """
+    Re-orders a wide candidate list and keeps the best few for the prompt.
+    Scores with an ONNX cross-encoder when one is configured, otherwise with
+    lexical overlap + embedding cosine (stored chunk vectors when available, and the question
+    vector the retriever already computed). If scoring fails or misses its latency budget the
+    retrieval order is kept; the budget bounds the wait, not the scorer, which runs to completion.
+    """
+    def __init__(
+        self,
+        embedding: Embeddings,
+        vector_lookup: Optional[Callable[[Sequence[Document]], Optional[np.ndarray]]] = None,
+        lexical_weight: float = 0.3,
+        budget_ms: float = 250,
+        cross_encoder: Optional[OnnxCrossEncoder] = None
+    ):
+        self.embedding = embedding
+        self.vector_lookup = vector_lookup
+        self.lexical_weight = lexical_weight
+        self.budget_ms = budget_ms
+        self.cross_encoder = cross_encoder
+
+    def rerank(self, question: str, docs: Sequence[Document], top_n: int) -> Tuple[List[Document], Dict[str, Any]]:
+        docs = list(docs)
+        start = time.perf_counter()
+        scorer = "cross_encoder" if self.cross_encoder is not None else "lexical_cosine"
+        if len(docs) <= 1:
+            return docs[:top_n], {"scorer": scorer, "candidates": len(docs), "fallback": False, "latency_ms": 0.0}
+
+        # vector searches already embedded the question; BM25-only retrieval did not
+        query = None if self.cross_encoder is not None else QUERY_VECTORS.get(self.embedding, question)
+        future = _RERANK_POOL.submit(self._score, question, docs, query)
+        error = None
+        try:
+            scores = future.result(timeout=self.budget_ms / 1000.0)
+            order = np.argsort(-scores, kind="stable")[:top_n]
+            ranked, fallback = [docs[i] for i in order], False
+        except FutureTimeout:
+            # not cancellable once started: the scorer finishes in the background, its result is dropped
+            future.cancel()
+            ranked, fallback = docs[:top_n], True
+        except Exception as e:
+            log.warning("Rerank scoring failed, retrieval order kept", scorer=scorer, error=str(e))
+            ranked, fallback, error = docs[:top_n], True, str(e)
+        latency = round((time.perf_counter() - start) * 1000, 2)
+        stats = {"scorer": scorer, "candidates": len(docs), "fallback": fallback, "latency_ms": latency}
+        if error is not None:
+            stats["error"] = error
+        return ranked, stats
+
+    def _score(self, question: str, docs: Sequence[Document], query: Optional[Sequence[float]] = None) -> np.ndarray:
+        texts = [d.page_content for d in docs]
+        if self.cross_encoder is not None:
+            return self.cross_encoder.score(question, texts)
+
+        terms = set(tokenize(question))
+        lexical = np.array(
+            [len(terms & set(tokenize(t))) / len(terms) if terms else 0.0 for t in texts], dtype=np.float32
+        )
+        if query is None:
+            query = QUERY_VECTORS.embed(self.embedding, question)
+        query = np.array(query, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        vectors = self.vector_lookup(docs) if self.vector_lookup is not None else None
+        if vectors is None:
+            vectors = SENTENCE_CACHE.embed(self.embedding, texts)
+        else:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+        cosine = vectors @ query
+        return self.lexical_weight * lexical + (1 - self.lexical_weight) * cosine
@@ -1,19 +1,115 @@
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from operator import itemgetter
-from typing import List, Optional
+from typing import Dict, List, Optional
 
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.vectorstores import FAISS
+from langchain_core.retrievers import BaseRetriever
+from langchain.retrievers import EnsembleRetriever
+from langchain_community.vectorstores.utils import DistanceStrategy
+from pydantic import ConfigDict
 
 from utils.model_loader import ModelLoader
 from exception.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from prompt.prompt_library import PROMPT_REGISTRY
-from model.models import PromptType
+from model.models import PromptType, RetrievalOptions
+from utils.token_utils import estimate_tokens, trim_docs_to_budget
+from utils.deadline import Deadline, DeadlineExceeded
+from src.document_ingestion.vector_store import PortalFAISS, mmap_enabled
+from src.document_ingestion.bm25_index import BM25_FILE, BM25Index
+from src.document_ingestion.docstore import ChunkStore
+from src.document_chat.context_compression import SENTENCE_CACHE, ContextCompressor
+from src.document_chat.index_cache import INDEX_CACHE
+from src.document_chat.reranker import LocalReranker, OnnxCrossEncoder
+
+
+class LocalBM25Retriever(BaseRetriever):
+    """Lexical retriever over the BM25 index kept next to a session's FAISS index."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: PortalFAISS
+    index: BM25Index
+    k: int = 5
+    filter: Optional[dict] = None
+    fetch_k: int = 20
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        allowed = self.vector_store.prefilter_ids(self.filter)
+        if self.filter is None or allowed is not None:
+            hits = self.index.search(query, self.k, None if allowed is None else set(allowed.tolist()))
+            return self.vector_store.materialize([i for i, _ in hits])
+        hits = self.index.search(query, max(self.fetch_k, self.k))
+        keep = self.vector_store._post_filter(self.filter)
+        docs = self.vector_store.materialize([i for i, _ in hits])
+        return [d for d in docs if keep(d.metadata)][: self.k]
+
+
+# Session indexes are searched concurrently; FAISS releases the GIL during search
+_FEDERATION_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="federated")
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    Vector retriever over several session indexes: the question is embedded once, every
+    index is searched in parallel and the hits are merged by distance into one top-k.
+    Returned chunks carry the session they came from in metadata["session_id"].
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    stores: Dict[str, PortalFAISS]
+    k: int = 4
+    filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if not self.stores:
+            return []
+        first = next(iter(self.stores.values()))
+        embedding = first._embed_query(query)
+        futures = {
+            session_id: _FEDERATION_POOL.submit(store.similarity_search_with_score_by_vector, embedding, self.k, self.filter)
+            for session_id, store in self.stores.items()
+        }
+        hits = []
+        for session_id, future in futures.items():
+            try:
+                hits.extend((float(score), session_id, doc) for doc, score in future.result())
+            except Exception as e:
+                # one unreadable session should not fail the whole query
+                run_manager.on_text(f"session {session_id} skipped: {e}")
+        higher_is_better = first.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+        hits.sort(key=itemgetter(0), reverse=higher_is_better)
+        return [
+            Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "session_id": session_id})
+            for _, session_id, doc in hits[: self.k]
+        ]
+
+    def vectors_for(self, docs: List[Document]) -> Optional[np.ndarray]:
+        """Stored vectors of merged hits, looked up in the index each one came from."""
+        vectors = []
+        for doc in docs:
+            store = self.stores.get(doc.metadata.get("session_id"))
+            vector = store.vectors_for([doc]) if store is not None else None
+            if vector is None:
+                return None
+            vectors.append(vector)
+        return np.vstack(vectors) if vectors else None
+
+
+@lru_cache(maxsize=2)
+def _cross_encoder(model_dir: Optional[str]) -> Optional[OnnxCrossEncoder]:
+    """ONNX sessions are expensive to open; share one per model dir."""
+    return OnnxCrossEncoder.load(model_dir)
+
 
 class ConversationalRAG:
     def __init__(self, session_id :str, retriever=None):
@@ -25,38 +121,221 @@ class ConversationalRAG:
             self.contextualize_prompt : ChatPromptTemplate = PROMPT_REGISTRY[PromptType.CONTEXTUALIZE_QUESTION.value]
             self.qa_prompt : ChatPromptTemplate = PROMPT_REGISTRY[PromptType.CONTEXT_QA.value]
 
-            if retriever is None:
-                raise ValueError("Retriever cannot be none")
+            # Without a retriever the chain is built by load_retriever_from_faiss()
             self.retriever = retriever
-
-            self._build_lcel_chain()
+            self.chain = None
+            self.rewrite_chain = None
+            self.answer_chain = None
+            self.options : Optional[RetrievalOptions] = None
+            self.compressor : Optional[ContextCompressor] = None
+            self.reranker : Optional[LocalReranker] = None
+            self.last_rerank : Optional[dict] = None
+            self.last_compression : Optional[dict] = None
+            if self.retriever is not None:
+                self._build_lcel_chain()
             self.log.info("ConversationalRAG initialized", session = self.session_id)
 
         except Exception as e:
             self.log.error("Failed to initialize ConversationalRAG", error = str(e))
             raise DocumentPortalException("Initialization error in ConversationalRAG",sys)
 
-    def load_retriever_from_faiss(self, index_path):
-        """Load a FAISS vectorstore from disk and convert to retriever"""
+    def _load_settings(self, options: Optional[RetrievalOptions], mmap: Optional[bool], overrides: dict):
+        """Embedding model, config sections and resolved retrieval options for a load call."""
+        model_loader = ModelLoader()
+        embedding = model_loader.load_embedding()
+        faiss_config = model_loader.config.get("faiss", {})
+        retriever_config = model_loader.config.get("retriever", {}) or {}
+        if mmap is None:
+            mmap = mmap_enabled(faiss_config)
+        INDEX_CACHE.max_size = int(faiss_config.get("index_cache_size", INDEX_CACHE.max_size))
+        self.options = options or RetrievalOptions.from_config(retriever_config, **overrides)
+        return embedding, faiss_config, retriever_config, mmap
+
+    def load_retriever_from_faiss(
+        self,
+        index_path,
+        options: Optional[RetrievalOptions] = None,
+        mmap: Optional[bool] = None,
+        **overrides
+    ):
+        """
+        Load a FAISS vectorstore from disk and convert to retriever.
+        Retrieval settings come from `options`, else config.yaml `retriever` updated with `overrides`:
+        k, search_type ("similarity" | "mmr" | "similarity_score_threshold"), fetch_k, lambda_mult,
+        score_threshold, mode ("vector" | "bm25" | "hybrid"), vector_weight, max_context_tokens,
+        compress, rerank, rerank_candidates, filter (metadata filter, e.g. {"file_name": "a.pdf", "page": {"$lte": 3}}).
+        """
         try:
-            embedding = ModelLoader().load_embedding()
+            embedding, faiss_config, retriever_config, mmap = self._load_settings(options, mmap, overrides)
 
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
             
-            vector_store = FAISS.load_local(folder_path=index_path,embeddings=embedding, allow_dangerous_deserialization=True)
+            # opened once per process (see IndexCache); only the top-k chunks are read from docstore.sqlite
+            vector_store = INDEX_CACHE.get(
+                index_path,
+                embedding,
+                mmap=mmap,
+                cache_size=int(faiss_config.get("chunk_cache_size", 1024))
+            )
 
-            self.retriever = vector_store.as_retriever(search_type ="similarity", search_kwargs ={"k": 5})
-            self.log.info("FAISS retriever loaded successfully", index_path = index_path, session_id = self.session_id)
+            self.retriever = self._build_retriever(vector_store, index_path, retriever_config)
+            self._build_postprocessing(embedding, retriever_config, vector_store.vectors_for)
+            self._build_lcel_chain()
+            self.log.info(
+                "FAISS retriever loaded successfully",
+                index_path = index_path,
+                session_id = self.session_id,
+                mmap = mmap,
+                **self.options.model_dump()
+            )
             
             return self.retriever
         
         except Exception as e:
             self.log.error("Failed to retriever from FAISS ", error = str(e))
             raise DocumentPortalException("Loading error in ConversationalRAG",sys)
+
+    def load_retriever_from_sessions(
+        self,
+        index_paths: Dict[str, str],
+        federation: str = "parallel",
+        shared_index_path: Optional[str] = None,
+        options: Optional[RetrievalOptions] = None,
+        mmap: Optional[bool] = None,
+        **overrides
+    ):
+        """
+        Retrieve across several sessions at once.
+        federation="parallel": search each session index (`index_paths`, session_id -> folder) concurrently
+        and merge the top-k by distance. Vector similarity only; other search types / modes are ignored.
+        federation="shared": search one index the sessions were merged into (FaissManager.merge_sessions)
+        filtered to the requested session ids; all retrieval options apply.
+        """
+        try:
+            embedding, faiss_config, retriever_config, mmap = self._load_settings(options, mmap, overrides)
+            federation_config = retriever_config.get("federation", {}) or {}
+            cache_size = int(faiss_config.get("chunk_cache_size", 1024))
+            session_ids = list(index_paths)
+
+            if federation == "shared":
+                if not shared_index_path or not os.path.isdir(shared_index_path):
+                    raise FileNotFoundError(f"Shared FAISS index not found: {shared_index_path}")
+                vector_store = INDEX_CACHE.get(shared_index_path, embedding, mmap=mmap, cache_size=cache_size)
+                # session_id is pre-filtered; shared_fetch_k only sizes the candidate pool if a filter must be post-filtered
+                session_filter = {"session_id": {"$in": session_ids}}
+                fetch_k = max(self.options.fetch_k, int(federation_config.get("shared_fetch_k", 200)))
+                self.retriever = self._build_retriever(
+                    vector_store, shared_index_path, retriever_config, session_filter=session_filter, fetch_k=fetch_k
+                )
+                vector_lookup = vector_store.vectors_for
+            elif federation == "parallel":
+                if self.options.mode != "vector" or self.options.search_type != "similarity":
+                    self.log.warning("Parallel federation supports vector similarity only",
+                                     mode = self.options.mode, search_type = self.options.search_type)
+                missing = [p for p in index_paths.values() if not os.path.isdir(p)]
+                if missing:
+                    raise FileNotFoundError(f"FAISS index directory not found: {missing}")
+                stores = dict(zip(session_ids, _FEDERATION_POOL.map(
+                    lambda path: INDEX_CACHE.get(path, embedding, mmap=mmap, cache_size=cache_size),
+                    index_paths.values()
+                )))
+                k = max(self.options.k, self.options.rerank_candidates) if self.options.rerank else self.options.k
+                self.retriever = FederatedRetriever(stores=stores, k=k, filter=self.options.filter)
+                vector_lookup = self.retriever.vectors_for
+            else:
+                raise ValueError(f"Unknown federation mode: {federation}")
+
+            self._build_postprocessing(embedding, retriever_config, vector_lookup)
+            self._build_lcel_chain()
+            self.log.info(
+                "Federated retriever loaded successfully",
+                session_ids = session_ids,
+                federation = federation,
+                mmap = mmap,
+                **self.options.model_dump()
+            )
+            return self.retriever
+
+        except Exception as e:
+            self.log.error("Failed to load federated retriever", error = str(e))
+            raise DocumentPortalException("Loading error in ConversationalRAG",sys)
+
+    def _build_postprocessing(self, embedding, retriever_config: dict, vector_lookup) -> None:
+        """Optional rerank and sentence compression stages for the current options."""
+        self.reranker = None
+        if self.options.rerank:
+            rerank_config = retriever_config.get("rerank", {}) or {}
+            self.reranker = LocalReranker(
+                embedding,
+                vector_lookup=vector_lookup,
+                lexical_weight=float(rerank_config.get("lexical_weight", 0.3)),
+                budget_ms=float(rerank_config.get("budget_ms", 250)),
+                cross_encoder=_cross_encoder(rerank_config.get("onnx_model_dir"))
+            )
+        self.compressor = None
+        if self.options.compress:
+            compression_config = retriever_config.get("compression", {}) or {}
+            SENTENCE_CACHE.max_size = int(compression_config.get("cache_size", SENTENCE_CACHE.max_size))
+            self.compressor = ContextCompressor(
+                embedding,
+                similarity_threshold=float(compression_config.get("similarity_threshold", 0.5)),
+                min_sentences_per_chunk=int(compression_config.get("min_sentences_per_chunk", 1)),
+                redundancy_threshold=float(compression_config.get("redundancy_threshold", 0.92))
+            )
+
+    def _build_retriever(
+        self,
+        vector_store: PortalFAISS,
+        index_path: str,
+        retriever_config: dict,
+        session_filter: Optional[dict] = None,
+        fetch_k: Optional[int] = None
+    ):
+        """
+        Vector / BM25 / hybrid retriever for the current options.
+        The metadata filter (options.filter, plus `session_filter` for the shared index) is resolved
+        to vector ids before searching when it only uses indexed fields; otherwise results are post-filtered.
+        """
+        opts = self.options
+        # with rerank on, retrieve a wider candidate list and let the reranker pick the final k
+        k = max(opts.k, opts.rerank_candidates) if opts.rerank else opts.k
+        fetch_k = max(fetch_k or opts.fetch_k, k)
+        filters = [f for f in (session_filter, opts.filter) if f]
+        metadata_filter = None if not filters else filters[0] if len(filters) == 1 else {"$and": filters}
+        search_kwargs = {"k": k}
+        if metadata_filter is not None:
+            search_kwargs.update(filter=metadata_filter, fetch_k=fetch_k)
+        if opts.search_type == "mmr":
+            search_kwargs.update(fetch_k=fetch_k, lambda_mult=opts.lambda_mult)
+        elif opts.search_type == "similarity_score_threshold":
+            search_kwargs.update(score_threshold=opts.score_threshold if opts.score_threshold is not None else 0.0)
+        vector_retriever = vector_store.as_retriever(search_type=opts.search_type, search_kwargs=search_kwargs)
+        if opts.mode == "vector":
+            return vector_retriever
+
+        bm25_config = retriever_config.get("bm25", {}) or {}
+        # the BM25 file of the generation the store was opened at (compaction renames it)
+        bm25_path = vector_store.bm25_path or os.path.join(index_path, BM25_FILE)
+        bm25 = BM25Index(bm25_path, k1=bm25_config.get("k1", 1.5), b=bm25_config.get("b", 0.75))
+        if isinstance(vector_store.docstore, ChunkStore):
+            bm25.backfill(vector_store.docstore.iter_texts())
+        bm25_retriever = LocalBM25Retriever(vector_store=vector_store, index=bm25, k=k, filter=metadata_filter, fetch_k=fetch_k)
+        if opts.mode == "bm25":
+            return bm25_retriever
+
+        fused = EnsembleRetriever(
+            retrievers=[vector_retriever, bm25_retriever],
+            weights=[opts.vector_weight, 1 - opts.vector_weight],
+            c=int((retriever_config.get("hybrid", {}) or {}).get("rrf_c", 60))
+        )
+        # fusion returns the union of both lists; keep the k best
+        return fused | RunnableLambda(lambda docs: docs[:k])
         
     def invoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None)-> str:
         try:
+           if self.chain is None:
+               raise ValueError("Retriever not loaded. Call load_retriever_from_faiss() first")
            chat_history = chat_history or []
            payload = {
                 "input": user_input,
@@ -77,6 +356,37 @@ class ConversationalRAG:
             self.log.error("Failed to invoke LLM", error = str(e))
             raise DocumentPortalException("Invocation error in ConversationalRAG",sys)
 
+    async def ainvoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None, deadline: Optional[Deadline] = None)-> str:
+        """
+        invoke under a request deadline, stage by stage ("rewrite", "retrieve", "answer"):
+        the stage running when time is up is cancelled, provider call included.
+        """
+        deadline = deadline or Deadline()
+        try:
+           if self.chain is None:
+               raise ValueError("Retriever not loaded. Call load_retriever_from_faiss() first")
+           payload = {"input": user_input, "chat_history": chat_history or []}
+           question = await deadline.run("rewrite", self.rewrite_chain.ainvoke(payload))
+           docs = await deadline.run("retrieve", self.retriever.ainvoke(question))
+           context = await deadline.run_sync("context", self._prepare_context, {"question": question, "docs": docs})
+           answer = await deadline.run("answer", self.answer_chain.ainvoke({**payload, "context": context}))
+           if not answer:
+               self.log.warning("No answer generated", user_input=user_input,session=self.session_id)
+               return "No answer generated"
+           self.log.info(
+               "Chain invoked successfully",
+               session_id = self.session_id,
+               user_input = user_input,
+               answer_preview = answer[:150],
+               timings_ms = deadline.timings
+           )
+           return answer
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            self.log.error("Failed to invoke LLM", error = str(e))
+            raise DocumentPortalException("Invocation error in ConversationalRAG",sys)
+
     def _load_llm(self):
         try:
             llm = ModelLoader().load_llm()
@@ -92,6 +402,35 @@ class ConversationalRAG:
     def _format_docs(docs):
         return "\n\n".join(d.page_content for d in docs)
 
+    def _prepare_context(self, inputs: dict) -> str:
+        """Retrieved docs -> (optional) rerank -> (optional) sentence compression -> token budget -> prompt context."""
+        docs = inputs["docs"]
+        if self.reranker is not None:
+            docs, stats = self.reranker.rerank(inputs["question"], docs, self.options.k)
+            self.last_rerank = stats
+            self.log.info("Retrieved candidates reranked", session_id = self.session_id, kept = len(docs), **stats)
+        if self.compressor is not None:
+            docs, stats = self.compressor.compress(inputs["question"], docs)
+            self.last_compression = stats
+            self.log.info("Retrieved context compressed", session_id = self.session_id, **stats)
+        return self._format_docs(self._fit_context(docs))
+
+    def _fit_context(self, docs):
+        """Trim retrieved chunks to the prompt token budget (retriever.max_context_tokens)."""
+        budget = self.options.max_context_tokens if self.options else None
+        if not budget:
+            return docs
+        kept = trim_docs_to_budget(docs, budget)
+        self.log.info(
+            "Retrieved context trimmed to budget",
+            session_id = self.session_id,
+            retrieved = len(docs),
+            kept = len(kept),
+            tokens = sum(estimate_tokens(d.page_content) for d in kept),
+            budget = budget
+        )
+        return kept
+
     def _build_lcel_chain(self):
         try:
             question_rewriter = (
@@ -101,17 +440,22 @@ class ConversationalRAG:
                 |StrOutputParser()
                 )
             
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            retrieve_docs = (
+                question_rewriter
+                | RunnableParallel(question=RunnablePassthrough(), docs=self.retriever)
+                | RunnableLambda(self._prepare_context)
+            )
             
+            # the stages are kept separately for ainvoke, which times each against the request deadline
+            self.rewrite_chain = question_rewriter
+            self.answer_chain = self.qa_prompt | self.llm | StrOutputParser()
             self.chain = (
                 {
                     "context" : retrieve_docs,
                     "input" : itemgetter("input"),
                     "chat_history" : itemgetter("chat_history")
                 }
-                |self.qa_prompt
-                |self.llm
-                |StrOutputParser()
+                |self.answer_chain
             )
             self.log.info("LCEL chain built successfully", session_id = self.session_id)
         except Exception as e:
@@ -1,13 +1,18 @@
+from __future__ import annotations
 import sys
+from typing import TYPE_CHECKING, Dict, List, Optional
 from dotenv import load_dotenv
-import pandas as pd
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import SummaryResponse, PromptType
 from prompt.prompt_library import PROMPT_REGISTRY
 from utils.model_loader import ModelLoader
-from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.json_repair import RepairingJsonOutputParser
+
+if TYPE_CHECKING:
+    import pandas as pd
 class DocumentCompareLM:
     def __init__(self):
         load_dotenv()
@@ -15,8 +20,10 @@ class DocumentCompareLM:
         self.loader = ModelLoader()
         self.llm = self.loader.load_llm()
         self.prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON.value]
-        self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
-        self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
+        self.fixing_parser = OutputFixingParser.from_llm(
+            parser=RepairingJsonOutputParser(pydantic_object=SummaryResponse, record=False), llm=self.llm
+        )
+        self.parser = RepairingJsonOutputParser(pydantic_object=SummaryResponse, fixer=self.fixing_parser, label="comparison")
         self.chain = self.prompt | self.llm | self.parser
 
         self.log.info("DocumentComparatorLM initialized with model and parser.", model=self.llm)
@@ -37,11 +44,30 @@ class DocumentCompareLM:
             self.log.error(f"Error in compare_documents: {e}")
             raise DocumentPortalException("An error occurred while comparing documents", sys)
 
+    async def acompare_document(self, combined_docs: str, deadline: Optional[Deadline] = None) -> pd.DataFrame:
+        """compare_document under a request deadline ("generate" stage), cancelled when time runs out."""
+        deadline = deadline or Deadline()
+        try:
+            inputs = {
+                "combined_docs" : combined_docs,
+                "format_instruction" : self.parser.get_format_instructions()
+            }
+            self.log.info("Starting document comparison", budget_s=deadline.seconds)
+            response = await deadline.run("generate", self.chain.ainvoke(inputs))
+            self.log.info("Document comparison completed", timings_ms=deadline.timings)
+            return self._format_response(response)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            self.log.error(f"Error in compare_documents: {e}")
+            raise DocumentPortalException("An error occurred while comparing documents", sys)
+
     def _format_response(self,response_parsed : List[Dict]) -> pd.DataFrame:
         """
         Format the response from the LLM into a structured format.
         """
         try:
+            import pandas as pd  # only the comparison result needs it; slow to import
             df = pd.DataFrame(response_parsed)
             self.log.info("Response formatted into DataFrame", dataframe = df)
             return df
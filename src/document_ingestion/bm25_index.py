@@ -0,0 +1,133 @@
+from __future__ import annotations
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.document_ingestion.docstore import max_vector_id, renumber_ids, truncate_ids
+
+BM25_FILE = "bm25.sqlite"
+
+# Keeps clause numbers ("4.2.1") and part ids ("AB-1234") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound ids are indexed whole and by their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = re.split(r"[._/-]", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Local inverted index (Okapi BM25) kept in a SQLite file next to the FAISS index.
+    Documents are identified by their FAISS vector id.
+    """
+    def __init__(self, path: Union[str, Path], k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, vector_id INTEGER NOT NULL, tf INTEGER NOT NULL, "
+                "PRIMARY KEY (term, vector_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS postings_vector_id ON postings (vector_id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS doc_len (vector_id INTEGER PRIMARY KEY, length INTEGER NOT NULL)")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM doc_len").fetchone()[0]
+
+    def add(self, items: Iterable[Tuple[int, str]]) -> int:
+        """Index (vector_id, text) pairs; returns the number of documents added."""
+        postings, lengths = [], []
+        for vector_id, text in items:
+            terms = tokenize(text)
+            lengths.append((int(vector_id), len(terms)))
+            postings.extend((term, int(vector_id), tf) for term, tf in Counter(terms).items())
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO postings (term, vector_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.executemany("INSERT OR REPLACE INTO doc_len (vector_id, length) VALUES (?, ?)", lengths)
+            self._conn.commit()
+        return len(lengths)
+
+    def backfill(self, batches: Iterable[Sequence[Tuple[int, str]]]) -> int:
+        """Build the index from existing chunks (folders created before BM25 was maintained)."""
+        if len(self):
+            return 0
+        return sum(self.add(batch) for batch in batches)
+
+    def search(self, query: str, k: int = 5, vector_ids: Optional[Collection[int]] = None) -> List[Tuple[int, float]]:
+        """Top-k (vector_id, score) by BM25 over the query terms, optionally only among `vector_ids`."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, total_len = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM doc_len").fetchone()
+            if not n_docs:
+                return []
+            avg_len = total_len / n_docs
+            scores: Dict[int, float] = defaultdict(float)
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.vector_id, p.tf, d.length FROM postings p JOIN doc_len d ON d.vector_id = p.vector_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for vector_id, tf, length in rows:
+                    if vector_ids is not None and vector_id not in vector_ids:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / (avg_len or 1))
+                    scores[vector_id] += idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+    def renumber(self, live_ids: np.ndarray, journal: Optional[str] = None) -> None:
+        """Follow an index compaction: live_ids[i] becomes vector id i, everything else is dropped."""
+        with self._lock:
+            renumber_ids(self._conn, ("postings", "doc_len"), live_ids, journal)
+            self._conn.commit()
+
+    def max_id(self) -> int:
+        with self._lock:
+            return max_vector_id(self._conn, ("doc_len",))
+
+    def truncate(self, end: int) -> None:
+        """Drop documents with vector id >= end (added by a save that never completed)."""
+        with self._lock:
+            truncate_ids(self._conn, ("postings", "doc_len"), end)
+            self._conn.commit()
+
+    def remove(self, vector_ids: Sequence[int]) -> None:
+        with self._lock:
+            ids = [(int(i),) for i in vector_ids]
+            self._conn.executemany("DELETE FROM postings WHERE vector_id = ?", ids)
+            self._conn.executemany("DELETE FROM doc_len WHERE vector_id = ?", ids)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -3,93 +3,616 @@ import os
 import sys
 import json
 import uuid
-import hashlib
 import shutil
+import threading
+import time
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any, Iterable
+from typing import Optional, List, Dict, Any, Iterable, Callable, Set, Tuple
 
-import fitz
+import numpy as np
 from langchain.schema import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
-from langchain_community.vectorstores import FAISS
 
 
 from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 
-from utils.file_io import _session_id, save_uploaded_files
+from utils.file_io import atomic_write, file_sha256, generate_session_id as _session_id, save_uploaded_files
 from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
+from utils.parse_cache import pdf_text, read_pdf_pages
+from utils.vector_ops import (
+    append_raw_vectors,
+    compress_vectors,
+    index_memory_bytes,
+    measure_recall,
+    min_training_vectors,
+    open_raw_vectors
+)
+from src.document_ingestion.vector_store import PortalFAISS, STORAGE_META_FILE, mmap_enabled, read_index, read_version
+from src.document_ingestion.manifest import generation_path, read_manifest
+from src.document_ingestion.recovery import apply_compaction, begin_compaction, index_lock, needs_recovery, recover_index
+from src.document_ingestion.docstore import ChunkStore
+from src.document_ingestion.bm25_index import BM25Index
+from src.document_ingestion.fingerprints import FINGERPRINTS_FILE, FingerprintIndex, chunk_fingerprint, page_hash
+from src.document_ingestion.text_splitter import get_splitter
+from src.document_ingestion.progress import IngestProgress, ProgressCallback, track_ingest
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+# FAISS_BASE/<name>: small session indexes merged into one, filtered by session_id at query time
+SHARED_INDEX_NAME = "_shared"
+
+DEFAULT_STORAGE = {
+    "mode": "flat",
+    "pq_m": None,
+    "pq_nbits": 8,
+    "rerank": True,
+    "rerank_factor": 4,
+    "recall_k": 10
+}
+
+# chunks per embed_documents call; each batch is one chunks_embedded progress event
+DEFAULT_EMBED_BATCH_SIZE = 64
+
+DEFAULT_COMPACTION = {
+    "tombstone_ratio": 0.2,
+    "background": True
+}
 
 # FAISS Manager (load-or-create)
 class FaissManager:
-    def __init__(self, index_dir:str, model_loader: Optional[ModelLoader]=None):
+    def __init__(self, index_dir:str, model_loader: Optional[ModelLoader]=None, storage: Optional[Dict[str, Any]]=None):
         
+        self.log = CustomLogger().get_Logger(__name__)
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents = True, exist_ok= True)
         
+        # Ingested chunk fingerprints -> vector ids (replaces the ingested_meta.json dict)
+        self.fingerprints = FingerprintIndex(self.index_dir / FINGERPRINTS_FILE)
         self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta : Dict[str, Any] = {"rows": {}}
         
-        if self.meta_path.exists():
-            try:
-                self._meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {"rows": {}}
-            except Exception as e:
-                self._meta = { "rows":{}}
-                
         self.model_loader = model_loader or ModelLoader()
         self.embedding = self.model_loader.load_embedding()
-        self.vector_store : Optional[FAISS] = None
+        self.vector_store : Optional[PortalFAISS] = None
+        self._write_lock = index_lock(self.index_dir)
+        self.compaction : Dict[str, Any] = {**DEFAULT_COMPACTION, **(self.model_loader.config.get("faiss", {}).get("compaction", {}) or {})}
+        self._compaction_thread : Optional[threading.Thread] = None
+        self.mmap : bool = mmap_enabled(self.model_loader.config.get("faiss", {}))
+        self.cache_size : int = int(self.model_loader.config.get("faiss", {}).get("chunk_cache_size", 1024))
+        self.embed_batch_size : int = int(self.model_loader.config.get("faiss", {}).get("embed_batch_size") or DEFAULT_EMBED_BATCH_SIZE)
+        # set by ChatIngestor.build_retriever to report embedding batches and saves
+        self.progress : Optional[IngestProgress] = None
+        
+        # Lexical side index, kept in step with the vectors for hybrid retrieval
+        self.bm25_config : Dict[str, Any] = self.model_loader.config.get("retriever", {}).get("bm25", {}) or {}
+        self.bm25 : Optional[BM25Index] = None
+        self._open_bm25()
         
+        # Storage mode (flat / sq_fp16 / sq_int8 / pq): config.yaml -> faiss.storage, overridable per manager
+        config_storage = self.model_loader.config.get("faiss", {}).get("storage", {}) or {}
+        self.storage : Dict[str, Any] = {**DEFAULT_STORAGE, **config_storage, **(storage or {})}
+        self.storage_path = self.index_dir / STORAGE_META_FILE
+        self.storage_report : Dict[str, Any] = self._read_storage()
+        
+    @contextmanager
+    def locked(self):
+        """
+        Hold the folder's write lock (shared with other worker processes). A store loaded before
+        another worker saved the index is reloaded first, so no write is based on a stale copy.
+        """
+        with self._write_lock:
+            if self.vector_store is not None and self._exists() and read_version(self.index_dir) != self.vector_store.version:
+                self.log.info("FAISS index changed by another worker, reloading", index = str(self.index_dir),
+                              loaded = self.vector_store.version, current = read_version(self.index_dir))
+                self.vector_store = None
+                self.load_or_create()
+            yield
+
     def _exists(self)-> bool:
-        return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
+        # index.pkl: legacy pickled docstore, migrated to docstore.sqlite on first load
+        return (self.index_dir / "index.faiss").exists() and (
+            generation_path(self.index_dir, "docstore").exists() or (self.index_dir / "index.pkl").exists()
+        )
+
+    def _open_bm25(self):
+        """Open the BM25 index of the committed generation (a compaction, here or in another worker, renames it)."""
+        path = generation_path(self.index_dir, "bm25")
+        if self.bm25 is not None:
+            if self.bm25.path == path:
+                return
+            self.bm25.close()
+        self.bm25 = BM25Index(path, k1 = self.bm25_config.get("k1", 1.5), b = self.bm25_config.get("b", 0.75))
     
     @staticmethod
-    def _fingerprint(text: str, md: Dict[str, any])-> str:
-        src = md.get("source") or md.get("file_path")
-        row_id = md.get("row_id")
-        
-        if src is not None:
-            return f"{src}::{'' if row_id is None else row_id}"
-        return hashlib.sha256(text.encode(encoding="utf-8")).hexdigest()
+    def _fingerprint(text: str, md: Dict[str, any])-> bytes:
+        # normalized chunk text scoped by the source document hash, see chunk_fingerprint
+        return chunk_fingerprint(text, md)
     
-    def _save_meta(self):
-        self.meta_path.write_text(json.dumps(self._meta,ensure_ascii=True), encoding="utf-8")
+    def _migrate_legacy_meta(self):
+        """
+        Replace ingested_meta.json (source::row_id keys) with fingerprints rebuilt from the stored chunks.
+        Runs once per folder; no chunk is re-embedded.
+        """
+        store = self.vector_store.docstore
+        if len(self.fingerprints) or not isinstance(store, ChunkStore):
+            return
+        source_hashes : Dict[str, Optional[str]] = {}
+        for batch in store.iter_documents():
+            items = []
+            for vector_id, doc in batch:
+                md = doc.metadata or {}
+                if not md.get("source_hash") and md.get("source"):
+                    # older chunks: hash the source file if it is still on disk
+                    src = md["source"]
+                    if src not in source_hashes:
+                        source_hashes[src] = file_sha256(src) if os.path.isfile(src) else None
+                    md = {**md, "source_hash": source_hashes[src]}
+                items.append((self._fingerprint(doc.page_content, md), vector_id))
+            self.fingerprints.add(items)
+        if self.meta_path.exists():
+            try:
+                legacy = json.loads(self.meta_path.read_text(encoding="utf-8")) or {}
+                for session_id, info in (legacy.get("sessions") or {}).items():
+                    self.fingerprints.record_merge(session_id, info.get("chunks", 0), info.get("merged_at", ""))
+            except Exception as e:
+                self.log.warning("Unreadable ingested_meta.json ignored", error = str(e))
+            self.meta_path.unlink(missing_ok=True)
+        self.log.info("Chunk fingerprints rebuilt", index = str(self.index_dir), fingerprints = len(self.fingerprints))
+    def _read_storage(self)-> Dict[str, Any]:
+        if not self.storage_path.exists():
+            return {}
+        try:
+            return json.loads(self.storage_path.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+    def _save_storage(self):
+        atomic_write(self.storage_path, json.dumps(self.storage_report, ensure_ascii=True).encode("utf-8"))
+    def _storage_outdated(self)-> bool:
+        mode = self.storage["mode"]
+        current = self.storage_report.get("effective_mode", "flat")
+        if mode == current:
+            return False
+        if mode == "flat" or current == "flat":
+            return True
+        # Running on a fallback mode: upgrade once there is enough data to train the requested one
+        return self.vector_store.index.ntotal >= min_training_vectors(mode, self.storage["pq_nbits"])
+    def compress(self)-> Dict[str, Any]:
+        """
+        Rebuild the index in the configured storage mode from the exact vectors.
+        Exact float32 vectors are kept memory-mapped on disk for re-ranking and later re-training.
+        Returns a report with the memory footprint before/after and the measured recall.
+        """
+        if self.vector_store is None:
+            raise RuntimeError("call load_or_create() before compress")
+        vs = self.vector_store
+        mode, nbits = self.storage["mode"], self.storage["pq_nbits"]
+        raw_path = generation_path(self.index_dir, "raw_vectors")
+        
+        if vs.raw_vectors is None:
+            # Index is still exact: its vectors become the raw store
+            raw_path.unlink(missing_ok=True)
+            append_raw_vectors(raw_path, vs.index.reconstruct_n(0, vs.index.ntotal))
+        raw = open_raw_vectors(raw_path, vs.index.d)
+        if raw is None:
+            raise DocumentPortalException("No vectors available to compress", sys)
+        
+        effective = mode
+        if raw.shape[0] < min_training_vectors(mode, nbits):
+            effective = "sq_fp16"
+            self.log.warning("Not enough vectors to train storage mode, using fallback",
+                             mode = mode, fallback = effective, vectors = raw.shape[0],
+                             required = min_training_vectors(mode, nbits))
+        
+        index = compress_vectors(raw, effective, pq_m = self.storage["pq_m"], pq_nbits = nbits)
+        rerank_factor = int(self.storage["rerank_factor"]) if self.storage["rerank"] and effective != "flat" else 0
+        recall_k = int(self.storage["recall_k"])
+        
+        bytes_flat = int(raw.shape[0]) * int(raw.shape[1]) * 4
+        bytes_index = index_memory_bytes(index)
+        self.storage_report = {
+            "mode": mode,
+            "effective_mode": effective,
+            "vectors": int(raw.shape[0]),
+            "dim": int(raw.shape[1]),
+            "bytes_flat": bytes_flat,
+            "bytes_index": bytes_index,
+            "compression_ratio": round(bytes_flat / max(bytes_index, 1), 2),
+            "rerank_factor": rerank_factor,
+            "recall_at_k": round(measure_recall(index, raw, k = recall_k), 4),
+            "recall_at_k_reranked": round(measure_recall(index, raw, k = recall_k, rerank_factor = rerank_factor), 4) if rerank_factor else None,
+            "recall_k": recall_k
+        }
+        
+        vs.replace_index(index)
+        vs.attach_raw_vectors(raw_path, rerank_factor)
+        self._save_storage()
+        self.log.info("FAISS index storage compressed", index = str(self.index_dir), **self.storage_report)
+        return self.storage_report
+    def _backfill_bm25(self):
+        """Build the BM25 index for folders created before it existed."""
+        store = self.vector_store.docstore
+        if not isinstance(store, ChunkStore):
+            return
+        added = self.bm25.backfill(store.iter_texts())
+        if added:
+            self.log.info("BM25 index backfilled", index = str(self.index_dir), documents = added)
     def add_documents(self,docs:List[Document]):
         if self.vector_store is None:
             raise RuntimeError("call load_or_create() before add_document")
-        new_docs : List[Document] = []
-        
-        for d in docs:
-            key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
-                continue
-            self._meta["rows"][key] = True
-            new_docs.append(d)
-            
+        with self.locked():
+            return self._add_prepared(self._prepare_chunks(docs))
+
+    def _prepare_chunks(self, docs: List[Document], indexed: Set[bytes] = frozenset(), released: Set[bytes] = frozenset()):
+        """
+        The new chunks of `docs` with their fingerprints and vectors, for _add_prepared. Embedding (and its
+        progress events, where a job may be cancelled) happens here, before the index is changed. `released`
+        fingerprints are about to be removed and `indexed` ones about to be added by the caller.
+        """
+        positions, keys = self._new_chunks(docs, indexed, released)
+        new_docs = [docs[i] for i in positions]
+        vectors = self._embed([d.page_content for d in new_docs]) if new_docs else None
+        return new_docs, keys, vectors
+
+    def _add_prepared(self, prepared)-> int:
+        new_docs, keys, vectors = prepared
         if new_docs:
-            self.vector_store.add_documents(new_docs)
-            self.vector_store.save_local(str(self.index_dir))
-            self._save_meta()
-            return len(new_docs)
-        
-    def load_or_create(self, texts:Optional[List[str]]=None, metadatas:Optional[List[Dict]]=None):
-        if self._exists():
-            self.vector_store = FAISS.load_local(
+            start = self.vector_store.index.ntotal
+            self._add_vectors([d.page_content for d in new_docs], vectors, [d.metadata for d in new_docs])
+            # vector id per fingerprint, so deletes can release the key; committed with the save below
+            self.fingerprints.add((key, start + j) for j, key in enumerate(keys))
+            if self._storage_outdated():
+                self.compress()
+            self._save()
+        return len(new_docs)
+
+    def _embed(self, texts: List[str])-> np.ndarray:
+        """Embed in batches of faiss.embed_batch_size, reporting each batch's timing to self.progress."""
+        if self.progress is not None:
+            self.progress.embedding_queued(len(texts))
+        vectors : List[List[float]] = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            batch = texts[i : i + self.embed_batch_size]
+            started = time.perf_counter()
+            vectors.extend(self.embedding.embed_documents(batch))
+            if self.progress is not None:
+                self.progress.batch_embedded(len(batch), (time.perf_counter() - started) * 1000)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _save(self, keep_previous: bool = True):
+        started = time.perf_counter()
+        self.vector_store.save_local(str(self.index_dir), keep_previous = keep_previous)
+        if self.progress is not None:
+            self.progress.index_persisted(int(self.vector_store.index.ntotal), (time.perf_counter() - started) * 1000)
+
+    def _new_chunks(self, docs: List[Document], indexed: Set[bytes] = frozenset(), released: Set[bytes] = frozenset()):
+        """Positions in `docs` whose fingerprint is neither ingested nor repeated earlier, with those fingerprints."""
+        keys = [self._fingerprint(d.page_content, d.metadata or {}) for d in docs]
+        seen = (self.fingerprints.existing(keys) - set(released)) | set(indexed)
+        positions, new_keys = [], []
+        for i, key in enumerate(keys):
+            if key in seen:
+                continue
+            seen.add(key)
+            positions.append(i)
+            new_keys.append(key)
+        return positions, new_keys
+
+    def delete_source(self, source: str)-> int:
+        """
+        Remove every chunk of a source document (its source path or file name); returns the chunks removed.
+        Vectors are tombstoned, i.e. skipped by searches, and reclaimed by compact() once the
+        tombstone ratio passes faiss.compaction.tombstone_ratio.
+        """
+        with self.locked():
+            if self.vector_store is None:
+                self.load_or_create()
+            vs = self.vector_store
+            removed = self._tombstone(self._source_ids(source))
+            if not removed:
+                return 0
+            # rewriting index.faiss lets cached readers notice and reload with the new tombstones
+            self._save()
+
+        self.log.info("Source deleted from FAISS index", index = str(self.index_dir), source = source,
+                      removed = removed, tombstones = int(vs.tombstones.size), vectors = int(vs.index.ntotal))
+        self._maybe_compact()
+        return removed
+
+    def _source_ids(self, source: str)-> List[int]:
+        """Vector ids of the chunks of a source document (its source path or file name)."""
+        store = self.vector_store.docstore
+        matched = [s["source"] for s in store.sources() if source in (s["source"], s["file_name"])]
+        return store.select_ids({"source": {"$in": matched}}).tolist() if matched else []
+
+    def _tombstone(self, ids: List[int])-> int:
+        """Tombstone chunks in the docstore, BM25, fingerprints and the vector store; saved by the caller."""
+        if not ids:
+            return 0
+        store = self.vector_store.docstore
+        removed = store.tombstone(ids)
+        self.bm25.remove(ids)
+        self.fingerprints.remove_ids(ids)
+        self.vector_store.set_tombstones(store.tombstoned_ids())
+        return removed
+
+    def update_source(self, source: str, pages: List[Document], split: Callable[[List[Document]], List[Document]])-> Dict[str, int]:
+        """
+        Replace an indexed document (source path or file name) with a new version, page by page.
+        Pages are matched on metadata["page_hash"]: chunks of unchanged pages are kept and re-pointed
+        at the new file (no embedding), only changed pages are split and embedded, and chunks of
+        pages that no longer exist are tombstoned. Chunks indexed without page hashes are all replaced.
+        """
+        with self.locked():
+            if self.vector_store is None:
+                self.load_or_create()
+            store = self.vector_store.docstore
+            old_ids = self._source_ids(source)
+
+            by_page : Dict[str, List[Tuple[int, Document]]] = {}
+            for vector_id, doc in zip(old_ids, store.get_many(old_ids)):
+                if doc.metadata.get("page_hash"):
+                    by_page.setdefault(doc.metadata["page_hash"], []).append((vector_id, doc))
+            kept : List[Tuple[int, Dict[str, Any]]] = []
+            kept_docs : List[Document] = []
+            changed : List[Document] = []
+            for page in pages:
+                reuse = by_page.pop(page.metadata.get("page_hash"), None)
+                if reuse is None:
+                    changed.append(page)
+                    continue
+                for vector_id, doc in reuse:
+                    # chunk-level keys (e.g. start_index) stay, page-level ones follow the new file
+                    md = {k: v for k, v in doc.metadata.items() if k != "vector_id"}
+                    md.update(page.metadata)
+                    kept.append((vector_id, md))
+                    kept_docs.append(doc)
+            kept_ids = {vector_id for vector_id, _ in kept}
+            dropped = [i for i in old_ids if i not in kept_ids]
+            kept_keys = [self._fingerprint(doc.page_content, md) for (_, md), doc in zip(kept, kept_docs)]
+            dropped_keys = {self._fingerprint(doc.page_content, doc.metadata) for doc in store.get_many(dropped)}
+
+            # split and embed the changed pages first: a cancelled job stops here with the index untouched
+            prepared = self._prepare_chunks(split(changed), set(kept_keys), dropped_keys) if changed else ([], [], None)
+            self._tombstone(dropped)
+            if kept:
+                store.update_metadata(kept)
+                self.fingerprints.remove_ids([vector_id for vector_id, _ in kept])
+                self.fingerprints.add(zip(kept_keys, [vector_id for vector_id, _ in kept]))
+            added = self._add_prepared(prepared)
+            if not added:
+                self._save()
+
+        report = {
+            "pages": len(pages),
+            "changed_pages": len(changed),
+            "reused_chunks": len(kept),
+            "removed_chunks": len(dropped),
+            "added_chunks": added
+        }
+        self.log.info("Document updated incrementally", index = str(self.index_dir), source = source, **report)
+        self._maybe_compact()
+        return report
+
+    def replace_source(self, source: str, docs: List[Document])-> Dict[str, int]:
+        """Delete a source's chunks and add the revised ones (already split)."""
+        with self.locked():
+            if self.vector_store is None:
+                self.load_or_create()
+            ids = self._source_ids(source)
+            released = {self._fingerprint(doc.page_content, doc.metadata) for doc in self.vector_store.docstore.get_many(ids)}
+            # embedded before the old chunks go, so a cancelled job leaves the source as it was
+            prepared = self._prepare_chunks(docs, released = released)
+            removed = self._tombstone(ids)
+            added = self._add_prepared(prepared)
+            if removed and not added:
+                self._save()
+        self._maybe_compact()
+        return {"removed": removed, "added": added}
+
+    def _maybe_compact(self)-> None:
+        vs = self.vector_store
+        ratio = vs.tombstones.size / max(vs.index.ntotal, 1)
+        if ratio < float(self.compaction["tombstone_ratio"]):
+            return
+        if not self.compaction["background"]:
+            self.compact()
+            return
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact_in_background, name="faiss-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _compact_in_background(self)-> None:
+        try:
+            self.compact()
+        except Exception as e:
+            self.log.error("Background compaction failed", index = str(self.index_dir), error = str(e))
+
+    def compact(self)-> Dict[str, Any]:
+        """
+        Rebuild the index without tombstoned vectors. Live vectors keep their order and are
+        renumbered 0..n-1 in the index, docstore, BM25 index, raw vector file and fingerprints.
+        The live ids are journaled first, so a compaction interrupted by a crash is resumed on the next load.
+        """
+        with self.locked():
+            if self.vector_store is None:
+                self.load_or_create()
+            vs = self.vector_store
+            store = vs.docstore
+            dead = store.tombstoned_ids()
+            if not dead.size:
+                return {"removed": 0, "vectors": int(vs.index.ntotal)}
+            started = time.perf_counter()
+            before = int(vs.index.ntotal)
+            live = store.live_ids()
+            if read_manifest(self.index_dir) is None:
+                # folder saved before manifests: record its current generation to journal against
+                self._save()
+            # compaction copies the committed files
+            store.commit()
+
+            begin_compaction(self.index_dir, live, before)
+            apply_compaction(self.index_dir, self.fingerprints)
+            # the store is updated in place: retrievers already handed out keep working. The old
+            # docstore is left open for them; its file is removed by the next compaction.
+            vs.docstore = ChunkStore(generation_path(self.index_dir, "docstore"), self.cache_size)
+            vs.index_to_docstore_id = vs.docstore.index_map
+            vs.replace_index(read_index(self.index_dir / "index.faiss"))
+            vs.index_path = self.index_dir / "index.faiss"
+            vs.bm25_path = generation_path(self.index_dir, "bm25")
+            vs.set_tombstones(np.empty(0, dtype=np.int64))
+            vs.version = read_version(self.index_dir)
+            self._open_bm25()
+            self.storage_report = self._read_storage()
+            if vs.raw_vectors is not None:
+                vs.attach_raw_vectors(generation_path(self.index_dir, "raw_vectors"), self.storage_report.get("rerank_factor", 0))
+            if self._storage_outdated():
+                # retrain the compressed codes on what is left
+                self.compress()
+                self._save()
+
+        report = {
+            "removed": before - int(live.size),
+            "vectors": int(live.size),
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+        self.log.info("FAISS index compacted", index = str(self.index_dir), **report)
+        return report
+
+    def sources(self)-> List[Dict[str, Any]]:
+        """Indexed source documents with chunk counts and page ranges (what metadata filters can target)."""
+        if self.vector_store is None:
+            self.load_or_create()
+        store = self.vector_store.docstore
+        return store.sources() if isinstance(store, ChunkStore) else []
+
+    def merge_sessions(self, sessions: Dict[str, str], max_chunks: Optional[int] = None)-> Dict[str, int]:
+        """
+        Copy small session indexes into this (shared) index, tagging every chunk with its session_id
+        so one search can be filtered to any set of sessions. Stored vectors are reused, nothing is re-embedded.
+        Sessions with more than `max_chunks` chunks are skipped (query those in parallel instead).
+        Returns the number of chunks added per session.
+        """
+        if max_chunks is None:
+            federation_config = self.model_loader.config.get("retriever", {}).get("federation", {}) or {}
+            max_chunks = federation_config.get("merge_max_chunks")
+        with self.locked():
+            return self._merge_sessions(sessions, max_chunks)
+
+    def _merge_sessions(self, sessions: Dict[str, str], max_chunks: Optional[int])-> Dict[str, int]:
+        if self.vector_store is None and self._exists():
+            self.load_or_create()
+        added : Dict[str, int] = {}
+
+        for session_id, path in sessions.items():
+            source = PortalFAISS.load_local(
+                str(path), embeddings= self.embedding, mmap= True,
+                cache_size= self.cache_size, allow_dangerous_deserialization= True
+            )
+            try:
+                if max_chunks is not None and source.index.ntotal > max_chunks:
+                    self.log.warning("Session index too large to merge, skipped",
+                                     session_id = session_id, chunks = source.index.ntotal, max_chunks = max_chunks)
+                    added[session_id] = 0
+                    continue
+                count = 0
+                for batch in source.docstore.iter_documents():
+                    # the session is part of the fingerprint: the same chunk may be merged from two sessions
+                    docs = [Document(page_content=d.page_content, metadata={**d.metadata, "session_id": session_id})
+                            for _, d in batch]
+                    positions, keys = self._new_chunks(docs)
+                    if positions:
+                        start = self._add_vectors(
+                            [docs[i].page_content for i in positions],
+                            np.vstack([source._reconstruct(batch[i][0]) for i in positions]),
+                            [docs[i].metadata for i in positions]
+                        )
+                        self.fingerprints.add((key, start + j) for j, key in enumerate(keys))
+                        count += len(positions)
+                added[session_id] = count
+                self.fingerprints.record_merge(session_id, count, datetime.now(timezone.utc).isoformat())
+            finally:
+                source.docstore.close()
+
+        if any(added.values()):
+            if self._storage_outdated():
+                self.compress()
+            self._save()
+        self.log.info("Session indexes merged", index = str(self.index_dir), added = added)
+        return added
+
+    def _add_vectors(self, texts: List[str], vectors: np.ndarray, metadatas: List[Dict])-> int:
+        """Add already-embedded chunks, creating the index on first use; returns the first new vector id."""
+        pairs = list(zip(texts, vectors.tolist()))
+        if self.vector_store is None:
+            self.vector_store = PortalFAISS.from_embeddings(pairs, self.embedding, metadatas = metadatas)
+            start = 0
+        else:
+            start = self.vector_store.index.ntotal
+            self.vector_store.add_embeddings(pairs, metadatas = metadatas)
+        self.bm25.add((start + j, text) for j, text in enumerate(texts))
+        return start
+
+    def _side_stores_ahead(self)-> bool:
+        """BM25 / fingerprint rows past the committed index: left by a save that never completed."""
+        manifest = read_manifest(self.index_dir)
+        return manifest is not None and max(self.bm25.max_id(), self.fingerprints.max_id()) >= manifest["index"]["vectors"]
+
+    def _recover(self):
+        """Roll the folder back (or forward) to its last complete save, under the write lock; see recover_index."""
+        with self._write_lock:
+            report = recover_index(self.index_dir)
+        if report:
+            self.storage_report = self._read_storage()
+        return report
+
+    def _load(self, mmap:Optional[bool]=None):
+        if needs_recovery(self.index_dir):
+            self._recover()
+        # another worker may have compacted the index since this one opened its BM25 file
+        self._open_bm25()
+        if self._side_stores_ahead():
+            self._recover()
+        # Only legacy index.pkl folders written by this service are unpickled (once, then migrated, i.e. written)
+        legacy = not generation_path(self.index_dir, "docstore").exists()
+        with self._write_lock if legacy else nullcontext():
+            self.vector_store = PortalFAISS.load_local(
                 str(self.index_dir),
                 embeddings= self.embedding,
+                mmap= self.mmap if mmap is None else mmap,
+                cache_size= self.cache_size,
                 allow_dangerous_deserialization= True
             )
-            return self.vector_store
+        if self._storage_outdated() or not len(self.bm25) or not len(self.fingerprints):
+            with self._write_lock:
+                if self._storage_outdated():
+                    self.compress()
+                    self._save()
+                self._backfill_bm25()
+                self._migrate_legacy_meta()
+        return self.vector_store
+
+    def load_or_create(self, texts:Optional[List[str]]=None, metadatas:Optional[List[Dict]]=None, mmap:Optional[bool]=None):
+        if self._exists():
+            return self._load(mmap)
         if not texts:
             raise DocumentPortalException("No existing FAISS index and no data to create", sys)
-        self.vs = FAISS.from_texts(texts=texts, embedding=self.embedding, metadatas= metadatas or [])
-        self.vs.save_local(str(self.index_dir))
-        return self.vs
+        with self._write_lock:
+            if self._exists():
+                # created by another worker meanwhile; the caller's chunks are added on top (deduplicated)
+                return self._load(mmap)
+            # fingerprints left from an index folder that no longer has an index
+            self.fingerprints.clear()
+            metadatas = [md or {} for md in metadatas] if metadatas else [{} for _ in texts]
+            positions, keys = self._new_chunks([Document(page_content=t, metadata=md) for t, md in zip(texts, metadatas)])
+            texts = [texts[i] for i in positions]
+            self._add_vectors(texts, self._embed(texts), [metadatas[i] for i in positions])
+            self.fingerprints.add((key, i) for i, key in enumerate(keys))
+            if self._storage_outdated():
+                self.compress()
+            self._save()
+        return self.vector_store
 class DocHandler:
     def __init__(self,data_dir: Optional[str]=None, session_id:Optional[str]=None):
         self.log = CustomLogger().get_Logger(__name__)
@@ -116,14 +639,9 @@ class DocHandler:
             raise DocumentPortalException(f"Failed to save PDF:{str(e)}", e) from e
     def read_pdf(self,pdf_path:str)->str:
         try:
-            chunks=[]
-            with fitz.open(pdf_path) as f:
-                for page_num in range(f.page_count):
-                    page = f.load_page(page_num)
-                    text = page.get_text()
-                    chunks.append(f"\n--Page {page_num+1}--\n{text}")
+            text = pdf_text(pdf_path)
             self.log.info("PDF read successfully.", pdf_path =pdf_path, session_id =self.session_id)
-            return "\n".join(chunks)
+            return text
         except Exception as e:
             self.log.error("Error reading PDF", error= str(e), session_id =self.session_id)
             raise DocumentPortalException(f"Failed to read PDF: {str(e)}", e) from e
@@ -159,15 +677,11 @@ class DocumentComparator:
             raise DocumentPortalException(f"Failed to save PDF files: {str(e)}", e) from e
     def read_pdf(self, pdf_path: str):
         try:
-            with fitz.open(pdf_path) as f:
-                if f.is_encrypted():
-                    raise ValueError(f"PDF is encrypted:{pdf_path.name}")
-                chunks = []
-                for page_num in range(f.page_count):
-                    page = f.load_page(page_num)
-                    text = page.get_text()
-                    if text.strip():
-                        chunks.append(f"\n--Page{page_num+1}--\n{text}")
+            # encrypted PDFs raise ValueError from the parser
+            chunks = []
+            for page in read_pdf_pages(pdf_path):
+                if page["text"].strip():
+                    chunks.append(f"\n--Page{page['metadata']['page']+1}--\n{page['text']}")
                     
             self.log.info("Successfully read PDF", pdf_path = str(pdf_path), session_id = self.session_id)
             return "\n".join(chunks)
@@ -201,11 +715,15 @@ class ChatIngestor:
         temp_base:str ='data',
         faiss_base:str = "faiss_index",
         use_session_dir : bool = True,
-        session_id : Optional[str] = None
+        session_id : Optional[str] = None,
+        on_progress : Optional[ProgressCallback] = None
         ):
         try:
             self.log = CustomLogger().get_Logger(__name__)
             self.model_loader = ModelLoader()
+            # called with every progress event of build_retriever, see IngestProgress
+            self.progress_callbacks : List[ProgressCallback] = [on_progress] if on_progress else []
+            self.progress : Optional[IngestProgress] = None
             
             
             self.temp_base = Path(temp_base); self.temp_base.mkdir(parents=True, exist_ok=True)
@@ -233,36 +751,97 @@ class ChatIngestor:
             d.mkdir(parents=True, exist_ok=True)
             return d
         return base
-    def _split(self, docs: List[Document], chunk_size = 1000, chunk_overlap = 200)-> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size = chunk_size, chunk_overlap = chunk_overlap)
+    def add_progress_callback(self, callback: ProgressCallback):
+        self.progress_callbacks.append(callback)
+
+    def _split(self, docs: List[Document], chunk_size = 1000, chunk_overlap = 200, length_unit: Optional[str] = None)-> List[Document]:
+        # chunk sizes count chars or tokens: config.yaml -> splitter, length_unit overrides per call
+        splitter_config = self.model_loader.config.get("splitter", {}) or {}
+        length_unit = length_unit or splitter_config.get("length_unit", "chars")
+        splitter = get_splitter(chunk_size, chunk_overlap, length_unit, splitter_config.get("encoding"))
         chunks = splitter.split_documents(docs)
-        self.log.info("Document splitted", chunks = len(chunks), chunk_size = chunk_size, overlap = chunk_overlap)
+        self.log.info("Document splitted", chunks = len(chunks), chunk_size = chunk_size, overlap = chunk_overlap, unit = length_unit)
         return chunks
     def build_retriever(self,
         upload_files: Iterable,
         *,
         chunk_size: int = 1000,
         chunk_overlap:int = 200,
-        k: int = 3   
+        k: int = 3,
+        replace_sources: Optional[List[str]] = None,
+        length_unit: Optional[str] = None,
+        on_progress: Optional[ProgressCallback] = None
         ):
+        """
+        Index the uploads; `replace_sources` (source paths or file names) are deleted from the index first.
+        An upload whose file name is already indexed is treated as a new version of it and updated page by page.
+        Progress events go to the ingestor's callbacks and `on_progress`; self.progress keeps the latest run.
+        """
+        progress = track_ingest(IngestProgress(self.session_id, self.progress_callbacks + ([on_progress] if on_progress else [])))
+        self.progress = progress
         try:
-            paths = save_uploaded_files(upload_files, self.temp_dir)
+            started = time.perf_counter()
+            upload_names : Dict[str, str] = {}
+            paths = save_uploaded_files(upload_files, self.temp_dir, names = upload_names)
+            progress.files_saved(len(paths), sum(p.stat().st_size for p in paths), (time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
             docs = load_documents(paths)
+            progress.pages_parsed(len(docs), (time.perf_counter() - started) * 1000)
             if not docs:
                 raise ValueError("No valid documents loaded")
-            chunks = self._split(docs, chunk_size= chunk_size, chunk_overlap= chunk_overlap)
+            # file content hash scopes chunk fingerprints: re-uploads of the same file dedupe despite new names
+            source_hashes = {str(p): file_sha256(p) for p in paths}
+            for d in docs:
+                src = d.metadata.get("source")
+                if src in source_hashes:
+                    d.metadata["source_hash"] = source_hashes[src]
+                    d.metadata["upload_name"] = upload_names.get(src)
+                d.metadata["page_hash"] = page_hash(d.page_content)
+
+            def split(pages: List[Document])-> List[Document]:
+                started = time.perf_counter()
+                chunks = self._split(pages, chunk_size= chunk_size, chunk_overlap= chunk_overlap, length_unit= length_unit)
+                progress.chunks_split(len(chunks), (time.perf_counter() - started) * 1000)
+                return chunks
+
             fm = FaissManager(self.faiss_dir,self.model_loader)
-            
-            text = [c.page_content for c in chunks]
-            metadata = [c.metadata for c in chunks]
-            try:
-                vs = fm.load_or_create(texts = text, metadatas = metadata)
-            except Exception:
-                vs = fm.load_or_create(texts = text, metadatas = metadata)
-            added = fm.add_documents(chunks)
-            self.log.info("FAISS index updated", added = added, index = str(self.faiss_dir))
+            fm.progress = progress
+
+            # one writer per session index, also across worker processes
+            with fm.locked():
+                updated : Dict[str, Dict[str, int]] = {}
+                removed = 0
+                if fm._exists():
+                    fm.load_or_create()
+                    # replacements go first: an upload under a replaced name is then indexed as new, not updated and deleted
+                    removed = sum(fm.delete_source(source) for source in replace_sources or [])
+                    indexed = {s["file_name"] for s in fm.sources()}
+                    by_name : Dict[str, List[Document]] = {}
+                    for d in docs:
+                        if d.metadata.get("upload_name") in indexed:
+                            by_name.setdefault(d.metadata["upload_name"], []).append(d)
+                    for name, pages in by_name.items():
+                        updated[name] = fm.update_source(name, pages, split)
+                    docs = [d for d in docs if d.metadata.get("upload_name") not in updated]
+
+                added = 0
+                if docs:
+                    chunks = split(docs)
+                    text = [c.page_content for c in chunks]
+                    metadata = [c.metadata for c in chunks]
+                    if fm.vector_store is None:
+                        # new index: creating it embeds and fingerprints every chunk, nothing is left to add
+                        fm.load_or_create(texts = text, metadatas = metadata)
+                        added = int(fm.vector_store.index.ntotal)
+                    else:
+                        added = fm.add_documents(chunks)
+            vs = fm.vector_store
+            progress.done(added = added, removed = removed, updated = updated)
+            self.log.info("FAISS index updated", added = added, removed = removed, updated = updated, index = str(self.faiss_dir),
+                          progress = progress.snapshot(events = False))
             return vs.as_retriever(search_type = 'similarity', search_kwargs = {"k":k})
-        
+
         except Exception as e:
+            progress.failed(str(e))
             self.log.error("Error building retriever", error = str(e))
             raise DocumentPortalException(f" Failed to build retriever: {str(e)}", e) from e
\ No newline at end of file
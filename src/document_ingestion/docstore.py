@@ -0,0 +1,430 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+
+DOCSTORE_FILE = "docstore.sqlite"
+DEFAULT_CACHE_SIZE = 1024
+
+# Metadata kept in the chunk_meta table, so filters on them resolve to vector ids before the search
+FILTER_FIELDS = ("source", "file_name", "doc_type", "page", "session_id")
+_COMPARISONS = {"$eq": "=", "$neq": "<>", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def filter_fields(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Filterable fields of a chunk; file_name (uploaded name if known) and doc_type are derived from the source path."""
+    source = metadata.get("source") or metadata.get("file_path")
+    return {
+        "source": source,
+        "file_name": metadata.get("upload_name") or (os.path.basename(str(source)) if source else None),
+        "doc_type": (os.path.splitext(str(source))[1].lstrip(".").lower() or None) if source else None,
+        "page": metadata.get("page"),
+        "session_id": metadata.get("session_id"),
+    }
+
+
+_LOGICAL_OPS = ("$and", "$or", "$not")
+
+
+def normalize_filter(filter: Any) -> Any:
+    """
+    The same filter with logical operators ($and/$or/$not) never sharing a dict with field conditions:
+    siblings are ANDed, e.g. {"source": "a.pdf", "$or": [...]} -> {"$and": [{"$or": [...]}, {"source": "a.pdf"}]}.
+    LangChain's filter function would otherwise ignore the field conditions next to an operator.
+    """
+    if not isinstance(filter, dict):
+        return filter
+    clauses = []
+    for op in _LOGICAL_OPS:
+        if op in filter:
+            value = filter[op]
+            clauses.append({op: normalize_filter(value) if op == "$not" else [normalize_filter(f) for f in value]})
+    if not clauses:
+        return filter
+    fields = {field: condition for field, condition in filter.items() if field not in _LOGICAL_OPS}
+    if fields:
+        clauses.append(fields)
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def compile_filter(filter: Dict[str, Any]) -> Optional[Tuple[str, list]]:
+    """
+    Translate a metadata filter (LangChain FAISS syntax: field values, $eq/$neq/$gt/$gte/$lt/$lte/$in/$nin,
+    $and/$or/$not) into a SQL condition on chunk_meta. None if it uses fields outside FILTER_FIELDS.
+    Conditions in one dict are ANDed, including field conditions next to a logical operator.
+    """
+    if not isinstance(filter, dict) or not filter:
+        return None
+    clauses, params = [], []
+    for op in ("$and", "$or"):
+        if op in filter:
+            parts = [compile_filter(f) for f in filter[op]]
+            if not parts or any(p is None for p in parts):
+                return None
+            joiner = " AND " if op == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            params.extend(v for _, part_params in parts for v in part_params)
+    if "$not" in filter:
+        inner = compile_filter(filter["$not"])
+        if inner is None:
+            return None
+        clauses.append(f"NOT {inner[0]}")
+        params.extend(inner[1])
+
+    for field, condition in filter.items():
+        if field in _LOGICAL_OPS:
+            continue
+        if field not in FILTER_FIELDS:
+            return None
+        if isinstance(condition, list):
+            condition = {"$in": condition}
+        elif not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if op == "$in" else "1")
+                    continue
+                marks = ",".join("?" * len(values))
+                clauses.append(
+                    f"{field} IN ({marks})" if op == "$in" else f"({field} IS NULL OR {field} NOT IN ({marks}))"
+                )
+                params.extend(values)
+            elif op in _COMPARISONS:
+                clauses.append(f"({field} IS NULL OR {field} <> ?)" if op == "$neq" else f"{field} {_COMPARISONS[op]} ?")
+                params.append(value)
+            else:
+                return None
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+def renumber_ids(conn: sqlite3.Connection, tables: Sequence[str], live_ids: np.ndarray, journal: Optional[str] = None) -> bool:
+    """
+    Map vector_id live_ids[i] -> i in each table (via negative ids, so the unique keys never collide).
+    With `journal` (a compaction id) it is applied at most once, recorded in the same transaction,
+    so resuming an interrupted compaction skips stores it already renumbered. Returns whether it ran.
+    """
+    if journal is not None:
+        conn.execute("CREATE TABLE IF NOT EXISTS renumbered (journal TEXT PRIMARY KEY)")
+        if conn.execute("SELECT 1 FROM renumbered WHERE journal = ?", (journal,)).fetchone():
+            return False
+        conn.execute("INSERT INTO renumbered (journal) VALUES (?)", (journal,))
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+    conn.execute("DELETE FROM remap")
+    conn.executemany("INSERT INTO remap (old, new) VALUES (?, ?)", [(int(old), new) for new, old in enumerate(live_ids)])
+    for table in tables:
+        conn.execute(f"DELETE FROM {table} WHERE vector_id NOT IN (SELECT old FROM remap)")
+        conn.execute(f"UPDATE {table} SET vector_id = -1 - (SELECT new FROM remap WHERE old = {table}.vector_id)")
+        conn.execute(f"UPDATE {table} SET vector_id = -1 - vector_id")
+    conn.execute("DELETE FROM remap")
+    return True
+
+
+def max_vector_id(conn: sqlite3.Connection, tables: Sequence[str]) -> int:
+    """Highest vector id in any of `tables`, -1 when they are empty."""
+    values = [conn.execute(f"SELECT MAX(vector_id) FROM {table}").fetchone()[0] for table in tables]
+    return max([-1] + [v for v in values if v is not None])
+
+
+def truncate_ids(conn: sqlite3.Connection, tables: Sequence[str], end: int) -> int:
+    """Delete rows with vector_id >= end from each table; returns the rows deleted."""
+    before = conn.total_changes
+    for table in tables:
+        conn.execute(f"DELETE FROM {table} WHERE vector_id >= ?", (int(end),))
+    return conn.total_changes - before
+
+
+def copy_database(source: Union[str, Path], target: Union[str, Path]) -> None:
+    """Consistent copy of a SQLite file (committed WAL content included) through the backup API."""
+    src = sqlite3.connect(str(source))
+    dst = sqlite3.connect(str(target))
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class ChunkStore(Docstore):
+    """
+    On-disk chunk store keyed by FAISS vector id, persisted in a SQLite file next to the index.
+    Nothing is deserialized on open; search hits are fetched in one batch and kept in an LRU cache.
+    Chunks are added with add_chunks() (by vector id), so it is not an AddableMixin: LangChain paths
+    that add by docstore id only (e.g. FAISS.merge_from) refuse it instead of misnumbering chunks.
+    """
+    def __init__(self, path: Union[str, Path], cache_size: int = DEFAULT_CACHE_SIZE):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, Document]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "vector_id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, "
+                "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_meta ("
+                "vector_id INTEGER PRIMARY KEY, source TEXT, file_name TEXT, doc_type TEXT, page, session_id TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_meta_source ON chunk_meta (source, page)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_meta_file_name ON chunk_meta (file_name, page)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_meta_session_id ON chunk_meta (session_id)")
+            # deleted vectors still in index.faiss until the next compaction; excluded at query time
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (vector_id INTEGER PRIMARY KEY)")
+            self._migrate_docs_table()
+            self._backfill_chunk_meta()
+            self._conn.commit()
+        self.index_map = ChunkIndexMap(self)
+
+    def _migrate_docs_table(self) -> None:
+        """Fold the earlier docs + index_map layout into the vector-id keyed chunks table."""
+        tables = {r[0] for r in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not {"docs", "index_map"} <= tables:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chunks (vector_id, doc_id, page_content, metadata) "
+            "SELECT m.position, d.id, d.page_content, d.metadata FROM index_map m JOIN docs d ON d.id = m.doc_id"
+        )
+        self._conn.execute("DROP TABLE docs")
+        self._conn.execute("DROP TABLE index_map")
+
+    def _backfill_chunk_meta(self) -> None:
+        """Index metadata of chunks written before chunk_meta existed."""
+        rows = self._conn.execute(
+            "SELECT c.vector_id, c.metadata FROM chunks c LEFT JOIN chunk_meta m ON m.vector_id = c.vector_id "
+            "WHERE m.vector_id IS NULL"
+        ).fetchall()
+        self._insert_meta([(vid, json.loads(md)) for vid, md in rows])
+
+    def _insert_meta(self, rows: Sequence[tuple]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunk_meta (vector_id, source, file_name, doc_type, page, session_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(vid, *filter_fields(md or {}).values()) for vid, md in rows],
+        )
+
+    @classmethod
+    def from_store(
+        cls,
+        path: Union[str, Path],
+        store: Docstore,
+        index_to_docstore_id: Mapping[int, str],
+        cache_size: int = DEFAULT_CACHE_SIZE
+    ) -> "ChunkStore":
+        """Copy any docstore (e.g. a freshly built InMemoryDocstore) into a chunk store file."""
+        if isinstance(store, ChunkStore):
+            store.commit()
+        rows = []
+        for position, _id in sorted(index_to_docstore_id.items()):
+            doc = store.search(_id)
+            if isinstance(doc, Document):
+                rows.append((int(position), _id, doc))
+        target = cls(path, cache_size)
+        with target._lock:
+            target._conn.execute("DELETE FROM chunks")
+            target._conn.execute("DELETE FROM chunk_meta")
+            target._insert(rows)
+            target._conn.commit()
+        return target
+
+    def _insert(self, rows: Sequence[tuple]) -> None:
+        self._conn.executemany(
+            "INSERT INTO chunks (vector_id, doc_id, page_content, metadata) VALUES (?, ?, ?, ?)",
+            [(vid, _id, doc.page_content, json.dumps(doc.metadata or {}, default=str)) for vid, _id, doc in rows],
+        )
+        self._insert_meta([(vid, doc.metadata) for vid, _, doc in rows])
+
+    def _remember(self, vector_id: int, doc: Document) -> None:
+        self._cache[vector_id] = doc
+        self._cache.move_to_end(vector_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def add_chunks(self, start: int, docs: Sequence[Document]) -> None:
+        """Store documents for consecutive vector ids starting at `start`."""
+        with self._lock:
+            try:
+                self._insert([(start + j, doc.id, doc) for j, doc in enumerate(docs)])
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Tried to add chunks that already exist: {e}") from e
+
+    def get_many(self, vector_ids: Sequence[int]) -> List[Optional[Document]]:
+        """Materialize only the given vector ids (one query for cache misses), in the order given."""
+        found: Dict[int, Document] = {}
+        with self._lock:
+            missing = []
+            for vid in vector_ids:
+                if vid in self._cache:
+                    self._cache.move_to_end(vid)
+                    found[vid] = self._cache[vid]
+                else:
+                    missing.append(int(vid))
+            if missing:
+                marks = ",".join("?" * len(missing))
+                for vid, _id, content, md in self._conn.execute(
+                    f"SELECT vector_id, doc_id, page_content, metadata FROM chunks WHERE vector_id IN ({marks})", missing
+                ):
+                    doc = Document(id=_id, page_content=content, metadata={**json.loads(md), "vector_id": vid})
+                    found[vid] = doc
+                    self._remember(vid, doc)
+        return [found.get(int(vid)) for vid in vector_ids]
+
+    def _iter_rows(self, columns: str, batch_size: int) -> Iterator[List[tuple]]:
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT vector_id, {columns} FROM chunks WHERE vector_id > ? ORDER BY vector_id LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = rows[-1][0]
+
+    def select_ids(self, filter: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Vector ids matching a metadata filter via the chunk_meta index, or None if it cannot be resolved there."""
+        compiled = compile_filter(filter)
+        if compiled is None:
+            return None
+        where, params = compiled
+        with self._lock:
+            rows = self._conn.execute(f"SELECT vector_id FROM chunk_meta WHERE {where}", params).fetchall()
+        return np.array([r[0] for r in rows], dtype=np.int64)
+
+    def sources(self) -> List[Dict[str, Any]]:
+        """Per source document: chunk count and page range."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, file_name, doc_type, COUNT(*), MIN(page), MAX(page) FROM chunk_meta "
+                "GROUP BY source ORDER BY source"
+            ).fetchall()
+        keys = ("source", "file_name", "doc_type", "chunks", "first_page", "last_page")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def update_metadata(self, items: Sequence[Tuple[int, Dict[str, Any]]]) -> None:
+        """Rewrite the metadata of stored chunks (e.g. re-pointing unchanged pages at a new file version)."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE vector_id = ?",
+                [(json.dumps(md, default=str), int(vid)) for vid, md in items],
+            )
+            self._insert_meta([(int(vid), md) for vid, md in items])
+            self._conn.commit()
+            for vid, _ in items:
+                self._cache.pop(int(vid), None)
+
+    def tombstone(self, vector_ids: Sequence[int]) -> int:
+        """Drop chunks by vector id and remember the ids so searches skip them; returns how many were live."""
+        ids = [(int(i),) for i in vector_ids]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("DELETE FROM chunks WHERE vector_id = ?", ids)
+            removed = self._conn.total_changes - before
+            self._conn.executemany("DELETE FROM chunk_meta WHERE vector_id = ?", ids)
+            self._conn.executemany("INSERT OR IGNORE INTO tombstones (vector_id) VALUES (?)", ids)
+            self._conn.commit()
+            for (vid,) in ids:
+                self._cache.pop(vid, None)
+        return removed
+
+    def tombstoned_ids(self) -> np.ndarray:
+        with self._lock:
+            rows = self._conn.execute("SELECT vector_id FROM tombstones ORDER BY vector_id").fetchall()
+        return np.array([r[0] for r in rows], dtype=np.int64)
+
+    def live_ids(self) -> np.ndarray:
+        with self._lock:
+            rows = self._conn.execute("SELECT vector_id FROM chunks ORDER BY vector_id").fetchall()
+        return np.array([r[0] for r in rows], dtype=np.int64)
+
+    def renumber(self, live_ids: np.ndarray, journal: Optional[str] = None) -> None:
+        """After compaction: live_ids[i] becomes vector id i, tombstones are forgotten."""
+        with self._lock:
+            if renumber_ids(self._conn, ("chunks", "chunk_meta"), live_ids, journal):
+                self._conn.execute("DELETE FROM tombstones")
+            self._conn.commit()
+            self._cache.clear()
+
+    def max_id(self) -> int:
+        """Highest vector id with a chunk or tombstone (-1 when empty)."""
+        with self._lock:
+            return max_vector_id(self._conn, ("chunks", "tombstones"))
+
+    def truncate(self, end: int) -> int:
+        """Forget vector ids >= end, written by a save that never completed; returns the chunks dropped."""
+        with self._lock:
+            dropped = self._conn.execute("SELECT COUNT(*) FROM chunks WHERE vector_id >= ?", (int(end),)).fetchone()[0]
+            truncate_ids(self._conn, ("chunks", "chunk_meta", "tombstones"), end)
+            self._conn.commit()
+            self._cache.clear()
+        return dropped
+
+    def iter_texts(self, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """Yield batches of (vector_id, page_content) in vector id order, e.g. to rebuild side indexes."""
+        yield from self._iter_rows("page_content", batch_size)
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """Yield batches of (vector_id, Document) in vector id order, e.g. to copy chunks into another index."""
+        for rows in self._iter_rows("doc_id, page_content, metadata", batch_size):
+            yield [(vid, Document(id=_id, page_content=content, metadata=json.loads(md))) for vid, _id, content, md in rows]
+
+    # ---------- Docstore API (id based, used by LangChain helpers) ----------
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM chunk_meta WHERE vector_id IN (SELECT vector_id FROM chunks WHERE doc_id = ?)", [(i,) for i in ids]
+            )
+            self._conn.executemany("DELETE FROM chunks WHERE doc_id = ?", [(i,) for i in ids])
+            self._cache.clear()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute("SELECT page_content, metadata FROM chunks WHERE doc_id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+class ChunkIndexMap(Mapping):
+    """Read-only FAISS position -> docstore id view over the chunks table."""
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __getitem__(self, position: int) -> str:
+        with self._store._lock:
+            row = self._store._conn.execute("SELECT doc_id FROM chunks WHERE vector_id = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        with self._store._lock:
+            rows = self._store._conn.execute("SELECT vector_id FROM chunks ORDER BY vector_id").fetchall()
+        return iter(r[0] for r in rows)
+
+    def __len__(self) -> int:
+        with self._store._lock:
+            return self._store._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
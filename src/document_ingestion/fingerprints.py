@@ -0,0 +1,131 @@
+from __future__ import annotations
+import hashlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from src.document_ingestion.docstore import max_vector_id, renumber_ids, truncate_ids
+
+FINGERPRINTS_FILE = "fingerprints.sqlite"
+FINGERPRINT_BYTES = 16
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC + collapsed whitespace, so re-extracted text with different spacing hashes the same."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def chunk_fingerprint(text: str, metadata: Dict[str, Any]) -> bytes:
+    """
+    128-bit dedupe key of a chunk: normalized text hash scoped by the hash of the source document
+    (and the session, for chunks merged into a shared index). Independent of the upload file name.
+    """
+    h = hashlib.sha256()
+    for scope in (metadata.get("source_hash"), metadata.get("session_id")):
+        h.update(str(scope or "").encode("utf-8") + b"\x00")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.digest()[:FINGERPRINT_BYTES]
+
+
+def page_hash(text: str) -> str:
+    """Hash of a page's normalized text, for page-level change detection between file versions."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[: FINGERPRINT_BYTES * 2]
+
+
+class FingerprintIndex:
+    """
+    Set of ingested chunk fingerprints with the vector id each one was stored under,
+    kept in a SQLite file next to the index (updated row by row, never rewritten in full).
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints (fp BLOB PRIMARY KEY, vector_id INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_vector_id ON fingerprints (vector_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS merged_sessions ("
+                "session_id TEXT PRIMARY KEY, chunks INTEGER NOT NULL, merged_at TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def existing(self, fingerprints: Sequence[bytes], batch_size: int = 500) -> Set[bytes]:
+        """The subset of `fingerprints` already ingested."""
+        found: Set[bytes] = set()
+        unique = list(dict.fromkeys(fingerprints))
+        with self._lock:
+            for i in range(0, len(unique), batch_size):
+                batch = unique[i : i + batch_size]
+                marks = ",".join("?" * len(batch))
+                found.update(
+                    r[0] for r in self._conn.execute(f"SELECT fp FROM fingerprints WHERE fp IN ({marks})", batch)
+                )
+        return found
+
+    def add(self, items: Iterable[Tuple[bytes, int]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (fp, vector_id) VALUES (?, ?)",
+                [(fp, int(vid)) for fp, vid in items],
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM fingerprints")
+            self._conn.commit()
+
+    def remove_ids(self, vector_ids: Sequence[int]) -> None:
+        """Release the fingerprints of deleted vectors so the same content can be ingested again."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM fingerprints WHERE vector_id = ?", [(int(i),) for i in vector_ids])
+            self._conn.commit()
+
+    def renumber(self, live_ids: np.ndarray, journal: Optional[str] = None) -> None:
+        with self._lock:
+            renumber_ids(self._conn, ("fingerprints",), live_ids, journal)
+            self._conn.commit()
+
+    def max_id(self) -> int:
+        with self._lock:
+            return max_vector_id(self._conn, ("fingerprints",))
+
+    def truncate(self, end: int) -> None:
+        """Release fingerprints of vector ids >= end (added by a save that never completed)."""
+        with self._lock:
+            truncate_ids(self._conn, ("fingerprints",), end)
+            self._conn.commit()
+
+    def record_merge(self, session_id: str, chunks: int, merged_at: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO merged_sessions (session_id, chunks, merged_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET chunks = chunks + excluded.chunks, merged_at = excluded.merged_at",
+                (session_id, int(chunks), merged_at),
+            )
+            self._conn.commit()
+
+    def merged_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT session_id, chunks, merged_at FROM merged_sessions ORDER BY session_id").fetchall()
+        return [{"session_id": sid, "chunks": chunks, "merged_at": at} for sid, chunks, at in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import faiss
+
+from utils.file_io import atomic_write, file_sha256, fsync_file, replace_durably
+from utils.vector_ops import RAW_VECTORS_FILE
+from src.document_ingestion.bm25_index import BM25_FILE
+from src.document_ingestion.docstore import DOCSTORE_FILE
+
+INDEX_FILE = "index.faiss"
+# Written last by every save: the index generation readers may trust, with checksums
+MANIFEST_FILE = "manifest.json"
+# The generation before the current one (a hard link, so keeping it costs no copy), for rollback
+PREVIOUS_INDEX_FILE = "index.prev.faiss"
+# Side files the index's vector ids refer to, by kind. A compaction writes renumbered copies under
+# new names and the manifest switches to them, so readers never pair old ids with renumbered rows.
+DEFAULT_FILES = {"docstore": DOCSTORE_FILE, "bm25": BM25_FILE, "raw_vectors": RAW_VECTORS_FILE}
+
+
+def file_entry(path: Path, **extra: Any) -> Dict[str, Any]:
+    stat = path.stat()
+    return {"file": path.name, "sha256": file_sha256(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, **extra}
+
+
+def matches(path: Path, entry: Optional[Dict[str, Any]], verify: bool = True) -> bool:
+    """
+    Whether `path` holds the file a manifest entry describes. Same size and mtime is trusted;
+    otherwise (e.g. restored by copy) the checksum decides, unless verify=False (stat only).
+    """
+    if not entry:
+        return False
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime_ns == entry["mtime_ns"]:
+        return True
+    return verify and file_sha256(path) == entry["sha256"]
+
+
+def read_manifest(folder: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """The folder's manifest; None for folders saved before manifests existed (or never saved)."""
+    try:
+        manifest = json.loads((Path(folder) / MANIFEST_FILE).read_text(encoding="utf-8"))
+        manifest["generation"] = int(manifest["generation"])
+        if "sha256" not in manifest["index"]:
+            return None
+        return manifest
+    except (FileNotFoundError, KeyError, TypeError, ValueError):
+        return None
+
+
+def generation_files(manifest: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Side file names (docstore, bm25, raw_vectors) of a generation; the fixed names for folders without a manifest."""
+    return {**DEFAULT_FILES, **((manifest or {}).get("files") or {})}
+
+
+def generation_path(folder: Union[str, Path], kind: str) -> Path:
+    """Path of one side file of the folder's committed generation."""
+    folder = Path(folder)
+    return folder / generation_files(read_manifest(folder))[kind]
+
+
+def write_manifest(folder: Union[str, Path], manifest: Dict[str, Any]) -> None:
+    atomic_write(Path(folder) / MANIFEST_FILE, json.dumps(manifest, indent=2).encode("utf-8"))
+
+
+def previous_entry(manifest: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """How the current generation is described once save_index_file has kept it as the previous one."""
+    if manifest is None:
+        return None
+    return {**manifest["index"], "file": PREVIOUS_INDEX_FILE, "generation": int(manifest["generation"])}
+
+
+def commit_generation(
+    folder: Union[str, Path],
+    vectors: int,
+    dim: int,
+    previous: Optional[Dict[str, Any]] = None,
+    files: Optional[Dict[str, str]] = None
+) -> int:
+    """
+    Record the index file now in `folder` as the next generation; returns that generation.
+    The side files stay those of the current generation unless new `files` are given.
+    """
+    folder = Path(folder)
+    current = read_manifest(folder)
+    generation = int((current or {}).get("generation", 0)) + 1
+    write_manifest(folder, {
+        "generation": generation,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+        "pid": os.getpid(),
+        "index": file_entry(folder / INDEX_FILE, vectors=int(vectors), dim=int(dim)),
+        "files": {**generation_files(current), **(files or {})},
+        "previous": previous,
+    })
+    return generation
+
+
+def copy_durably(source: Path, target: Path) -> None:
+    """Put a copy of `source` at `target` atomically: hard link when possible, byte copy otherwise."""
+    if target.exists() and os.path.samefile(source, target):
+        # already linked (e.g. restored from it): renaming a link onto its own file would leave the temp behind
+        return
+    tmp_path = target.with_name(target.name + ".tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    replace_durably(tmp_path, target)
+
+
+def save_index_file(index: faiss.Index, index_path: Path, keep_previous: bool = True) -> None:
+    """
+    Write a FAISS index via temp file + fsync + rename. With keep_previous the file it replaces
+    stays available as index.prev.faiss; otherwise (e.g. ids renumbered) any previous one is dropped.
+    """
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    faiss.write_index(index, str(tmp_path))
+    fsync_file(tmp_path)
+    previous_path = index_path.with_name(PREVIOUS_INDEX_FILE)
+    if keep_previous and index_path.exists():
+        copy_durably(index_path, previous_path)
+    elif not keep_previous:
+        previous_path.unlink(missing_ok=True)
+    # rename keeps any reader that memory-mapped the old file valid
+    replace_durably(tmp_path, index_path)
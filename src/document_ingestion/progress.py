@@ -0,0 +1,132 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+STAGES = ("files_saved", "pages_parsed", "chunks_split", "chunks_embedded", "index_persisted", "done", "failed")
+
+
+class IngestProgress:
+    """
+    Progress of one ChatIngestor.build_retriever run as a stream of events: files_saved, pages_parsed,
+    chunks_split, chunks_embedded (one per embedding batch, with its timing), index_persisted, then
+    done or failed. Every event carries the running totals and goes to each callback as a dict;
+    a callback may raise to abort the ingest (job cancellation does).
+    """
+    def __init__(self, session_id: str, callbacks: Iterable[ProgressCallback] = (), max_events: int = 500):
+        self.session_id = session_id
+        self.callbacks: List[ProgressCallback] = list(callbacks)
+        self.started = time.monotonic()
+        self.stage = "started"
+        self.totals: Dict[str, int] = {"files": 0, "bytes": 0, "pages": 0, "chunks": 0, "to_embed": 0, "embedded": 0}
+        self.stage_ms: Dict[str, float] = {}
+        self.batch_ms: List[float] = []
+        self.events: deque = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def _elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def _rates(self) -> Dict[str, Optional[float]]:
+        embed_s = self.stage_ms.get("embed", 0.0) / 1000
+        elapsed_s = (time.monotonic() - self.started) or 1e-9
+        return {
+            # embedding throughput, and end-to-end throughput including parsing / splitting / saving
+            "embed_chunks_per_s": round(self.totals["embedded"] / embed_s, 1) if embed_s else None,
+            "chunks_per_s": round(self.totals["embedded"] / elapsed_s, 1),
+        }
+
+    def emit(self, stage: str, ms: Optional[float] = None, timing: Optional[str] = None, **details: Any) -> Dict[str, Any]:
+        with self._lock:
+            if ms is not None and timing:
+                self.stage_ms[timing] = round(self.stage_ms.get(timing, 0.0) + ms, 1)
+            self.stage = stage
+            event = {
+                "session_id": self.session_id,
+                "stage": stage,
+                "elapsed_ms": self._elapsed_ms(),
+                **({"ms": round(ms, 1)} if ms is not None else {}),
+                **details,
+                "totals": dict(self.totals),
+                **self._rates(),
+            }
+            self.events.append(event)
+        for callback in self.callbacks:
+            callback(event)
+        return event
+
+    def files_saved(self, files: int, size: int, ms: float) -> None:
+        self.totals["files"] += files
+        self.totals["bytes"] += size
+        self.emit("files_saved", ms, "save", files=files, bytes=size)
+
+    def pages_parsed(self, pages: int, ms: float) -> None:
+        self.totals["pages"] += pages
+        self.emit("pages_parsed", ms, "parse", pages=pages)
+
+    def chunks_split(self, chunks: int, ms: float) -> None:
+        self.totals["chunks"] += chunks
+        self.emit("chunks_split", ms, "split", chunks=chunks)
+
+    def embedding_queued(self, chunks: int) -> None:
+        """New (not yet indexed) chunks about to be embedded; duplicates never get here."""
+        with self._lock:
+            self.totals["to_embed"] += chunks
+
+    def batch_embedded(self, chunks: int, ms: float) -> None:
+        self.totals["embedded"] += chunks
+        self.batch_ms.append(round(ms, 1))
+        self.emit("chunks_embedded", ms, "embed", batch=len(self.batch_ms), batch_size=chunks)
+
+    def index_persisted(self, vectors: int, ms: float) -> None:
+        self.emit("index_persisted", ms, "persist", vectors=vectors)
+
+    def done(self, **report: Any) -> None:
+        self.emit("done", **report)
+
+    def failed(self, error: str) -> None:
+        self.emit("failed", error=error)
+
+    def snapshot(self, events: bool = True) -> Dict[str, Any]:
+        """Current state for polling: stage, totals, time per stage, embedding batch timings and throughput."""
+        with self._lock:
+            batches = sorted(self.batch_ms)
+            report = {
+                "session_id": self.session_id,
+                "stage": self.stage,
+                "elapsed_ms": self._elapsed_ms(),
+                "totals": dict(self.totals),
+                "stage_ms": dict(self.stage_ms),
+                "embedding_batches": {
+                    "count": len(batches),
+                    "p50_ms": batches[len(batches) // 2] if batches else None,
+                    "max_ms": batches[-1] if batches else None,
+                },
+                **self._rates(),
+            }
+            if events:
+                report["events"] = list(self.events)
+        return report
+
+
+# Latest ingests of this process by session id, for GET /chat/index/progress
+_INGESTS: "OrderedDict[str, IngestProgress]" = OrderedDict()
+_INGESTS_LOCK = threading.Lock()
+_INGESTS_KEPT = 64
+
+
+def track_ingest(progress: IngestProgress) -> IngestProgress:
+    with _INGESTS_LOCK:
+        _INGESTS[progress.session_id] = progress
+        _INGESTS.move_to_end(progress.session_id)
+        while len(_INGESTS) > _INGESTS_KEPT:
+            _INGESTS.popitem(last=False)
+    return progress
+
+
+def ingest_progress(session_id: str) -> Optional[IngestProgress]:
+    with _INGESTS_LOCK:
+        return _INGESTS.get(session_id)
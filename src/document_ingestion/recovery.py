@@ -0,0 +1,345 @@
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import faiss
+
+from logger import GLOBAL_LOGGER as log
+from exception.custom_exception import DocumentPortalException
+from utils.file_io import atomic_write, replace_durably
+from utils.file_lock import InterProcessLock
+from utils.vector_ops import append_raw_vectors, compress_vectors, open_raw_vectors
+from src.document_ingestion.bm25_index import BM25Index
+from src.document_ingestion.docstore import ChunkStore, copy_database
+from src.document_ingestion.fingerprints import FINGERPRINTS_FILE, FingerprintIndex
+from src.document_ingestion.manifest import (
+    INDEX_FILE,
+    PREVIOUS_INDEX_FILE,
+    commit_generation,
+    copy_durably,
+    generation_files,
+    matches,
+    previous_entry,
+    read_manifest,
+    save_index_file,
+    write_manifest
+)
+from src.document_ingestion.vector_store import STORAGE_META_FILE
+
+# One writer per index folder across threads and worker processes (adds, deletes, compaction, recovery)
+WRITE_LOCK_FILE = ".write.lock"
+# Written before a compaction starts, removed once its generation is committed and the fingerprints follow it
+COMPACTION_JOURNAL = "compaction.json"
+COMPACTION_LIVE_IDS = "compaction.live.npy"
+# Side files a compaction may leave behind (its own output, or the files two compactions back)
+_SIDE_FILE_PATTERNS = ("docstore*.sqlite", "bm25*.sqlite", "vectors*.f32")
+
+_INDEX_LOCKS: Dict[str, InterProcessLock] = {}
+_INDEX_LOCKS_GUARD = threading.Lock()
+
+
+def index_lock(folder: Union[str, Path]) -> InterProcessLock:
+    path = Path(folder).resolve()
+    with _INDEX_LOCKS_GUARD:
+        if str(path) not in _INDEX_LOCKS:
+            _INDEX_LOCKS[str(path)] = InterProcessLock(path / WRITE_LOCK_FILE)
+        return _INDEX_LOCKS[str(path)]
+
+
+def needs_recovery(folder: Union[str, Path]) -> bool:
+    """
+    Cheap check (file names and stats only) for what an interrupted write leaves behind: temp files,
+    a compaction journal, an index file the manifest doesn't describe, or raw vectors past its end.
+    A write in progress in another process looks the same; recover_index then finds nothing to do.
+    """
+    folder = Path(folder)
+    if (folder / COMPACTION_JOURNAL).exists() or any(folder.glob("*.tmp")):
+        return True
+    manifest = read_manifest(folder)
+    if manifest is None:
+        return False
+    if not matches(folder / INDEX_FILE, manifest["index"], verify=False):
+        return True
+    raw_path = folder / generation_files(manifest)["raw_vectors"]
+    return raw_path.exists() and raw_path.stat().st_size > _raw_bytes(manifest)
+
+
+def _raw_bytes(manifest: Dict[str, Any]) -> int:
+    return int(manifest["index"]["vectors"]) * int(manifest["index"]["dim"]) * 4
+
+
+@contextmanager
+def _side_stores(folder: Path) -> Iterator[Tuple[ChunkStore, BM25Index, FingerprintIndex]]:
+    """The committed generation's docstore and BM25 index, and the fingerprints."""
+    files = generation_files(read_manifest(folder))
+    stores = (ChunkStore(folder / files["docstore"]), BM25Index(folder / files["bm25"]), FingerprintIndex(folder / FINGERPRINTS_FILE))
+    try:
+        yield stores
+    finally:
+        for store in stores:
+            store.close()
+
+
+def _read_index(path: Path) -> Optional[faiss.Index]:
+    try:
+        return faiss.read_index(str(path))
+    except Exception:
+        return None
+
+
+def _reset_storage(folder: Path) -> None:
+    """The index was rebuilt exact (flat): say so, so FaissManager re-compresses it from the raw vectors."""
+    path = folder / STORAGE_META_FILE
+    if not path.exists():
+        return
+    try:
+        report = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        report = {}
+    report.update(effective_mode="flat", rerank_factor=0)
+    atomic_write(path, json.dumps(report, ensure_ascii=True).encode("utf-8"))
+
+
+def _recover_index_file(folder: Path, manifest: Dict[str, Any], store: ChunkStore, compacting: bool, report: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Make index.faiss a complete generation the docstore agrees with; returns the (new) manifest.
+    While `compacting`, an index file the manifest doesn't describe is the compaction's uncommitted output:
+    it is never adopted, the compaction is redone from the generation the manifest describes.
+    """
+    index_path = folder / INDEX_FILE
+    previous_path = folder / PREVIOUS_INDEX_FILE
+    if matches(index_path, manifest["index"]):
+        if index_path.stat().st_mtime_ns != manifest["index"]["mtime_ns"]:
+            # same bytes, new mtime (copied back): refresh the stat so the cheap check trusts it again
+            manifest["index"]["mtime_ns"] = index_path.stat().st_mtime_ns
+            write_manifest(folder, manifest)
+        return manifest
+
+    index = _read_index(index_path)
+    chunks = store.max_id() + 1
+    if not compacting and index is not None and index.ntotal == chunks:
+        # the save got past its docstore commit, only the manifest is missing
+        report["index_file"] = "adopted"
+        previous = previous_entry(manifest)
+        commit_generation(folder, index.ntotal, index.d, previous if previous and matches(previous_path, previous) else None)
+        return read_manifest(folder)
+
+    if matches(previous_path, manifest["index"]):
+        # the new file never got its chunks committed: put back the generation the manifest describes
+        report["index_file"] = "restored"
+        copy_durably(previous_path, index_path)
+        manifest["index"]["mtime_ns"] = index_path.stat().st_mtime_ns
+        write_manifest(folder, manifest)
+        return manifest
+
+    dim = int(manifest["index"]["dim"])
+    raw = open_raw_vectors(folder / generation_files(manifest)["raw_vectors"], dim)
+    if chunks > 0 and raw is not None and raw.shape[0] >= chunks:
+        # the exact vectors of every committed chunk are on disk: rebuild rather than re-embed
+        report["index_file"] = "rebuilt_from_raw_vectors"
+        _reset_storage(folder)
+        save_index_file(compress_vectors(np.asarray(raw[:chunks]), "flat"), index_path, keep_previous=False)
+        commit_generation(folder, chunks, dim)
+        return read_manifest(folder)
+
+    previous = manifest.get("previous")
+    if not compacting and previous and matches(previous_path, previous):
+        # last resort: the generation before; chunks added since are trimmed from the side stores
+        report.update(index_file="rolled_back", rolled_back_from=manifest["generation"], rolled_back_to=previous["generation"])
+        copy_durably(previous_path, index_path)
+        commit_generation(folder, previous["vectors"], previous["dim"])
+        return read_manifest(folder)
+
+    if index is not None:
+        # readable, but no save recorded it (e.g. replaced by hand): trust it, side stores follow it
+        report["index_file"] = "accepted"
+        commit_generation(folder, index.ntotal, index.d)
+        return read_manifest(folder)
+    raise DocumentPortalException(f"FAISS index in {folder} is damaged and no intact generation is left to recover", sys)
+
+
+def begin_compaction(folder: Union[str, Path], live_ids: np.ndarray, before: int) -> Dict[str, Any]:
+    """
+    Journal a compaction (live ids, the generation it starts from and the new side file names)
+    before anything is written; the caller holds index_lock(folder).
+    """
+    folder = Path(folder)
+    manifest = read_manifest(folder)
+    if manifest is None:
+        raise DocumentPortalException(f"Index in {folder} has no manifest; save it before compacting", sys)
+    live_path = folder / COMPACTION_LIVE_IDS
+    tmp_path = live_path.with_name(live_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(live_ids, dtype=np.int64))
+    replace_durably(tmp_path, live_path)
+    journal_id = uuid.uuid4().hex
+    tag = journal_id[:12]
+    journal = {
+        "id": journal_id,
+        "generation": manifest["generation"],
+        "before": int(before),
+        "from": generation_files(manifest),
+        "files": {"docstore": f"docstore.{tag}.sqlite", "bm25": f"bm25.{tag}.sqlite", "raw_vectors": f"vectors.{tag}.f32"},
+    }
+    atomic_write(folder / COMPACTION_JOURNAL, json.dumps(journal).encode("utf-8"))
+    return journal
+
+
+def apply_compaction(folder: Union[str, Path], fingerprints: Optional[FingerprintIndex] = None) -> int:
+    """
+    Carry out (or resume) the journaled compaction. Renumbered copies of the docstore, BM25 index and
+    raw vectors (live vectors become 0..n-1) are written under new names and the index is rebuilt flat
+    from them; committing that generation switches readers to the new files and index at once, so a
+    reader never pairs old vector ids with renumbered rows. Then the fingerprints (writer-only) are
+    renumbered in place and the journal is removed. A crash before the commit redoes the compaction
+    from the untouched old files; after it, only the fingerprint step is repeated (it runs once per
+    journal). `fingerprints` is the caller's open index; by default the folder's is opened.
+    Returns the vectors left.
+    """
+    folder = Path(folder)
+    journal = json.loads((folder / COMPACTION_JOURNAL).read_text(encoding="utf-8"))
+    live = np.load(folder / COMPACTION_LIVE_IDS)
+    if generation_files(read_manifest(folder)) != journal["files"]:
+        _write_compacted(folder, journal, live)
+
+    with nullcontext(fingerprints) if fingerprints is not None else _closing(FingerprintIndex(folder / FINGERPRINTS_FILE)) as fp:
+        fp.renumber(live, journal["id"])
+    _end_compaction(folder)
+    # the replaced files stay for readers that opened them before the commit, until the next compaction
+    _remove_stale_files(folder, keep=(journal["from"], journal["files"]))
+    return int(live.size)
+
+
+def _write_compacted(folder: Path, journal: Dict[str, Any], live: np.ndarray) -> None:
+    old, new = generation_files(read_manifest(folder)), journal["files"]
+    for name in new.values():
+        # left by an attempt interrupted before its commit
+        _remove_file(folder / name)
+    index = faiss.read_index(str(folder / INDEX_FILE))
+    raw = open_raw_vectors(folder / old["raw_vectors"], index.d)
+    if raw is not None and raw.shape[0] >= journal["before"]:
+        vectors = np.array(raw[live], dtype=np.float32)
+    elif index.ntotal == journal["before"]:
+        vectors = index.reconstruct_batch(live) if live.size else np.empty((0, index.d), dtype=np.float32)
+    else:
+        raise DocumentPortalException(f"Cannot compact {folder}: neither raw vectors nor the index hold the old ids", sys)
+
+    if raw is not None:
+        raw_path = folder / new["raw_vectors"]
+        tmp_raw = raw_path.with_name(raw_path.name + ".tmp")
+        tmp_raw.unlink(missing_ok=True)
+        append_raw_vectors(tmp_raw, vectors)
+        replace_durably(tmp_raw, raw_path)
+    del raw
+
+    for kind, store_type in (("docstore", ChunkStore), ("bm25", BM25Index)):
+        copy_database(folder / old[kind], folder / new[kind])
+        store = store_type(folder / new[kind])
+        try:
+            store.renumber(live)
+        finally:
+            store.close()
+    _reset_storage(folder)
+    # the replaced index stays as index.prev.faiss: until the commit below it is still the current generation
+    save_index_file(compress_vectors(vectors, "flat"), folder / INDEX_FILE)
+    commit_generation(folder, live.size, index.d, files=new)
+
+
+@contextmanager
+def _closing(store: FingerprintIndex) -> Iterator[FingerprintIndex]:
+    try:
+        yield store
+    finally:
+        store.close()
+
+
+def _remove_file(path: Path) -> None:
+    """Remove a side file with its SQLite companions; a file still open elsewhere (Windows) is left for later."""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        try:
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def _remove_stale_files(folder: Path, keep: Tuple[Dict[str, str], ...]) -> None:
+    keep_names = {name for files in keep for name in files.values()}
+    for pattern in _SIDE_FILE_PATTERNS:
+        for path in folder.glob(pattern):
+            if path.name not in keep_names:
+                _remove_file(path)
+
+
+def _end_compaction(folder: Path) -> None:
+    (folder / COMPACTION_JOURNAL).unlink(missing_ok=True)
+    (folder / COMPACTION_LIVE_IDS).unlink(missing_ok=True)
+
+
+def recover_index(folder: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Bring an index folder back to its last complete save after a crash; the caller holds index_lock(folder).
+    Nothing that was committed is re-embedded: a fully written index is adopted, an interrupted one
+    is replaced by the generation the manifest describes (or rebuilt from the raw vectors), an
+    interrupted compaction is resumed, and rows written past the recovered index are trimmed from
+    the side stores and raw vector file. Returns what was done, empty when the folder was consistent.
+    """
+    folder = Path(folder)
+    report: Dict[str, Any] = {}
+    temp_files = sorted(folder.glob("*.tmp"))
+    for path in temp_files:
+        path.unlink(missing_ok=True)
+    if temp_files:
+        report["removed_temp_files"] = [p.name for p in temp_files]
+    manifest = read_manifest(folder)
+    if manifest is None:
+        # never saved with a manifest (or saved before they existed): nothing to check against
+        return report
+
+    compacting = (folder / COMPACTION_JOURNAL).exists()
+    with _side_stores(folder) as (store, _, _):
+        manifest = _recover_index_file(folder, manifest, store, compacting, report)
+
+    if compacting:
+        journal = json.loads((folder / COMPACTION_JOURNAL).read_text(encoding="utf-8"))
+        committed = generation_files(manifest) == journal["files"]
+        if not committed:
+            _truncate_raw(folder, manifest)
+        # committed: only the fingerprints are left to renumber; otherwise redone from the old files
+        apply_compaction(folder)
+        manifest = read_manifest(folder)
+        report["compaction"] = "completed" if committed else "resumed"
+
+    vectors = int(manifest["index"]["vectors"])
+    trimmed: Dict[str, int] = {}
+    with _side_stores(folder) as stores:
+        for name, store in zip(("docstore", "bm25", "fingerprints"), stores):
+            if store.max_id() >= vectors:
+                trimmed[name] = store.max_id() - vectors + 1
+                store.truncate(vectors)
+    if trimmed:
+        report["trimmed_ids"] = trimmed
+    if _truncate_raw(folder, manifest):
+        report["raw_vectors_truncated_to"] = vectors
+    if report:
+        log.warning("FAISS index folder recovered after an interrupted write", index=str(folder),
+                    generation=manifest["generation"], vectors=vectors, **report)
+    return report
+
+
+def _truncate_raw(folder: Path, manifest: Dict[str, Any]) -> bool:
+    """Drop raw vectors appended past the committed index (their save never completed)."""
+    raw_path = folder / generation_files(manifest)["raw_vectors"]
+    if not raw_path.exists() or raw_path.stat().st_size <= _raw_bytes(manifest):
+        return False
+    with open(raw_path, "rb+") as f:
+        f.truncate(_raw_bytes(manifest))
+        f.flush()
+        os.fsync(f.fileno())
+    return True
@@ -0,0 +1,230 @@
+from __future__ import annotations
+import re
+import time
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+
+from logger import GLOBAL_LOGGER as log
+from utils.token_utils import CHARS_PER_TOKEN, estimate_tokens
+
+LENGTH_UNITS = ("chars", "tokens")
+
+# Boundaries by level, best cut first: blank line, line break, sentence end, whitespace; then a hard cut.
+# A piece is only broken at the next level when it is larger than a chunk, so most text stays in paragraphs.
+_SEPARATORS = (
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"\n\s*"),
+    re.compile(r"[.!?]\s+"),
+    re.compile(r"\s+"),
+)
+_PARA, _HARD = 0, len(_SEPARATORS)
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
+def length_function(unit: str = "chars", encoding: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Length measure for chunk sizes. Tokens are counted with a tiktoken encoding when one is
+    given and installed (memoized per text piece, words and lines repeat a lot), else estimated.
+    """
+    if unit not in LENGTH_UNITS:
+        raise ValueError(f"length_unit must be one of {LENGTH_UNITS}, got {unit!r}")
+    if unit == "chars":
+        return len
+    if encoding:
+        try:
+            enc = _encoding(encoding)
+            return lru_cache(maxsize=1 << 16)(lambda text: len(enc.encode_ordinary(text)))
+        except ImportError:
+            log.warning("tiktoken not installed, estimating token counts", encoding=encoding)
+    return estimate_tokens
+
+
+class PageStreamSplitter:
+    """
+    Splits a stream of pages into chunks of at most `chunk_size` (chars or tokens) without
+    concatenating pages, so every chunk keeps its page metadata plus start/end character offsets.
+    Each page is scanned once for boundaries; chunks are cut at the best boundary in the back
+    half of the size window (blank line > line > sentence > word), with `chunk_overlap` carried over.
+    """
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        length_unit: str = "chars",
+        encoding: Optional[str] = None
+    ):
+        if chunk_size <= 0 or not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"Need 0 <= chunk_overlap < chunk_size, got {chunk_overlap} / {chunk_size}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_unit = length_unit
+        self.length = length_function(length_unit, encoding)
+        # chars per unit, for hard cuts of text without any whitespace
+        self._hard_width = chunk_size * (CHARS_PER_TOKEN if length_unit == "tokens" else 1)
+
+    def _pieces(self, text: str) -> Tuple[List[int], List[int], List[int]]:
+        """Piece start offsets, lengths and the level of the boundary that ends each piece."""
+        starts: List[int] = []
+        lengths: List[int] = []
+        levels: List[int] = []
+
+        measure = None if self.length is len else self.length
+
+        def emit(start: int, end: int, level: int, depth: int) -> None:
+            size = end - start if measure is None else measure(text[start:end])
+            if size <= self.chunk_size:
+                starts.append(start); lengths.append(size); levels.append(level)
+            elif depth < _HARD:
+                pos = start
+                for m in _SEPARATORS[depth].finditer(text, start, end):
+                    if m.end() >= end:
+                        break
+                    emit(pos, m.end(), depth, depth + 1)
+                    pos = m.end()
+                emit(pos, end, level, depth + 1)
+            else:
+                for a in range(start, end, self._hard_width):
+                    b = min(a + self._hard_width, end)
+                    starts.append(a)
+                    lengths.append(min(b - a if measure is None else measure(text[a:b]), self.chunk_size))
+                    levels.append(level if b == end else _HARD)
+
+        if text:
+            emit(0, len(text), _PARA, 0)
+        return starts, lengths, levels
+
+    def split_text(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) character spans of the chunks of one page, whitespace trimmed."""
+        starts, lengths, levels = self._pieces(text)
+        n = len(starts)
+        cum = [0, *accumulate(lengths)]
+        half = self.chunk_size // 2
+
+        spans: List[Tuple[int, int]] = []
+        i = 0
+        while i < n:
+            # pieces i..j-1 fit the window (every piece fits on its own)
+            j = max(bisect_right(cum, cum[i] + self.chunk_size) - 1, i + 1)
+            end = j
+            if j < n:
+                # cut after the best boundary among windows at least half full, latest on ties
+                lo = max(bisect_left(cum, cum[i] + half), i + 1)
+                if lo < j:
+                    window = levels[lo - 1 : j]
+                    best = min(window)
+                    end = j - window[::-1].index(best)
+            chunk = text[starts[i] : starts[end] if end < n else len(text)]
+            left = len(chunk) - len(chunk.lstrip())
+            right = len(chunk.rstrip())
+            if right > left:
+                spans.append((starts[i] + left, starts[i] + right))
+            if end >= n:
+                break
+            i = max(bisect_left(cum, cum[end] - self.chunk_overlap), i + 1)
+        return spans
+
+    def iter_chunks(self, pages: Iterable[Document]) -> Iterator[Document]:
+        for page in pages:
+            text = page.page_content
+            for start, end in self.split_text(text):
+                yield Document(
+                    page_content=text[start:end],
+                    metadata={**page.metadata, "start_index": start, "end_index": end}
+                )
+
+    def split_documents(self, pages: Iterable[Document]) -> List[Document]:
+        return list(self.iter_chunks(pages))
+
+
+@lru_cache(maxsize=32)
+def get_splitter(
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    length_unit: str = "chars",
+    encoding: Optional[str] = None
+) -> PageStreamSplitter:
+    """Shared splitter per configuration, so the tokenizer and its piece cache survive between uploads."""
+    return PageStreamSplitter(chunk_size, chunk_overlap, length_unit, encoding)
+
+
+def benchmark(
+    pages: Sequence[Document],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    repeat: int = 3,
+    encoding: Optional[str] = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Throughput of the page stream splitter against RecursiveCharacterTextSplitter (best of `repeat`),
+    both with start offsets, sized in chars and in tokens (token sizes are chunk_size / CHARS_PER_TOKEN).
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    token_size, token_overlap = max(1, chunk_size // CHARS_PER_TOKEN), chunk_overlap // CHARS_PER_TOKEN
+    candidates: Dict[str, Callable[[Sequence[Document]], List[Document]]] = {
+        "recursive_chars": RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        ).split_documents,
+        "page_stream_chars": PageStreamSplitter(chunk_size, chunk_overlap).split_documents,
+        "recursive_tokens": RecursiveCharacterTextSplitter(
+            chunk_size=token_size, chunk_overlap=token_overlap, add_start_index=True,
+            length_function=length_function("tokens", encoding)
+        ).split_documents,
+        "page_stream_tokens": PageStreamSplitter(token_size, token_overlap, "tokens", encoding).split_documents,
+    }
+    megabytes = sum(len(p.page_content.encode("utf-8")) for p in pages) / 1e6
+    report: Dict[str, Dict[str, float]] = {}
+    for name, split in candidates.items():
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            chunks = split(pages)
+            best = min(best, time.perf_counter() - started)
+        report[name] = {
+            "seconds": round(best, 4),
+            "mb_per_s": round(megabytes / best, 2) if best else float("inf"),
+            "chunks": len(chunks),
+            "mean_chunk_chars": round(sum(len(c.page_content) for c in chunks) / max(len(chunks), 1), 1),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # python -m src.document_ingestion.text_splitter [files...]  (synthetic pages when no files are given)
+    import argparse
+    import json
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Splitter throughput benchmark")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--encoding", default=None)
+    args = parser.parse_args()
+
+    if args.files:
+        from utils.document_ops import load_documents
+
+        docs = load_documents([Path(f) for f in args.files])
+    else:
+        # PDF-like pages: ~80 char lines, a blank line every few lines
+        line = "The vendor shall deliver the quarterly report to the committee by the 5th day."
+        docs = [
+            Document(
+                page_content="\n".join(line + ("\n" if (p + q) % 7 == 0 else "") for q in range(45)),
+                metadata={"page": p}
+            )
+            for p in range(2000)
+        ]
+    print(json.dumps(benchmark(docs, args.chunk_size, args.chunk_overlap, args.repeat, args.encoding), indent=2))
@@ -0,0 +1,432 @@
+from __future__ import annotations
+import json
+import operator
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import faiss
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy, maximal_marginal_relevance
+
+from logger import GLOBAL_LOGGER as log
+from utils.vector_ops import append_raw_vectors, exact_rerank, open_raw_vectors
+from utils.file_io import fsync_file
+from src.document_ingestion.docstore import DEFAULT_CACHE_SIZE, ChunkStore, filter_fields, normalize_filter
+from src.document_ingestion.manifest import (
+    commit_generation,
+    generation_files,
+    generation_path,
+    matches,
+    previous_entry,
+    read_manifest,
+    save_index_file
+)
+
+STORAGE_META_FILE = "storage.json"
+# config.yaml -> faiss.mmap when unset, for writers (FaissManager), readers and warm-up alike
+DEFAULT_MMAP = True
+# Pre-filtered candidate sets up to this size are scored directly instead of through the index
+PREFILTER_BRUTE_FORCE = 2048
+# A load that raced a save is retried this often (OPEN_RETRY_S apart) before the last attempt is used
+OPEN_ATTEMPTS = 50
+OPEN_RETRY_S = 0.02
+
+def read_index(path: Path, mmap: bool = False) -> faiss.Index:
+    """Read a FAISS index; with mmap the stored codes stay in the page cache, shared across processes."""
+    if mmap:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC)
+    return faiss.read_index(str(path))
+
+
+def mmap_enabled(faiss_config: Optional[Dict[str, Any]]) -> bool:
+    """Whether indexes are opened memory-mapped, from config.yaml -> faiss."""
+    return bool((faiss_config or {}).get("mmap", DEFAULT_MMAP))
+
+
+def read_version(folder: Union[str, Path]) -> Optional[int]:
+    """
+    Generation of the index saved in `folder` (from its manifest, bumped by every save, so other
+    processes know when to reopen it); None when it was saved before manifests existed.
+    """
+    manifest = read_manifest(folder)
+    return manifest["generation"] if manifest else None
+
+
+class QueryVectorCache:
+    """
+    Recent question embeddings by model and text, so the stages of one query (search, federation,
+    rerank) embed the question once, and a repeated question not at all.
+    """
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(embedding: Embeddings, text: str) -> Tuple[str, str]:
+        return str(getattr(embedding, "model", type(embedding).__name__)), text
+
+    def get(self, embedding: Embeddings, text: str) -> Optional[List[float]]:
+        key = self._key(embedding, text)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        return None
+
+    def put(self, embedding: Embeddings, text: str, vector: List[float]) -> List[float]:
+        with self._lock:
+            self._data[self._key(embedding, text)] = vector
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return vector
+
+    def embed(self, embedding: Embeddings, text: str) -> List[float]:
+        vector = self.get(embedding, text)
+        return vector if vector is not None else self.put(embedding, text, embedding.embed_query(text))
+
+
+QUERY_VECTORS = QueryVectorCache()
+
+
+class PortalFAISS(FAISS):
+    """
+    LangChain FAISS store that also works with compressed (SQ / PQ) indexes.
+    When raw float32 vectors are kept on disk, top candidates are re-ranked exactly.
+    """
+    raw_vectors_path: Optional[Path] = None
+    raw_vectors: Optional[np.ndarray] = None
+    rerank_factor: int = 0
+
+    index_path: Optional[Path] = None
+    mmapped: bool = False
+    version: Optional[int] = None
+    # BM25 index of the same generation (for hybrid retrieval)
+    bm25_path: Optional[Path] = None
+
+    tombstones: np.ndarray = np.empty(0, dtype=np.int64)
+    _exclude_params: Optional[faiss.SearchParameters] = None
+    _exclude_selectors: tuple = ()
+
+    @classmethod
+    def load_local(
+        cls,
+        folder_path: str,
+        embeddings,
+        index_name: str = "index",
+        *,
+        mmap: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        allow_dangerous_deserialization: bool = False,
+        **kwargs: Any
+    ) -> "PortalFAISS":
+        """
+        Open an index folder without deserializing the documents.
+        Legacy folders (pickled index.pkl) are loaded once, only if explicitly allowed, and migrated to SQLite.
+        """
+        path = Path(folder_path)
+        index_path = path / f"{index_name}.faiss"
+        opened = cls._open_generation(path, index_path, mmap, cache_size)
+        if opened is not None:
+            manifest, index, docstore = opened
+            vs = cls(embeddings, index, docstore, docstore.index_map, **kwargs)
+            vs.index_path, vs.mmapped = index_path, mmap
+            vs.set_tombstones(docstore.tombstoned_ids())
+            vs.version = manifest["generation"] if manifest else None
+        else:
+            vs = super().load_local(
+                folder_path, embeddings, index_name,
+                allow_dangerous_deserialization = allow_dangerous_deserialization, **kwargs
+            )
+            vs.save_local(folder_path, index_name)
+            manifest = read_manifest(path)
+        files = generation_files(manifest)
+        vs.bm25_path = path / files["bm25"]
+        storage_path = path / STORAGE_META_FILE
+        if storage_path.exists():
+            storage = json.loads(storage_path.read_text(encoding="utf-8"))
+            vs.attach_raw_vectors(path / files["raw_vectors"], storage.get("rerank_factor", 0))
+        return vs
+
+    @staticmethod
+    def _open_generation(path: Path, index_path: Path, mmap: bool, cache_size: int):
+        """
+        (manifest, index, docstore) of one generation, or None for a legacy (pickled) folder.
+        The manifest names the docstore; if a save committed (or was writing index.faiss) while
+        the files were opened, they may not belong together, so they are opened again.
+        """
+        for attempt in range(OPEN_ATTEMPTS):
+            manifest = read_manifest(path)
+            docstore_path = path / generation_files(manifest)["docstore"]
+            if not docstore_path.exists():
+                if manifest is not None and read_version(path) != manifest["generation"]:
+                    continue
+                return None
+            docstore = ChunkStore(docstore_path, cache_size)
+            index = read_index(index_path, mmap)
+            if manifest is None or (
+                matches(index_path, manifest["index"], verify=False) and read_version(path) == manifest["generation"]
+            ):
+                return manifest, index, docstore
+            if attempt == OPEN_ATTEMPTS - 1:
+                # no save finished meanwhile (e.g. a crashed one not recovered yet): use what is there
+                log.warning("FAISS index does not match its manifest", index=str(path), generation=manifest["generation"])
+                return manifest, index, docstore
+            docstore.close()
+            time.sleep(OPEN_RETRY_S)
+
+    def save_local(self, folder_path: str, index_name: str = "index", keep_previous: bool = True) -> None:
+        """
+        Crash-safe save: index.faiss is written via temp file + fsync + rename (the replaced generation
+        is kept as index.prev.faiss unless keep_previous=False), chunks are committed to the generation's
+        docstore (docstore.sqlite until a compaction renames it) instead of a pickle, and manifest.json
+        is written last. A crash at any step leaves the previous manifest describing a complete index,
+        which FaissManager recovers to.
+        """
+        path = Path(folder_path)
+        path.mkdir(parents = True, exist_ok = True)
+        index_path = path / f"{index_name}.faiss"
+        previous = previous_entry(read_manifest(path)) if keep_previous else None
+        save_index_file(self.index, index_path, keep_previous)
+        self.index_path = index_path
+
+        db_path = generation_path(path, "docstore")
+        in_place = isinstance(self.docstore, ChunkStore) and self.docstore.path == db_path
+        if not in_place or self.index_to_docstore_id is not self.docstore.index_map:
+            # fresh InMemoryDocstore, another folder, or positions re-numbered by FAISS.delete
+            cache_size = getattr(self.docstore, "cache_size", DEFAULT_CACHE_SIZE)
+            self.docstore = ChunkStore.from_store(db_path, self.docstore, self.index_to_docstore_id, cache_size)
+        self.index_to_docstore_id = self.docstore.index_map
+        self.docstore.commit()
+        if self.raw_vectors_path is not None and self.raw_vectors_path.exists():
+            fsync_file(self.raw_vectors_path)
+        (path / f"{index_name}.pkl").unlink(missing_ok = True)
+        # the commit point: a reader seeing the new generation also sees the committed chunks
+        self.version = commit_generation(path, self.index.ntotal, self.index.d, previous)
+
+    def _ensure_writable(self) -> None:
+        """Memory-mapped codes are read-only: pull the index onto the heap before mutating it."""
+        if self.mmapped and self.index_path is not None:
+            self.replace_index(read_index(self.index_path, mmap = False))
+
+    def replace_index(self, index: faiss.Index) -> None:
+        """Swap in a rebuilt in-memory index (e.g. after compression)."""
+        self.index = index
+        self.mmapped = False
+        self.set_tombstones(self.tombstones)
+
+    def attach_raw_vectors(self, path: Path, rerank_factor: int = 0) -> None:
+        """Keep exact vectors (memory-mapped) next to the index for re-ranking and re-training."""
+        self.raw_vectors_path = Path(path)
+        self.rerank_factor = int(rerank_factor or 0)
+        self.raw_vectors = open_raw_vectors(self.raw_vectors_path, self.index.d)
+
+    def set_tombstones(self, vector_ids: np.ndarray) -> None:
+        """Vector ids deleted from the docstore but still in the index (until compaction)."""
+        self.tombstones = np.sort(np.asarray(vector_ids, dtype=np.int64))
+        self._exclude_params = None
+        if self.tombstones.size and not isinstance(self.index, faiss.IndexPQ):
+            # the selectors must outlive the params object that points at them
+            self._exclude_selectors = (faiss.IDSelectorBatch(self.tombstones),)
+            self._exclude_selectors += (faiss.IDSelectorNot(self._exclude_selectors[0]),)
+            self._exclude_params = faiss.SearchParameters(sel=self._exclude_selectors[1])
+
+    # ---------- add ----------
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas=metadatas, ids=ids, **kwargs)
+
+    def add_embeddings(self, text_embeddings: Iterable[Tuple[str, List[float]]], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        if not isinstance(self.docstore, ChunkStore):
+            # not persisted yet: regular LangChain bookkeeping, converted on save_local
+            self._ensure_writable()
+            self._append_raw(np.array([e for _, e in text_embeddings], dtype=np.float32))
+            return super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+
+        texts, embeddings = zip(*text_embeddings)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        self._ensure_writable()
+        start = self.index.ntotal
+        self._append_raw(vectors, normalized=True)
+        self.index.add(vectors)
+        self.docstore.add_chunks(start, [Document(id=i, page_content=t, metadata=m) for i, t, m in zip(ids, texts, metadatas)])
+        return list(ids)
+
+    def _append_raw(self, vectors: np.ndarray, normalized: bool = False) -> None:
+        if self.raw_vectors_path is None:
+            return
+        if self._normalize_L2 and not normalized:
+            faiss.normalize_L2(vectors)
+        append_raw_vectors(self.raw_vectors_path, vectors)
+        self.raw_vectors = open_raw_vectors(self.raw_vectors_path, self.index.d)
+
+    # ---------- search ----------
+    def _embed_query(self, text: str) -> List[float]:
+        if not isinstance(self.embedding_function, Embeddings):
+            return super()._embed_query(text)
+        return QUERY_VECTORS.embed(self.embedding_function, text)
+
+    async def _aembed_query(self, text: str) -> List[float]:
+        vector = QUERY_VECTORS.get(self.embedding_function, text)
+        if vector is None:
+            vector = QUERY_VECTORS.put(self.embedding_function, text, await super()._aembed_query(text))
+        return vector
+
+    def _search(self, vector: np.ndarray, n: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index search, over-fetching and re-ranking exactly when raw vectors are attached.
+        With `ids`, only those vector ids are searched (pre-filtered search).
+        """
+        if ids is not None:
+            return self._search_subset(vector, n, ids)
+        # tombstones are excluded by an id selector, or (IndexPQ) by over-fetching and dropping them
+        params = self._exclude_params
+        extra = self.tombstones.size if self.tombstones.size and params is None else 0
+        if self.rerank_factor > 1 and self.raw_vectors is not None:
+            _, candidates = self.index.search(vector, n * self.rerank_factor + extra, params=params)
+            return self._pad(*exact_rerank(vector[0], self._live(candidates[0]), self.raw_vectors, n), n)
+        if extra:
+            scores, indices = self.index.search(vector, n + extra)
+            keep = np.isin(indices[0], self.tombstones, invert=True)
+            return self._pad(scores[0][keep][:n], indices[0][keep][:n], n)
+        return self.index.search(vector, n, params=params)
+
+    def _live(self, ids: np.ndarray) -> np.ndarray:
+        return ids[np.isin(ids, self.tombstones, invert=True)] if self.tombstones.size else ids
+
+    def _search_subset(self, vector: np.ndarray, n: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if ids.size == 0:
+            return self._pad(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), n)
+        # IndexPQ rejects search parameters; small sets are cheaper to score directly anyway
+        if ids.size <= PREFILTER_BRUTE_FORCE or isinstance(self.index, faiss.IndexPQ):
+            if self.raw_vectors is not None:
+                return self._pad(*exact_rerank(vector[0], ids, self.raw_vectors, n), n)
+            candidates = self.index.reconstruct_batch(ids)
+            distances = ((candidates - vector) ** 2).sum(axis=1)
+            order = np.argsort(distances)[:n]
+            return self._pad(distances[order].astype(np.float32), ids[order], n)
+
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+        if self.rerank_factor > 1 and self.raw_vectors is not None:
+            _, candidates = self.index.search(vector, n * self.rerank_factor, params=params)
+            return self._pad(*exact_rerank(vector[0], candidates[0], self.raw_vectors, n), n)
+        return self.index.search(vector, n, params=params)
+
+    @staticmethod
+    def _pad(scores: np.ndarray, indices: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Shape exact results like Index.search output (1 x n, -1 padded)."""
+        pad = n - len(indices)
+        if pad > 0:
+            scores = np.concatenate([scores, np.full(pad, np.inf, dtype=np.float32)])
+            indices = np.concatenate([indices, np.full(pad, -1, dtype=np.int64)])
+        return scores.reshape(1, -1), indices.reshape(1, -1)
+
+    def prefilter_ids(self, filter: Optional[Union[Callable, Dict[str, Any]]]) -> Optional[np.ndarray]:
+        """Vector ids allowed by a metadata filter, from the chunk metadata index; None if it must be post-filtered."""
+        if filter is None or callable(filter) or not isinstance(self.docstore, ChunkStore):
+            return None
+        return self.docstore.select_ids(filter)
+
+    def _post_filter(self, filter: Union[Callable, Dict[str, Any]]) -> Callable[[Dict[str, Any]], bool]:
+        """Filter on materialized metadata; derived fields (file_name, doc_type) match the pre-filter."""
+        filter_func = self._create_filter_func(normalize_filter(filter))
+        return lambda metadata: filter_func({**filter_fields(metadata), **metadata})
+
+    def _reconstruct(self, i: int) -> np.ndarray:
+        if self.raw_vectors is not None and i < self.raw_vectors.shape[0]:
+            return np.asarray(self.raw_vectors[i], dtype=np.float32)
+        return self.index.reconstruct(int(i))
+
+    def vectors_for(self, docs: Sequence[Document]) -> Optional[np.ndarray]:
+        """Stored vectors of materialized documents (via metadata["vector_id"]), or None if unknown."""
+        ids = [d.metadata.get("vector_id") for d in docs]
+        if not ids or any(i is None for i in ids):
+            return None
+        return np.vstack([self._reconstruct(int(i)) for i in ids])
+
+    def materialize(self, positions: List[int]) -> List[Document]:
+        """Fetch documents for index positions; with a ChunkStore only these rows are read (one batch)."""
+        if isinstance(self.docstore, ChunkStore):
+            docs = self.docstore.get_many(positions)
+        else:
+            docs = [self.docstore.search(self.index_to_docstore_id[i]) for i in positions]
+        for i, doc in zip(positions, docs):
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for vector id {i}, got {doc}")
+        return docs
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        allowed = self.prefilter_ids(filter)
+        post_filter = filter is not None and allowed is None
+        scores, indices = self._search(vector, fetch_k if post_filter else k, allowed)
+        hits = [(int(i), scores[0][j]) for j, i in enumerate(indices[0]) if i != -1]
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            hits = [(i, score) for i, score in hits if cmp(score, score_threshold)]
+        if not post_filter:
+            hits = hits[:k]
+
+        docs = list(zip(self.materialize([i for i, _ in hits]), [score for _, score in hits]))
+        if post_filter:
+            keep = self._post_filter(filter)
+            docs = [(doc, score) for doc, score in docs if keep(doc.metadata)]
+        return docs[:k]
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        *,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+    ) -> List[Tuple[Document, float]]:
+        allowed = self.prefilter_ids(filter)
+        post_filter = filter is not None and allowed is None
+        scores, indices = self._search(np.array([embedding], dtype=np.float32), fetch_k * 2 if post_filter else fetch_k, allowed)
+        candidates = [(int(i), scores[0][j]) for j, i in enumerate(indices[0]) if i != -1]
+        if post_filter:
+            keep = self._post_filter(filter)
+            docs = self.materialize([i for i, _ in candidates])
+            candidates = [c for c, doc in zip(candidates, docs) if keep(doc.metadata)]
+        if not candidates:
+            return []
+
+        embeddings = [self._reconstruct(i) for i, _ in candidates]
+        mmr_selected = maximal_marginal_relevance(
+            np.array([embedding], dtype=np.float32), embeddings, k=k, lambda_mult=lambda_mult
+        )
+        selected = [candidates[s] for s in mmr_selected]
+        return list(zip(self.materialize([i for i, _ in selected]), [score for _, score in selected]))
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from langchain_core.embeddings import Embeddings
+
+from utils.config_loader import load_config
+
+
+class HashEmbeddings(Embeddings):
+    """Offline embeddings: bag of hashed words, so texts sharing words are close."""
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        return self._vector(text)
+
+
+@pytest.fixture(autouse=True)
+def _work_dir(tmp_path, monkeypatch):
+    # data/ (jobs, parse cache, sessions) is created relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GOOGLE_API_KEY", os.getenv("GOOGLE_API_KEY") or "test-key")
+    monkeypatch.setenv("GROQ_API_KEY", os.getenv("GROQ_API_KEY") or "test-key")
+
+
+@pytest.fixture
+def embeddings() -> HashEmbeddings:
+    return HashEmbeddings()
+
+
+class FakeModelLoader:
+    """ModelLoader stand-in for FaissManager: the repo config, offline embeddings."""
+    def __init__(self, embedding: Embeddings, **faiss_config):
+        self.config = load_config()
+        self.config["faiss"].update(faiss_config)
+        self.embedding = embedding
+
+    def load_embedding(self) -> Embeddings:
+        return self.embedding
+
+
+@pytest.fixture
+def model_loader(embeddings) -> FakeModelLoader:
+    # foreground compaction keeps tests deterministic
+    return FakeModelLoader(embeddings, compaction={"tombstone_ratio": 0.2, "background": False})
+
+
+@pytest.fixture
+def offline_models(monkeypatch, embeddings) -> HashEmbeddings:
+    """Every ModelLoader in the process embeds offline and answers with a simulated LLM."""
+    from utils.llm_router import SimulatedChatModel
+    from utils.model_loader import ModelLoader
+    monkeypatch.setattr(ModelLoader, "load_embedding", lambda self: embeddings)
+    monkeypatch.setattr(ModelLoader, "load_llm", lambda self: SimulatedChatModel(response="simulated answer", latency_s=0.0))
+    return embeddings
+
+
+@pytest.fixture
+def ingestor(tmp_path, offline_models):
+    """ChatIngestor for session "s1", with uploads and indexes under tmp_path."""
+    from src.document_ingestion.data_ingestion import ChatIngestor
+    return ChatIngestor(temp_base=str(tmp_path / "data"), faiss_base=str(tmp_path / "faiss"), session_id="s1")
+
+
+def make_pdf(pages, name=None):
+    """PDF with one page per text, as an upload (BytesIO named `name`, report.pdf by default)."""
+    import fitz
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_textbox(fitz.Rect(36, 36, 560, 800), text)
+    upload = io.BytesIO(doc.tobytes())
+    upload.name = name or "report.pdf"
+    return upload
+
+
+def build_index(path, model_loader, texts, metadatas=None):
+    """Session index created through FaissManager (docstore, BM25, fingerprints, manifest)."""
+    from src.document_ingestion.data_ingestion import FaissManager
+    fm = FaissManager(path, model_loader)
+    fm.load_or_create(texts=list(texts), metadatas=metadatas or [{"source": "doc.txt", "page": i} for i in range(len(texts))])
+    return fm
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+import src.document_analyzer.batch_analysis as batch_analysis
+from src.document_analyzer.batch_analysis import BatchAnalyzer, _parse_pool
+from tests.conftest import make_pdf
+from utils.llm_router import SimulatedChatModel
+from utils.model_loader import ModelLoader
+
+METADATA = json.dumps({
+    "Summary": ["A short report."], "Title": "Report", "Author": "Ann", "CreatedDate": "2024-01-01",
+    "LastModifiedDate": "2024-01-02", "Publisher": "Portal", "Language": "English", "PageCount": 1,
+    "SentimentTone": "neutral",
+})
+
+
+@pytest.fixture(autouse=True)
+def parse_pool(monkeypatch):
+    # each test gets its own parse pool, shut down afterwards
+    monkeypatch.setattr(batch_analysis, "_PARSE_POOL", None)
+    yield
+    if batch_analysis._PARSE_POOL is not None:
+        batch_analysis._PARSE_POOL.shutdown(wait=True)
+
+
+@pytest.fixture
+def analysis_llm(offline_models, monkeypatch):
+    monkeypatch.setattr(ModelLoader, "load_llm", lambda self: SimulatedChatModel(response=METADATA, latency_s=0.0))
+
+
+def test_parse_workers_are_spawned_not_forked():
+    pool = _parse_pool(1)
+    assert pool._mp_context.get_start_method() == "spawn"
+    assert _parse_pool(1) is pool
+
+
+def test_request_cannot_raise_concurrency_above_config(analysis_llm):
+    limit = BatchAnalyzer().batch_config["max_concurrency"]
+    assert BatchAnalyzer(max_concurrency=limit + 10).max_concurrency == limit
+    assert BatchAnalyzer(max_concurrency=1).max_concurrency == 1
+
+
+def test_batch_streams_one_line_per_document(analysis_llm):
+    files = [
+        ("files", ("a.pdf", make_pdf(["alpha report"]).getvalue(), "application/pdf")),
+        ("files", ("notes.txt", b"not a pdf", "text/plain")),
+        ("files", ("broken.pdf", b"%PDF-garbage", "application/pdf")),
+        ("files", ("b.pdf", make_pdf(["beta report"]).getvalue(), "application/pdf")),
+    ]
+    response = TestClient(api.app).post("/analyze/batch", files=files, data={"max_concurrency": "2"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    items, summary = {item["file_name"]: item for item in lines[:-1]}, lines[-1]["summary"]
+
+    assert summary == {**summary, "documents": 4, "ok": 2, "error": 2, "timeout": 0}
+    assert items["a.pdf"]["status"] == "ok" and items["a.pdf"]["result"]["Title"] == "Report"
+    assert items["b.pdf"]["index"] == 3 and "parse_ms" in items["b.pdf"]
+    assert items["notes.txt"]["stage"] == "upload"
+    # a document that cannot be parsed fails alone
+    assert items["broken.pdf"]["status"] == "error" and items["broken.pdf"]["stage"] == "parse"
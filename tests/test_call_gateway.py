@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.call_gateway import CallGateway, GatewayTimeout, ProviderGate
+
+
+def test_concurrent_identical_calls_share_one_request():
+    gateway = CallGateway()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        key = gateway.key("llm", ["same prompt"])
+        return await asyncio.gather(*(gateway.acall("llm", key, 10, fn) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["answer"] * 5
+    assert len(calls) == 1 and gateway.coalesced == 4
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    gateway = CallGateway()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        key = gateway.key("llm", ["same prompt"])
+        leader = asyncio.ensure_future(gateway.acall("llm", key, 10, fn))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(gateway.acall("llm", key, 10, fn)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == ["answer"] * 3
+    # one call for the cancelled leader, one for the follower that took over
+    assert len(calls) == 2
+    assert gateway.gate("llm").in_flight == 0
+
+
+def test_leader_error_reaches_followers():
+    gateway = CallGateway()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        raise ValueError("provider down")
+
+    async def main():
+        key = gateway.key("llm", ["p"])
+        return await asyncio.gather(*(gateway.acall("llm", key, 10, fn) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
+
+
+def test_sync_calls_coalesce_across_threads():
+    gateway = CallGateway()
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.05)
+        return 42
+
+    key = gateway.key("embedding", ["text"])
+    threads = [threading.Thread(target=lambda: results.append(gateway.call("embedding", key, 5, fn))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [42] * 4 and len(calls) == 1
+
+
+def test_concurrency_cap_and_acquire_timeout():
+    gate = ProviderGate("llm", max_concurrent=1)
+    gate.acquire(1)
+    with pytest.raises(GatewayTimeout):
+        gate.acquire(1, timeout=0.1)
+    gate.release()
+    gate.acquire(1, timeout=0.1)
+    assert gate.snapshot()["in_flight"] == 1
+
+
+def test_token_budget_refunds_unused_reservation():
+    gate = ProviderGate("llm", tokens_per_minute=1000)
+    gate.acquire(800)
+    gate.release(refund=500)
+    assert gate.snapshot()["tokens_available"] >= 700
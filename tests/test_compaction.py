@@ -0,0 +1,123 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+import src.document_ingestion.recovery as recovery
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.manifest import generation_files, read_manifest
+from src.document_ingestion.recovery import COMPACTION_JOURNAL, needs_recovery, recover_index
+from src.document_ingestion.vector_store import PortalFAISS
+from tests.conftest import FakeModelLoader
+
+TEXTS = ["alpha apple", "bravo banana", "charlie cherry", "delta date", "echo elder", "foxtrot fig"]
+
+
+@pytest.fixture
+def manager(tmp_path, embeddings):
+    # compaction is started by the tests
+    loader = FakeModelLoader(embeddings, compaction={"tombstone_ratio": 2.0, "background": False})
+    fm = FaissManager(tmp_path / "index", loader)
+    fm.load_or_create(texts=TEXTS, metadatas=[{"source": f"doc{i % 3}.txt"} for i in range(len(TEXTS))])
+    fm.delete_source("doc0.txt")
+    return fm
+
+
+def _top(store, query):
+    return store.similarity_search(query, k=1)[0].page_content
+
+
+def _reader(fm):
+    return PortalFAISS.load_local(str(fm.index_dir), fm.embedding, allow_dangerous_deserialization=True)
+
+
+def test_compaction_renumbers_into_new_files(manager):
+    old_files = generation_files(read_manifest(manager.index_dir))
+    report = manager.compact()
+    assert report == {"removed": 2, "vectors": 4, "seconds": report["seconds"]}
+
+    files = generation_files(read_manifest(manager.index_dir))
+    assert files["docstore"] != old_files["docstore"] and files["bm25"] != old_files["bm25"]
+    assert not (manager.index_dir / COMPACTION_JOURNAL).exists()
+    for store in (manager.vector_store, _reader(manager)):
+        assert store.index.ntotal == 4
+        assert _top(store, "echo elder") == "echo elder"
+    assert [i for i, _ in manager.bm25.search("foxtrot")] == [3]
+    # fingerprints follow the new ids: nothing re-embedded, a deleted chunk can come back
+    assert manager.add_documents([Document(page_content="bravo banana", metadata={"source": "doc1.txt"})]) == 0
+    assert manager.add_documents([Document(page_content="alpha apple", metadata={"source": "doc0.txt"})]) == 1
+
+
+def test_reader_opened_before_compaction_stays_consistent(manager):
+    reader = _reader(manager)
+    manager.compact()
+    assert _top(reader, "foxtrot fig") == "foxtrot fig"
+    assert _top(reader, "charlie cherry") == "charlie cherry"
+
+
+def test_reader_opening_mid_compaction_sees_the_old_generation(manager, monkeypatch):
+    seen = {}
+    save_index_file = recovery.save_index_file
+
+    def open_reader_first(*args, **kwargs):
+        # the renumbered copies exist, the new generation is not committed yet
+        reader = _reader(manager)
+        seen["version"] = reader.version
+        seen["top"] = _top(reader, "echo elder")
+        return save_index_file(*args, **kwargs)
+
+    before = read_manifest(manager.index_dir)["generation"]
+    monkeypatch.setattr(recovery, "save_index_file", open_reader_first)
+    manager.compact()
+    assert seen == {"version": before, "top": "echo elder"}
+
+
+def test_old_files_are_removed_by_the_next_compaction(manager):
+    first = generation_files(read_manifest(manager.index_dir))
+    manager.compact()
+    assert (manager.index_dir / first["docstore"]).exists()
+    manager.delete_source("doc1.txt")
+    manager.compact()
+    assert not (manager.index_dir / first["docstore"]).exists()
+    assert not (manager.index_dir / first["bm25"]).exists()
+    assert _top(_reader(manager), "foxtrot fig") == "foxtrot fig"
+
+
+def test_crash_before_commit_is_redone(manager, monkeypatch):
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(recovery, "commit_generation", crash)
+    with pytest.raises(RuntimeError):
+        manager.compact()
+    monkeypatch.undo()
+
+    assert needs_recovery(manager.index_dir)
+    assert recover_index(manager.index_dir)["compaction"] == "resumed"
+    reader = _reader(manager)
+    assert reader.index.ntotal == 4 and _top(reader, "foxtrot fig") == "foxtrot fig"
+    assert not needs_recovery(manager.index_dir)
+
+
+def test_crash_after_commit_finishes_the_fingerprints(manager, monkeypatch):
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(manager.fingerprints, "renumber", crash)
+    with pytest.raises(RuntimeError):
+        manager.compact()
+    monkeypatch.undo()
+
+    assert recover_index(manager.index_dir)["compaction"] == "completed"
+    fm = FaissManager(manager.index_dir, manager.model_loader)
+    fm.load_or_create()
+    assert fm.fingerprints.max_id() == 3
+    assert json.loads((manager.index_dir / "manifest.json").read_text())["index"]["vectors"] == 4
+
+
+def test_bm25_retrieval_follows_the_new_files(manager, offline_models):
+    manager.compact()
+    rag = ConversationalRAG(session_id="index")
+    rag.load_retriever_from_faiss(str(manager.index_dir), mode="bm25", k=1)
+    assert [d.page_content for d in rag.retriever.invoke("foxtrot")] == ["foxtrot fig"]
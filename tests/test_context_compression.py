@@ -0,0 +1,41 @@
+from langchain_core.documents import Document
+
+from src.document_chat.context_compression import ContextCompressor, SentenceEmbeddingCache, split_sentences
+
+
+def test_split_sentences():
+    assert split_sentences("First one. Second one! Third?\n\nNew block") == ["First one.", "Second one!", "Third?", "New block"]
+
+
+def test_keeps_relevant_sentences_and_drops_the_rest(embeddings):
+    docs = [Document(page_content="Pumps need weekly maintenance. The cafeteria opens at noon. Revenue grew.", metadata={"page": 1})]
+    compressor = ContextCompressor(embeddings, similarity_threshold=0.4, cache=SentenceEmbeddingCache())
+    compressed, stats = compressor.compress("pumps need weekly maintenance", docs)
+    assert compressed[0].page_content == "Pumps need weekly maintenance."
+    assert compressed[0].metadata == {"page": 1, "compressed": True}
+    assert stats["sentences_in"] == 3 and stats["sentences_out"] == 1
+    assert stats["tokens_out"] < stats["tokens_in"]
+
+
+def test_min_sentences_per_chunk_keeps_best(embeddings):
+    docs = [Document(page_content="Nothing related here. Still nothing.")]
+    compressor = ContextCompressor(embeddings, similarity_threshold=0.99, min_sentences_per_chunk=1, cache=SentenceEmbeddingCache())
+    compressed, _ = compressor.compress("pumps", docs)
+    assert len(compressed) == 1 and len(split_sentences(compressed[0].page_content)) == 1
+
+
+def test_redundant_sentences_across_chunks_are_dropped(embeddings):
+    docs = [Document(page_content="Pumps need weekly maintenance."), Document(page_content="Pumps need weekly maintenance.")]
+    compressor = ContextCompressor(embeddings, similarity_threshold=0.1, cache=SentenceEmbeddingCache())
+    compressed, stats = compressor.compress("pumps maintenance", docs)
+    assert len(compressed) == 1 and stats["chunks_out"] == 1
+
+
+def test_sentence_cache_only_embeds_misses(embeddings):
+    cache = SentenceEmbeddingCache(max_size=2)
+    cache.embed(embeddings, ["a b", "c d"])
+    calls = embeddings.calls
+    cache.embed(embeddings, ["a b", "c d"])
+    assert embeddings.calls == calls
+    cache.embed(embeddings, ["e f"])
+    assert len(cache._data) == 2
@@ -0,0 +1,125 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from langchain_core.documents import Document
+
+from exception.custom_exception import DocumentPortalException
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.manifest import INDEX_FILE, PREVIOUS_INDEX_FILE, read_manifest
+from src.document_ingestion.recovery import index_lock, needs_recovery, recover_index
+from tests.conftest import REPO_ROOT, build_index
+
+TEXTS = ["alpha apple", "bravo banana", "charlie cherry", "delta date"]
+NEW = ["golf grape", "hotel huckleberry"]
+
+# a worker process that dies (os._exit, no cleanup) at one step of saving NEW into the index
+CRASHING_WRITER = """
+    import os
+    from pathlib import Path
+    from langchain_core.documents import Document
+    import src.document_ingestion.manifest as manifest
+    import src.document_ingestion.vector_store as vector_store
+    from src.document_ingestion.docstore import ChunkStore
+    from src.document_ingestion.data_ingestion import FaissManager
+    from tests.conftest import FakeModelLoader, HashEmbeddings
+
+    def crash(*args, **kwargs):
+        os._exit(3)
+
+    def crash_on_index_rename(tmp_path, target):
+        if Path(target).name == "index.faiss":
+            crash()
+        replace_durably(tmp_path, target)
+
+    fm = FaissManager(sys.argv[1], FakeModelLoader(HashEmbeddings(), compaction={"background": False}))
+    fm.load_or_create()
+    replace_durably = manifest.replace_durably
+    if sys.argv[2] == "index_rename":
+        manifest.replace_durably = crash_on_index_rename
+    elif sys.argv[2] == "docstore_commit":
+        ChunkStore.commit = crash
+    elif sys.argv[2] == "manifest":
+        vector_store.commit_generation = crash
+    fm.add_documents([Document(page_content=text, metadata={"source": "new.txt"}) for text in sys.argv[3:]])
+"""
+
+
+def _crash_while_adding(folder, point):
+    code = f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r})\n" + textwrap.dedent(CRASHING_WRITER)
+    assert subprocess.run([sys.executable, "-c", code, str(folder), point, *NEW]).returncode == 3
+
+
+def _texts(fm):
+    return sorted(doc.page_content for batch in fm.vector_store.docstore.iter_documents() for _, doc in batch)
+
+
+def _reopen(folder, model_loader):
+    fm = FaissManager(folder, model_loader)
+    fm.load_or_create()
+    return fm
+
+
+@pytest.fixture
+def folder(tmp_path, model_loader):
+    build_index(tmp_path / "idx", model_loader, TEXTS)
+    return tmp_path / "idx"
+
+
+@pytest.mark.parametrize("point, outcome", [
+    ("index_rename", None),             # only a temp file was written
+    ("docstore_commit", "restored"),    # new index.faiss, chunks never committed
+])
+def test_crash_before_the_chunks_are_committed_keeps_the_last_save(folder, model_loader, point, outcome):
+    generation = read_manifest(folder)["generation"]
+    _crash_while_adding(folder, point)
+    assert needs_recovery(folder)
+
+    with index_lock(folder):
+        report = recover_index(folder)
+    assert report.get("index_file") == outcome
+    assert not needs_recovery(folder)
+    fm = _reopen(folder, model_loader)
+    assert fm.vector_store.index.ntotal == len(TEXTS) and _texts(fm) == sorted(TEXTS)
+    assert read_manifest(folder)["generation"] == generation
+    # nothing of the lost save counts as ingested: adding it again indexes it
+    assert fm.add_documents([Document(page_content=text, metadata={"source": "new.txt"}) for text in NEW]) == len(NEW)
+
+
+def test_crash_before_the_manifest_adopts_the_complete_save(folder, model_loader):
+    generation = read_manifest(folder)["generation"]
+    _crash_while_adding(folder, "manifest")
+    assert needs_recovery(folder)
+
+    fm = _reopen(folder, model_loader)
+    assert fm.vector_store.index.ntotal == len(TEXTS) + len(NEW)
+    assert _texts(fm) == sorted(TEXTS + NEW)
+    assert read_manifest(folder)["generation"] == generation + 1 and not needs_recovery(folder)
+    assert fm.add_documents([Document(page_content=text, metadata={"source": "new.txt"}) for text in NEW]) == 0
+
+
+def test_damaged_index_rolls_back_to_the_previous_generation(folder, model_loader):
+    fm = _reopen(folder, model_loader)
+    fm.add_documents([Document(page_content=text, metadata={"source": "new.txt"}) for text in NEW])
+    assert (folder / PREVIOUS_INDEX_FILE).exists()
+    (folder / INDEX_FILE).write_bytes(b"not a faiss index")
+
+    with index_lock(folder):
+        report = recover_index(folder)
+    assert report["index_file"] == "rolled_back"
+    assert report["trimmed_ids"]["docstore"] == len(NEW)
+    fm = _reopen(folder, model_loader)
+    assert fm.vector_store.index.ntotal == len(TEXTS) and _texts(fm) == sorted(TEXTS)
+
+
+def test_consistent_folder_needs_no_recovery(folder):
+    assert not needs_recovery(folder)
+    with index_lock(folder):
+        assert recover_index(folder) == {}
+
+
+def test_damaged_index_without_an_intact_generation_is_an_error(folder):
+    (folder / INDEX_FILE).write_bytes(b"not a faiss index")
+    with index_lock(folder), pytest.raises(DocumentPortalException):
+        recover_index(folder)
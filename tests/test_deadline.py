@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+from utils.deadline import ClientDisconnected, Deadline, DeadlineExceeded, run_until_disconnect
+from utils.llm_router import SimulatedChatModel
+from utils.model_loader import ModelLoader
+from tests.conftest import build_index
+
+
+def test_stages_share_the_request_budget():
+    async def main():
+        deadline = Deadline(0.3)
+        assert await deadline.run("fast", asyncio.sleep(0.01, result="ok")) == "ok"
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(DeadlineExceeded) as e:
+            await deadline.run("slow", slow())
+        assert e.value.stage == "slow" and set(e.value.timings) == {"fast", "slow"}
+        assert cancelled.is_set()
+        # nothing left: later stages fail at once
+        with pytest.raises(DeadlineExceeded):
+            await deadline.run("after", asyncio.sleep(0))
+
+    asyncio.run(main())
+
+
+def test_stage_caps_apply_without_a_request_budget():
+    async def main():
+        deadline = Deadline(None, {"fix": 0.05})
+        with pytest.raises(DeadlineExceeded) as e:
+            await deadline.run("fix", asyncio.sleep(1))
+        assert e.value.budget_s == 0.05
+        assert await deadline.run("generate", asyncio.sleep(0.06, result=1)) == 1
+        assert Deadline.from_config({"deadlines": {"analyze": 30}}, "analyze", 5).seconds == 5
+
+    asyncio.run(main())
+
+
+def test_client_disconnect_cancels_the_work():
+    async def main():
+        work = asyncio.ensure_future(asyncio.sleep(5))
+
+        async def gone():
+            return True
+
+        with pytest.raises(ClientDisconnected):
+            await run_until_disconnect(gone, work, poll_s=0.01)
+        await asyncio.sleep(0)
+        assert work.cancelled()
+
+    asyncio.run(main())
+
+
+def test_chat_query_times_out_with_504(tmp_path, offline_models, model_loader, monkeypatch):
+    build_index(tmp_path / "faiss" / "s1", model_loader, ["apple banana", "car truck"])
+    monkeypatch.setattr(api, "FAISS_BASE", str(tmp_path / "faiss"))
+    monkeypatch.setattr(ModelLoader, "load_llm", lambda self: SimulatedChatModel(response="late", latency_s=2.0))
+    response = TestClient(api.app).post("/chat/query", data={"question": "apple", "session_id": "s1", "timeout_s": 0.3})
+    assert response.status_code == 504, response.text
+    detail = response.json()["detail"]
+    assert detail["stage"] in ("rewrite", "answer") and detail["timings"]["budget_s"] == 0.3
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin
+
+from src.document_ingestion.docstore import ChunkStore
+from src.document_ingestion.vector_store import PortalFAISS
+
+
+def _docs(*texts, source="a.txt"):
+    return [Document(id=f"id-{t}", page_content=t, metadata={"source": source, "page": i}) for i, t in enumerate(texts)]
+
+
+def test_chunks_keyed_by_vector_id(tmp_path):
+    store = ChunkStore(tmp_path / "docstore.sqlite", cache_size=2)
+    store.add_chunks(0, _docs("a", "b"))
+    store.add_chunks(2, _docs("c"))
+    store.commit()
+    docs = store.get_many([2, 0, 7])
+    assert [d.page_content if d else None for d in docs] == ["c", "a", None]
+    assert docs[0].metadata["vector_id"] == 2
+    assert store.index_map[1] == "id-b" and len(store.index_map) == 3
+    assert store.search("id-c").page_content == "c"
+
+
+def test_duplicate_vector_ids_are_rejected(tmp_path):
+    store = ChunkStore(tmp_path / "docstore.sqlite")
+    store.add_chunks(0, _docs("a"))
+    with pytest.raises(ValueError):
+        store.add_chunks(0, _docs("b"))
+
+
+def test_lru_cache_is_bounded(tmp_path):
+    store = ChunkStore(tmp_path / "docstore.sqlite", cache_size=2)
+    store.add_chunks(0, _docs("a", "b", "c"))
+    store.get_many([0, 1, 2])
+    assert list(store._cache) == [1, 2]
+
+
+def test_persisted_across_connections(tmp_path):
+    store = ChunkStore(tmp_path / "docstore.sqlite")
+    store.add_chunks(0, _docs("a", "b"))
+    store.close()
+    reopened = ChunkStore(tmp_path / "docstore.sqlite")
+    assert [d.page_content for d in reopened.get_many([0, 1])] == ["a", "b"]
+    assert reopened.live_ids().tolist() == [0, 1]
+
+
+def test_not_addable_by_docstore_id(tmp_path, embeddings):
+    store = ChunkStore(tmp_path / "docstore.sqlite")
+    assert not isinstance(store, AddableMixin)
+    assert not hasattr(store, "add")
+    # LangChain merges need an id-addable docstore and refuse this one instead of misnumbering chunks
+    a = PortalFAISS.from_texts(["x y"], embeddings)
+    a.save_local(str(tmp_path / "a"))
+    b = PortalFAISS.from_texts(["z w"], embeddings)
+    with pytest.raises(ValueError):
+        PortalFAISS.load_local(str(tmp_path / "a"), embeddings).merge_from(b)
+
+
+def test_tombstones_and_renumber(tmp_path):
+    store = ChunkStore(tmp_path / "docstore.sqlite")
+    store.add_chunks(0, _docs("a", "b", "c"))
+    assert store.tombstone([1]) == 1
+    assert store.tombstoned_ids().tolist() == [1]
+    store.renumber(store.live_ids())
+    assert store.live_ids().tolist() == [0, 1]
+    assert store.tombstoned_ids().size == 0
+    assert [d.page_content for d in store.get_many([0, 1])] == ["a", "c"]
@@ -0,0 +1,78 @@
+import pytest
+from langchain_core.documents import Document
+
+from src.document_chat.index_cache import IndexCache
+from src.document_chat.retrieval import ConversationalRAG, FederatedRetriever
+from src.document_ingestion.data_ingestion import FaissManager
+from tests.conftest import build_index
+
+
+@pytest.fixture
+def sessions(tmp_path, model_loader):
+    base = tmp_path / "faiss"
+    build_index(base / "s1", model_loader, ["apple banana cherry", "car truck bus"])
+    build_index(base / "s2", model_loader, ["apple banana smoothie", "dog cat mouse"])
+    return {"s1": str(base / "s1"), "s2": str(base / "s2")}
+
+
+def test_parallel_merges_hits_and_tags_sessions(sessions, offline_models):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_sessions(sessions, federation="parallel", k=2)
+    assert isinstance(rag.retriever, FederatedRetriever)
+    docs = rag.retriever.invoke("apple banana")
+    assert sorted(d.metadata["session_id"] for d in docs) == ["s1", "s2"]
+    assert all("apple banana" in d.page_content for d in docs)
+
+
+def test_parallel_embeds_the_question_once(sessions, offline_models):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_sessions(sessions, federation="parallel", k=2)
+    before = offline_models.calls
+    rag.retriever.invoke("dog truck federation")
+    assert offline_models.calls == before + 1
+
+
+def test_parallel_skips_a_failing_session(sessions, offline_models, monkeypatch):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_sessions(sessions, federation="parallel", k=4)
+    broken = rag.retriever.stores["s2"]
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("unreadable")
+
+    monkeypatch.setattr(broken, "similarity_search_with_score_by_vector", fail)
+    docs = rag.retriever.invoke("apple")
+    assert docs and {d.metadata["session_id"] for d in docs} == {"s1"}
+
+
+def test_shared_index_filters_to_requested_sessions(tmp_path, sessions, model_loader, offline_models):
+    shared = FaissManager(tmp_path / "faiss" / "_shared", model_loader)
+    assert shared.merge_sessions(sessions) == {"s1": 2, "s2": 2}
+    # merging again adds nothing: the chunks are already fingerprinted
+    assert shared.merge_sessions(sessions) == {"s1": 0, "s2": 0}
+
+    rag = ConversationalRAG(session_id="s2")
+    rag.load_retriever_from_sessions({"s2": sessions["s2"]}, federation="shared",
+                                     shared_index_path=str(shared.index_dir), k=4)
+    docs = rag.retriever.invoke("apple banana")
+    assert docs and {d.metadata["session_id"] for d in docs} == {"s2"}
+
+
+def test_merge_skips_sessions_over_the_limit(tmp_path, sessions, model_loader):
+    shared = FaissManager(tmp_path / "faiss" / "_shared", model_loader)
+    assert shared.merge_sessions(sessions, max_chunks=1) == {"s1": 0, "s2": 0}
+
+
+def test_index_cache_reopens_changed_indexes(tmp_path, model_loader, embeddings):
+    fm = build_index(tmp_path / "s1", model_loader, ["apple banana cherry"])
+    cache = IndexCache(max_size=1)
+    first = cache.get(tmp_path / "s1", embeddings)
+    assert cache.get(tmp_path / "s1", embeddings) is first
+
+    fm.add_documents([Document(page_content="grape melon", metadata={"source": "b.txt"})])
+    reopened = cache.get(tmp_path / "s1", embeddings)
+    assert reopened is not first and reopened.index.ntotal == 2
+
+    build_index(tmp_path / "s2", model_loader, ["car truck"])
+    cache.get(tmp_path / "s2", embeddings)
+    assert len(cache) == 1
@@ -0,0 +1,52 @@
+import json
+
+from langchain_core.documents import Document
+
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.fingerprints import FingerprintIndex, chunk_fingerprint, page_hash
+from tests.conftest import build_index
+
+
+def _doc(text, source_hash="h1", **metadata):
+    return Document(page_content=text, metadata={"source": "a.pdf", "source_hash": source_hash, **metadata})
+
+
+def test_fingerprint_ignores_spacing_and_file_name():
+    a = chunk_fingerprint("Total  revenue\n grew", {"source_hash": "h1", "source": "x.pdf"})
+    b = chunk_fingerprint("Total revenue grew", {"source_hash": "h1", "source": "y.pdf"})
+    assert a == b and len(a) == 16
+    assert chunk_fingerprint("Total revenue grew", {"source_hash": "h2"}) != a
+    assert chunk_fingerprint("Total revenue grew", {"source_hash": "h1", "session_id": "s1"}) != a
+    assert page_hash("ﬁle  one") == page_hash("file one")
+
+
+def test_duplicates_are_embedded_once(tmp_path, model_loader):
+    fm = build_index(tmp_path / "idx", model_loader, ["first chunk"], [{"source": "a.pdf", "source_hash": "h0"}])
+    added = fm.add_documents([_doc("same text"), _doc("same  text"), _doc("other text")])
+    assert added == 2 and fm.vector_store.index.ntotal == 3
+    # the same file uploaded again under another name
+    assert fm.add_documents([_doc("same text", source="b.pdf"), _doc("other text")]) == 0
+
+
+def test_delete_releases_fingerprints(tmp_path, model_loader):
+    fm = build_index(tmp_path / "idx", model_loader, ["keep me", "drop me"],
+                     [{"source": "keep.pdf", "source_hash": "k"}, {"source": "drop.pdf", "source_hash": "d"}])
+    assert fm.delete_source("drop.pdf") == 1
+    assert fm.add_documents([Document(page_content="drop me", metadata={"source": "drop.pdf", "source_hash": "d"})]) == 1
+
+
+def test_legacy_meta_is_migrated(tmp_path, model_loader):
+    folder = tmp_path / "idx"
+    build_index(folder, model_loader, ["alpha", "beta"], [{"source": "a.pdf", "source_hash": "h"}] * 2)
+    fingerprints = FingerprintIndex(folder / "fingerprints.sqlite")
+    fingerprints.clear()
+    fingerprints.close()
+    (folder / "ingested_meta.json").write_text(json.dumps({"rows": {"a.pdf::0": True},
+                                                            "sessions": {"s1": {"chunks": 2, "merged_at": "t"}}}))
+
+    fm = FaissManager(folder, model_loader)
+    fm.load_or_create()
+    assert len(fm.fingerprints) == 2
+    assert fm.fingerprints.merged_sessions()[0]["session_id"] == "s1"
+    assert not (folder / "ingested_meta.json").exists()
+    assert fm.add_documents([_doc("alpha", source_hash="h")]) == 0
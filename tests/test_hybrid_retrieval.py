@@ -0,0 +1,50 @@
+from src.document_chat.retrieval import ConversationalRAG
+from src.document_ingestion.bm25_index import BM25Index, tokenize
+from tests.conftest import build_index
+
+TEXTS = [
+    "Replace valve AB-1234 before the pump restarts",
+    "The quarterly revenue grew in every region",
+    "Clause 4.2.1 limits the supplier liability",
+    "Pump maintenance schedule and spare parts",
+]
+
+
+def test_tokenize_keeps_compound_ids():
+    tokens = tokenize("See clause 4.2.1 and part AB-1234.")
+    assert "4.2.1" in tokens and "ab-1234" in tokens and "ab" in tokens
+    assert "and" not in tokens
+
+
+def test_bm25_ranks_and_removes(tmp_path):
+    index = BM25Index(tmp_path / "bm25.sqlite")
+    index.add(enumerate(TEXTS))
+    assert index.search("AB-1234", k=2)[0][0] == 0
+    assert index.search("pump", k=5, vector_ids={3})[0][0] == 3
+    index.remove([0])
+    assert all(vid != 0 for vid, _ in index.search("AB-1234 pump", k=5))
+    assert len(index) == 3
+
+
+def _rag(tmp_path, model_loader, **overrides):
+    build_index(tmp_path / "idx", model_loader, TEXTS)
+    rag = ConversationalRAG(session_id="s")
+    rag.load_retriever_from_faiss(str(tmp_path / "idx"), **overrides)
+    return rag
+
+
+def test_bm25_mode_finds_exact_ids(tmp_path, model_loader, offline_models):
+    rag = _rag(tmp_path, model_loader, mode="bm25", k=1)
+    assert rag.retriever.invoke("clause 4.2.1")[0].page_content == TEXTS[2]
+
+
+def test_hybrid_mode_fuses_to_k(tmp_path, model_loader, offline_models):
+    rag = _rag(tmp_path, model_loader, mode="hybrid", k=2)
+    docs = rag.retriever.invoke("pump AB-1234")
+    assert len(docs) == 2
+    assert TEXTS[0] in [d.page_content for d in docs]
+
+
+def test_bm25_index_is_built_with_the_vectors(tmp_path, model_loader):
+    fm = build_index(tmp_path / "idx", model_loader, TEXTS)
+    assert len(fm.bm25) == len(TEXTS)
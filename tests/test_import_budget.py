@@ -0,0 +1,18 @@
+from utils.config_loader import load_config
+from utils.import_budget import DEFAULT_IMPORT_BUDGET, check_module, main
+
+
+def test_config_found_from_any_directory():
+    assert "import_budget" in load_config()
+
+
+def test_entry_points_within_budget():
+    config = {**DEFAULT_IMPORT_BUDGET, **(load_config().get("import_budget", {}) or {})}
+    for module, budget_ms in config["modules"].items():
+        report = check_module(module, budget_ms, config["deferred"], runs=config["runs"])
+        assert not report["deferred_imported"], report
+        assert report["ok"], report
+
+
+def test_main_exit_status():
+    assert main(["api.main"]) == 0
@@ -0,0 +1,85 @@
+import pytest
+from langchain_core.documents import Document
+
+from exception.custom_exception import DocumentPortalException
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.progress import IngestProgress
+from tests.conftest import make_pdf
+from utils.job_queue import JobCancelled
+
+PAGES = ["Quarterly revenue grew in the north region.", "Headcount stayed flat across teams.", "Outlook remains cautious for next year."]
+
+
+def _updated(ingestor):
+    return ingestor.progress.events[-1]["updated"]
+
+
+def _texts(ingestor):
+    fm = FaissManager(ingestor.faiss_dir)
+    fm.load_or_create()
+    store = fm.vector_store.docstore
+    return sorted(doc.page_content for batch in store.iter_documents() for _, doc in batch)
+
+
+def test_reupload_embeds_only_changed_pages(ingestor):
+    ingestor.build_retriever([make_pdf(PAGES)])
+    revised = [PAGES[0], "Headcount grew by ten percent.", PAGES[2]]
+    ingestor.build_retriever([make_pdf(revised)])
+    report = _updated(ingestor)["report.pdf"]
+    assert report["changed_pages"] == 1 and report["reused_chunks"] == 2 and report["removed_chunks"] == 1
+    assert _texts(ingestor) == sorted(revised)
+
+
+def test_replacing_a_file_with_its_new_version_keeps_the_new_version(ingestor):
+    ingestor.build_retriever([make_pdf(PAGES)])
+    revised = [PAGES[0], "Headcount grew by ten percent."]
+    ingestor.build_retriever([make_pdf(revised)], replace_sources=["report.pdf"])
+    assert _updated(ingestor) == {}
+    assert _texts(ingestor) == sorted(revised)
+
+
+def test_replace_sources_removes_other_documents(ingestor):
+    ingestor.build_retriever([make_pdf(PAGES), make_pdf(["Old memo text."], name="memo.pdf")])
+    ingestor.build_retriever([make_pdf(["New memo text."], name="memo2.pdf")], replace_sources=["memo.pdf"])
+    assert _texts(ingestor) == sorted(PAGES + ["New memo text."])
+
+
+def _cancel_at(stage):
+    def callback(event):
+        if event["stage"] == stage:
+            raise JobCancelled("job")
+    return callback
+
+
+def _state(ingestor):
+    fm = FaissManager(ingestor.faiss_dir)
+    fm.load_or_create()
+    return _texts(ingestor), int(fm.vector_store.tombstones.size), len(fm.fingerprints)
+
+
+@pytest.mark.parametrize("stage", ["chunks_split", "chunks_embedded"])
+def test_update_cancelled_before_indexing_leaves_the_index_unchanged(ingestor, stage):
+    ingestor.build_retriever([make_pdf(PAGES)])
+    before = _state(ingestor)
+    revised = [PAGES[0], "Headcount grew by ten percent."]
+    with pytest.raises(DocumentPortalException):
+        ingestor.build_retriever([make_pdf(revised)], on_progress=_cancel_at(stage))
+    assert _state(ingestor) == before
+
+    # the next attempt sees the old version and updates it as usual
+    ingestor.build_retriever([make_pdf(revised)])
+    report = _updated(ingestor)["report.pdf"]
+    assert report["changed_pages"] == 1 and report["removed_chunks"] == 2
+    assert _texts(ingestor) == sorted(revised)
+
+
+def test_replace_source_cancelled_while_embedding_keeps_the_old_chunks(ingestor):
+    ingestor.build_retriever([make_pdf(PAGES)])
+    before = _state(ingestor)
+    fm = FaissManager(ingestor.faiss_dir)
+    fm.load_or_create()
+    fm.progress = IngestProgress("s1", [_cancel_at("chunks_embedded")])
+    source = fm.sources()[0]["source"]
+    with pytest.raises(JobCancelled):
+        fm.replace_source(source, [Document(page_content="Entirely new text.", metadata={"source": source})])
+    assert _state(ingestor) == before
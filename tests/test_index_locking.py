@@ -0,0 +1,119 @@
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from src.document_chat.index_cache import IndexCache
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.recovery import WRITE_LOCK_FILE, index_lock
+from tests.conftest import REPO_ROOT, build_index
+from utils.file_lock import InterProcessLock
+
+
+def _python(script, *args):
+    """Another worker process: runs `script` with the repo importable and tests.conftest at hand."""
+    code = f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r})\n" + textwrap.dedent(script)
+    return subprocess.Popen([sys.executable, "-c", code, *map(str, args)], stdout=subprocess.PIPE, text=True)
+
+
+HOLD_LOCK = """
+    import time
+    from utils.file_lock import InterProcessLock
+    with InterProcessLock(sys.argv[1]):
+        print("locked", flush=True)
+        time.sleep(float(sys.argv[2]))
+"""
+
+
+def test_lock_is_reentrant_and_excludes_other_threads(tmp_path):
+    lock = InterProcessLock(tmp_path / "write.lock")
+    acquired = threading.Event()
+
+    def other():
+        with lock:
+            acquired.set()
+
+    with lock:
+        with lock:
+            thread = threading.Thread(target=other)
+            thread.start()
+            assert not acquired.wait(0.1)
+    assert acquired.wait(2)
+    thread.join()
+
+
+def test_lock_excludes_other_processes(tmp_path):
+    child = _python(HOLD_LOCK, tmp_path / "write.lock", 0.5)
+    assert child.stdout.readline().strip() == "locked"
+    started = time.monotonic()
+    with InterProcessLock(tmp_path / "write.lock"):
+        waited = time.monotonic() - started
+    child.wait(10)
+    assert waited > 0.2
+
+
+def test_lock_of_a_killed_process_is_released(tmp_path):
+    child = _python(HOLD_LOCK, tmp_path / "write.lock", 60)
+    assert child.stdout.readline().strip() == "locked"
+    child.kill()
+    child.wait(10)
+    started = time.monotonic()
+    with InterProcessLock(tmp_path / "write.lock"):
+        assert time.monotonic() - started < 5
+
+
+def test_index_lock_is_shared_per_folder(tmp_path):
+    assert index_lock(tmp_path / "a") is index_lock(tmp_path / "a" / ".." / "a")
+    assert index_lock(tmp_path / "a") is not index_lock(tmp_path / "b")
+    assert index_lock(tmp_path / "a").path.name == WRITE_LOCK_FILE
+
+
+def test_writer_reloads_a_store_saved_by_another_worker(tmp_path, model_loader):
+    build_index(tmp_path / "idx", model_loader, ["alpha apple", "bravo banana"])
+    first, second = FaissManager(tmp_path / "idx", model_loader), FaissManager(tmp_path / "idx", model_loader)
+    first.load_or_create()
+    second.load_or_create()
+    second.add_documents([Document(page_content="charlie cherry", metadata={"source": "b.txt"})])
+    # first's copy is stale: it reloads under the lock instead of overwriting second's chunk
+    first.add_documents([Document(page_content="delta date", metadata={"source": "a.txt"})])
+
+    fm = FaissManager(tmp_path / "idx", model_loader)
+    fm.load_or_create()
+    assert fm.vector_store.index.ntotal == 4
+    texts = {doc.page_content for batch in fm.vector_store.docstore.iter_documents() for _, doc in batch}
+    assert {"charlie cherry", "delta date"} <= texts
+
+
+def test_concurrent_writers_in_two_processes_lose_nothing(tmp_path, model_loader):
+    build_index(tmp_path / "idx", model_loader, ["seed text"])
+    writer = """
+        from langchain_core.documents import Document
+        from src.document_ingestion.data_ingestion import FaissManager
+        from tests.conftest import FakeModelLoader, HashEmbeddings
+        fm = FaissManager(sys.argv[1], FakeModelLoader(HashEmbeddings(), compaction={"background": False}))
+        fm.load_or_create()
+        for i in range(5):
+            fm.add_documents([Document(page_content=f"{sys.argv[2]} chunk {i}", metadata={"source": sys.argv[2]})])
+    """
+    children = [_python(writer, tmp_path / "idx", name) for name in ("left", "right")]
+    assert [child.wait(120) for child in children] == [0, 0]
+
+    fm = FaissManager(tmp_path / "idx", model_loader)
+    fm.load_or_create()
+    assert fm.vector_store.index.ntotal == 11
+    assert {s["source"] for s in fm.sources()} == {"doc.txt", "left", "right"}
+
+
+def test_cache_reopens_after_another_manager_writes(tmp_path, model_loader, embeddings):
+    build_index(tmp_path / "idx", model_loader, ["alpha apple", "bravo banana"])
+    cache = IndexCache()
+    before = cache.get(tmp_path / "idx", embeddings)
+    fm = FaissManager(tmp_path / "idx", model_loader)
+    fm.load_or_create()
+    fm.add_documents([Document(page_content="charlie cherry", metadata={"source": "c.txt"})])
+    after = cache.get(tmp_path / "idx", embeddings)
+    assert after is not before and after.index.ntotal == 3 and after.version == fm.vector_store.version
@@ -0,0 +1,69 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+from exception.custom_exception import DocumentPortalException
+from src.document_ingestion.progress import IngestProgress, ingest_progress
+from tests.conftest import make_pdf
+
+PAGES = [" ".join(f"word{p}_{i}" for i in range(120)) for p in range(3)]
+
+
+def test_events_follow_the_stages_with_running_totals(ingestor):
+    events = []
+    ingestor.build_retriever([make_pdf(PAGES)], chunk_size=200, chunk_overlap=0, on_progress=events.append)
+    stages = [e["stage"] for e in events]
+    assert stages[:3] == ["files_saved", "pages_parsed", "chunks_split"]
+    assert set(stages[3:-2]) == {"chunks_embedded"} and stages[-2:] == ["index_persisted", "done"]
+
+    totals = events[-1]["totals"]
+    assert totals["files"] == 1 and totals["pages"] == 3
+    assert totals["chunks"] == totals["to_embed"] == totals["embedded"] > 3
+    embedded = [e["totals"]["embedded"] for e in events if e["stage"] == "chunks_embedded"]
+    assert embedded == sorted(embedded) and embedded[-1] == totals["embedded"]
+    # a new session's index is created from these chunks: all of them count as added
+    assert events[-1]["added"] == totals["embedded"]
+
+    snapshot = ingestor.progress.snapshot()
+    assert snapshot["stage"] == "done" and set(snapshot["stage_ms"]) == {"save", "parse", "split", "embed", "persist"}
+    assert snapshot["embedding_batches"]["count"] == len(embedded) and snapshot["chunks_per_s"] > 0
+    assert ingest_progress("s1") is ingestor.progress
+
+
+def test_reupload_embeds_nothing(ingestor):
+    ingestor.build_retriever([make_pdf(PAGES)], chunk_size=200, chunk_overlap=0)
+    events = []
+    ingestor.build_retriever([make_pdf(PAGES)], chunk_size=200, chunk_overlap=0, on_progress=events.append)
+    assert "chunks_embedded" not in [e["stage"] for e in events]
+    assert events[-1]["totals"]["embedded"] == 0
+
+
+def test_failed_ingest_ends_with_a_failed_event(ingestor):
+    events = []
+    with pytest.raises(DocumentPortalException):
+        ingestor.build_retriever([make_pdf(PAGES, name="notes.xyz")], on_progress=events.append)
+    assert events[-1]["stage"] == "failed" and ingestor.progress.snapshot()["stage"] == "failed"
+
+
+def test_callback_errors_abort_the_ingest():
+    def stop(event):
+        raise RuntimeError("stop")
+
+    progress = IngestProgress("s2", [stop])
+    with pytest.raises(RuntimeError):
+        progress.pages_parsed(3, 1.0)
+    assert progress.totals["pages"] == 3 and len(progress.events) == 1
+
+
+def test_progress_endpoint(offline_models, tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "FAISS_BASE", str(tmp_path / "faiss"))
+    client = TestClient(api.app)
+    assert client.get("/chat/index/progress", params={"session_id": "nope"}).status_code == 404
+
+    upload = make_pdf(PAGES)
+    response = client.post("/chat/index", files={"files": ("report.pdf", upload.getvalue(), "application/pdf")},
+                           data={"session_id": "api-s", "chunk_size": "200", "chunk_overlap": "0"})
+    assert response.status_code == 200 and response.json()["progress"]["stage"] == "done"
+    report = client.get("/chat/index/progress", params={"session_id": "api-s", "events": "true"}).json()
+    assert report["stage"] == "done" and report["events"][-1]["stage"] == "done"
+    assert "events" not in client.get("/chat/index/progress", params={"session_id": "api-s"}).json()
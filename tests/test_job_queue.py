@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+from tests.conftest import make_pdf
+from utils.job_queue import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, TERMINAL, JobCancelled, JobQueue, JobStore
+from utils.llm_router import SimulatedChatModel
+from utils.model_loader import ModelLoader
+from utils.warmup import WarmUp
+
+FAST = {"workers": 2, "poll_interval_s": 0.05, "tenant_max_running": None}
+
+
+async def _wait(queue, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.store.get(job_id)
+        if job["status"] in TERMINAL:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def _run(queue, main):
+    async def wrapper():
+        await queue.start()
+        try:
+            return await main()
+        finally:
+            await queue.stop()
+    return asyncio.run(wrapper())
+
+
+def test_claim_order_is_priority_then_fifo(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    low = store.submit("k", {}, priority=0)
+    high = store.submit("k", {}, priority=5)
+    low2 = store.submit("k", {}, priority=0)
+    assert [store.claim("w")["id"] for _ in range(3)] == [high, low, low2]
+    assert store.claim("w") is None
+
+
+def test_tenant_running_limit(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    a1, a2 = store.submit("k", {}, tenant="a"), store.submit("k", {}, tenant="a")
+    b1 = store.submit("k", {}, tenant="b")
+    assert store.claim("w", tenant_max_running=1)["id"] == a1
+    # a is at its limit: b goes first
+    assert store.claim("w", tenant_max_running=1)["id"] == b1
+    assert store.claim("w", tenant_max_running=1) is None
+    store.finish(a1, SUCCEEDED)
+    assert store.claim("w", tenant_max_running=1)["id"] == a2
+
+
+def test_stale_running_job_is_requeued_then_failed(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    job_id = store.submit("k", {})
+    store.claim("dead-worker")
+    assert store.requeue_stale(stale_after_s=-1, max_attempts=2) == 1
+    assert store.get(job_id)["status"] == QUEUED
+    store.claim("dead-worker")
+    store.requeue_stale(stale_after_s=-1, max_attempts=2)
+    assert store.get(job_id)["status"] == FAILED
+
+
+def test_handlers_run_and_report_results(tmp_path):
+    queue = JobQueue({**FAST, "path": str(tmp_path / "jobs.sqlite"), "files_dir": str(tmp_path / "files")})
+
+    def add(job_id, payload, progress):
+        progress("adding", items=2)
+        return payload["a"] + payload["b"]
+
+    async def boom(job_id, payload, progress):
+        raise ValueError("bad input")
+
+    queue.register("add", add)
+    queue.register("boom", boom)
+    with pytest.raises(ValueError):
+        queue.submit("unknown", {})
+
+    async def main():
+        ok, failed = queue.submit("add", {"a": 1, "b": 2}), queue.submit("boom", {})
+        return await _wait(queue, ok), await _wait(queue, failed)
+
+    ok, failed = _run(queue, main)
+    assert ok["status"] == SUCCEEDED and ok["result"] == 3 and ok["progress"]["stage"] == "adding"
+    assert failed["status"] == FAILED and failed["error"] == "bad input"
+
+
+def test_cancel_stops_thread_and_coroutine_jobs(tmp_path):
+    queue = JobQueue({**FAST, "path": str(tmp_path / "jobs.sqlite"), "files_dir": str(tmp_path / "files")})
+
+    def spin(job_id, payload, progress):
+        while True:
+            progress("spinning")
+            time.sleep(0.01)
+
+    async def sleep(job_id, payload, progress):
+        await asyncio.sleep(30)
+
+    queue.register("spin", spin)
+    queue.register("sleep", sleep)
+
+    async def main():
+        ids = [queue.submit("spin", {}), queue.submit("sleep", {})]
+        while any(queue.store.get(i)["status"] != RUNNING for i in ids):
+            await asyncio.sleep(0.02)
+        for job_id in ids:
+            queue.cancel(job_id)
+        return [await _wait(queue, i) for i in ids]
+
+    assert [job["status"] for job in _run(queue, main)] == [CANCELLED, CANCELLED]
+
+
+def test_stop_returns_running_jobs_to_the_queue(tmp_path):
+    queue = JobQueue({**FAST, "path": str(tmp_path / "jobs.sqlite"), "files_dir": str(tmp_path / "files")})
+
+    async def sleep(job_id, payload, progress):
+        await asyncio.sleep(30)
+
+    queue.register("sleep", sleep)
+
+    async def main():
+        job_id = queue.submit("sleep", {})
+        while queue.store.get(job_id)["status"] != RUNNING:
+            await asyncio.sleep(0.02)
+        return job_id
+
+    job_id = _run(queue, main)
+    job = queue.store.get(job_id)
+    assert job["status"] == QUEUED and job["attempts"] == 0
+
+
+def test_compare_job_end_to_end(offline_models, monkeypatch):
+    rows = [{"Page": "1", "changes": "alpha became beta"}]
+    monkeypatch.setattr(ModelLoader, "load_llm", lambda self: SimulatedChatModel(response=json.dumps(rows), latency_s=0.0))
+    api._jobs.cache_clear()
+    monkeypatch.setattr(api, "_config", lambda: {**api.load_config(), "jobs": FAST})
+    try:
+        files = {
+            "reference": ("../../escape.pdf", make_pdf(["alpha"]).getvalue(), "application/pdf"),
+            "actual": ("new version.pdf", make_pdf(["beta"]).getvalue(), "application/pdf"),
+        }
+        response = TestClient(api.app).post("/jobs/compare", files=files)
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        queue = api._jobs()
+
+        job = _run(queue, lambda: _wait(queue, job_id))
+        assert job["status"] == SUCCEEDED, job["error"]
+        assert job["result"] == {"rows": rows, "session_id": job_id}
+        session_dir = api.Path("data/document_compare") / job_id
+        # reference first, under server-side names only
+        names = sorted(p.name for p in session_dir.iterdir())
+        assert [n.split("_", 1)[0] for n in names] == ["0", "1"] and not any("escape" in n for n in names)
+        assert not queue.files_dir(job_id).exists()
+        assert TestClient(api.app).get(f"/jobs/{job_id}").json()["status"] == SUCCEEDED
+    finally:
+        api._jobs.cache_clear()
+
+
+def test_app_lifespan_runs_the_job_workers(tmp_path, monkeypatch):
+    queue = JobQueue({**FAST, "path": str(tmp_path / "jobs.sqlite"), "files_dir": str(tmp_path / "files")})
+    queue.register("add", lambda job_id, payload, progress: payload["a"] + payload["b"])
+    monkeypatch.setattr(api, "_jobs", lambda: queue)
+    monkeypatch.setattr(api, "_warmup", lambda: WarmUp({"enabled": False}))
+    job_id = queue.submit("add", {"a": 1, "b": 2})
+    with TestClient(api.app) as client:
+        deadline = time.monotonic() + 10
+        while client.get(f"/jobs/{job_id}").json()["status"] not in TERMINAL and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert queue._tasks
+    assert queue.store.get(job_id)["result"] == 3
+    assert not queue._tasks
@@ -0,0 +1,55 @@
+import pytest
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel
+
+from utils.json_repair import PARSE_OUTCOMES, RepairingJsonOutputParser, repair_json, strip_reasoning
+
+
+class Summary(BaseModel):
+    title: str
+    pages: int
+
+
+def test_reasoning_block_with_a_draft_is_dropped():
+    text = '<think>Draft: {"title": "draft", "pages": 0}. Let me fix it.</think>\n{"title": "final", "pages": 3}'
+    assert repair_json(text) == {"title": "final", "pages": 3}
+
+
+def test_unclosed_reasoning_block_runs_to_the_json():
+    assert repair_json('<think>the user wants a summary\n{"title": "cut", "pages": 1}') == {"title": "cut", "pages": 1}
+    assert strip_reasoning("<think>a</think> plain <think>b</think>") == " plain "
+
+
+@pytest.mark.parametrize("text,expected", [
+    ('```json\n{"a": 1,}\n```', {"a": 1}),
+    ('Here you go: {“a”: “b”}', {"a": "b"}),
+    ('{"items": [1, 2, 3', {"items": [1, 2, 3]}),
+    ("{'ok': true, 'missing': null}", {"ok": True, "missing": None}),
+])
+def test_common_defects_are_repaired(text, expected):
+    assert repair_json(text) == expected
+
+
+def test_literals_inside_strings_are_kept():
+    text = "{'note': 'true or false, never null', 'flag': false, \"quoted\": \"it's true\"}"
+    assert repair_json(text) == {"note": "true or false, never null", "flag": False, "quoted": "it's true"}
+
+
+def test_unrepairable_output_raises():
+    with pytest.raises(ValueError):
+        repair_json("no json here")
+
+
+def test_parser_counts_outcomes_and_falls_back_to_the_fixer():
+    class Fixer:
+        def parse(self, text):
+            return {"title": "fixed", "pages": 1}
+
+    parser = RepairingJsonOutputParser(pydantic_object=Summary, fixer=Fixer(), label="test-summary")
+    assert parser.parse('{"title": "clean", "pages": 2}')["title"] == "clean"
+    assert parser.parse("<think>x</think>{'title': 'repaired', 'pages': 2,}")["title"] == "repaired"
+    assert parser.parse('{"title": "wrong type", "pages": "many"}')["title"] == "fixed"
+    assert PARSE_OUTCOMES.snapshot()["test-summary"] == {"clean": 1, "repaired": 1, "llm_fixed": 1, "failed": 0}
+
+    with pytest.raises(OutputParserException):
+        RepairingJsonOutputParser(pydantic_object=Summary, label="test-nofix").parse("nothing")
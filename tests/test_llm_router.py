@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from utils.llm_router import ProviderStats, RoutedChatModel, SimulatedChatModel
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+def _router(hedge=True, **providers):
+    return RoutedChatModel(
+        providers={name: SimulatedChatModel(response=name, **spec) for name, spec in providers.items()},
+        hedge=hedge, hedge_delay_s=0.05, hedge_min_s=0.01, min_samples=2, failure_threshold=2, cooldown_s=0.2
+    )
+
+
+def test_ranking_is_config_order_until_latencies_are_known():
+    router = _router(hedge=False, slow={"latency_s": 0.05}, fast={"latency_s": 0.0})
+    assert router._order() == ["slow", "fast"]
+    assert router._order() == ["slow", "fast"]
+    for _ in range(2):
+        router._stats["slow"].success(0.05)
+        router._stats["fast"].success(0.001)
+    assert router._order() == ["fast", "slow"]
+    assert router.invoke(MESSAGES).content == "fast"
+
+
+def test_sync_hedge_answers_from_the_faster_provider():
+    router = _router(slow={"latency_s": 0.5}, fast={"latency_s": 0.0})
+    started = time.monotonic()
+    assert router.invoke(MESSAGES).content == "fast"
+    assert time.monotonic() - started < 0.4
+
+
+def test_async_hedge_cancels_the_loser():
+    router = _router(slow={"latency_s": 1.0}, fast={"latency_s": 0.0})
+
+    async def main():
+        started = time.monotonic()
+        reply = await router.ainvoke(MESSAGES)
+        await asyncio.sleep(0.01)
+        return reply, time.monotonic() - started
+
+    reply, elapsed = asyncio.run(main())
+    assert reply.content == "fast" and elapsed < 0.5
+    # cancelled after the hedge won: recorded, at least as slow as the winner's whole call
+    slow, fast = router._stats["slow"], router._stats["fast"]
+    assert slow.quantile(0.5) >= fast.quantile(0.5)
+
+
+def test_losing_hedge_call_does_not_look_fast():
+    # "first" answers after 0.1s; the hedge to "second" fires at 0.05s and is cancelled ~0.05s later
+    router = _router(first={"latency_s": 0.1}, second={"latency_s": 1.0})
+
+    async def main():
+        reply = await router.ainvoke(MESSAGES)
+        await asyncio.sleep(0.01)
+        return reply
+
+    assert asyncio.run(main()).content == "first"
+    assert router._stats["second"].quantile(0.5) >= router._stats["first"].quantile(0.5)
+
+
+def test_caller_cancellation_records_no_latency():
+    router = _router(hedge=False, only={"latency_s": 1.0})
+
+    async def main():
+        task = asyncio.ensure_future(router.ainvoke(MESSAGES))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert router.stats()["only"]["samples"] == 0 and router.stats()["only"]["state"] == "closed"
+
+
+def test_circuit_opens_after_failures_and_probes_after_cooldown():
+    router = _router(hedge=False, broken={"latency_s": 0.0, "error_rate": 1.0}, backup={"latency_s": 0.0})
+    for _ in range(2):
+        assert router.invoke(MESSAGES).content == "backup"
+    assert router.stats()["broken"]["state"] == "open"
+    assert router._order() == ["backup"]
+
+    time.sleep(0.25)
+    assert router.stats()["broken"]["state"] == "half_open"
+    assert "broken" in router._order()
+
+
+def test_all_providers_failing_raises():
+    router = _router(hedge=False, a={"error_rate": 1.0, "latency_s": 0.0}, b={"error_rate": 1.0, "latency_s": 0.0})
+    with pytest.raises(RuntimeError, match="All LLM providers failed"):
+        router.invoke(MESSAGES)
+
+
+def test_half_open_circuit_lets_one_trial_through():
+    stats = ProviderStats(failure_threshold=1, cooldown_s=0.0)
+    stats.failure()
+    assert stats.acquire() and not stats.acquire()
+    stats.success(0.01)
+    assert stats.state == "closed"
+
+
+def test_failed_trial_reopens_the_circuit():
+    stats = ProviderStats(failure_threshold=3, cooldown_s=0.0)
+    for _ in range(3):
+        stats.failure()
+    assert stats.acquire()
+    stats.cooldown_s = 60.0
+    stats.failure()
+    assert stats.state == "open" and not stats.acquire()
@@ -0,0 +1,59 @@
+import pytest
+from langchain.schema import Document
+
+from src.document_ingestion.docstore import ChunkStore, compile_filter, normalize_filter
+from src.document_ingestion.vector_store import PortalFAISS
+
+METADATA = [
+    {"source": "data/a.pdf", "page": 0, "session_id": "s1"},
+    {"source": "data/a.pdf", "page": 1, "session_id": "s1"},
+    {"source": "data/a.pdf", "page": 2, "session_id": "s2"},
+    {"source": "data/b.txt", "page": 0, "session_id": "s1"},
+    {"source": "data/b.txt", "page": 1, "session_id": "s2"},
+    {"source": "data/c.docx", "page": 0, "session_id": "s2"},
+]
+
+FILTERS = [
+    {"doc_type": "pdf"},
+    {"page": {"$gte": 1}},
+    {"file_name": ["a.pdf", "c.docx"], "session_id": "s2"},
+    {"session_id": {"$neq": "s1"}},
+    {"source": {"$nin": ["data/a.pdf"]}},
+    {"$or": [{"doc_type": "txt"}, {"page": 2}]},
+    {"$and": [{"doc_type": "pdf"}, {"page": {"$lt": 2}}]},
+    {"$not": {"session_id": "s1"}},
+    # logical operators next to field conditions: every condition applies
+    {"session_id": "s1", "$or": [{"doc_type": "txt"}, {"page": 1}]},
+    {"doc_type": "pdf", "$and": [{"page": {"$gte": 1}}]},
+    {"session_id": "s2", "$not": {"doc_type": "pdf"}},
+    {"page": 0, "$or": [{"session_id": "s2"}, {"$and": [{"doc_type": "txt"}, {"session_id": "s1"}]}]},
+]
+
+
+@pytest.fixture
+def store(tmp_path, embeddings):
+    docs = [Document(id=f"id-{i}", page_content=f"chunk {i}", metadata=md) for i, md in enumerate(METADATA)]
+    vs = PortalFAISS.from_texts([d.page_content for d in docs], embeddings, metadatas=METADATA)
+    chunks = ChunkStore(tmp_path / "docstore.sqlite")
+    chunks.add_chunks(0, docs)
+    chunks.commit()
+    vs.docstore = chunks
+    return vs
+
+
+@pytest.mark.parametrize("filter", FILTERS)
+def test_prefilter_matches_post_filter(store, filter):
+    keep = store._post_filter(filter)
+    expected = [i for i, md in enumerate(METADATA) if keep(md)]
+    assert sorted(store.prefilter_ids(filter).tolist()) == expected
+
+
+def test_sibling_conditions_are_anded():
+    assert normalize_filter({"page": 0, "$or": [{"page": 1}]}) == {"$and": [{"$or": [{"page": 1}]}, {"page": 0}]}
+    sql, params = compile_filter({"page": 0, "$or": [{"session_id": "s1"}, {"session_id": "s2"}]})
+    assert " AND " in sql and params == ["s1", "s2", 0]
+
+
+def test_unknown_fields_are_post_filtered(store):
+    assert compile_filter({"author": "x", "$or": [{"page": 1}]}) is None
+    assert store.prefilter_ids({"page": 1, "$not": {"author": "x"}}) is None
@@ -0,0 +1,70 @@
+import fitz
+import pytest
+
+import utils.parse_cache as parse_cache
+from utils.document_ops import load_documents
+from tests.conftest import make_pdf
+from utils.parse_cache import ParsedTextCache, parser_version, pdf_text, read_pdf_pages
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ParsedTextCache(tmp_path / "cache" / "parsed.sqlite")
+    monkeypatch.setattr(parse_cache, "_CACHE", cache)
+    monkeypatch.setattr(parse_cache, "_CACHE_PID", parse_cache.os.getpid())
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    calls = []
+    parse_pdf = parse_cache.parse_pdf
+
+    def counting(path):
+        calls.append(path)
+        return parse_pdf(path)
+
+    monkeypatch.setattr(parse_cache, "parse_pdf", counting)
+    return calls
+
+
+def test_same_content_is_parsed_once(tmp_path, cache, parses):
+    first = tmp_path / "a.pdf"
+    first.write_bytes(make_pdf(["page one text", "page two text"]).getvalue())
+    copy = tmp_path / "renamed.pdf"
+    copy.write_bytes(first.read_bytes())
+    pages = read_pdf_pages(first)
+    assert read_pdf_pages(copy) == pages and len(parses) == 1
+    assert [p["metadata"]["page"] for p in pages] == [0, 1]
+    assert pages[1]["metadata"] == {"page": 1, "page_label": "2", "total_pages": 2}
+    assert "page two text" in pages[1]["text"]
+
+
+def test_features_share_the_cache(tmp_path, cache, parses):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(make_pdf(["alpha", "beta"]).getvalue())
+    docs = load_documents([path])
+    text = pdf_text(path)
+    assert len(parses) == 1
+    assert [d.metadata["page"] for d in docs] == [0, 1] and docs[0].metadata["source"] == str(path)
+    assert "--Page 1--" in text and "--Page 2--" in text
+
+
+def test_other_parser_versions_are_pruned(cache):
+    cache.put("abc", [{"text": "old", "metadata": {"page": 0}}], parser="pymupdf-0-0")
+    cache.put("abc", [{"text": "new", "metadata": {"page": 0}}])
+    assert cache.get("abc", parser="pymupdf-0-0") is not None
+    assert cache.prune() == 1
+    assert cache.get("abc", parser="pymupdf-0-0") is None
+    assert cache.get("abc")[0]["text"] == "new"
+    assert parser_version().startswith("pymupdf-")
+
+
+def test_encrypted_pdf_is_rejected(tmp_path, cache):
+    path = tmp_path / "locked.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "secret")
+    doc.save(str(path), encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw="o", user_pw="u")
+    with pytest.raises(ValueError):
+        read_pdf_pages(path)
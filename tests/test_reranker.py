@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+
+from src.document_chat.reranker import LocalReranker
+from src.document_ingestion.vector_store import QUERY_VECTORS, PortalFAISS
+
+DOCS = [
+    Document(page_content="car truck bus"),
+    Document(page_content="weekly pump maintenance schedule"),
+    Document(page_content="dog cat mouse"),
+]
+
+
+class CountingEmbeddings(Embeddings):
+    """Wraps the offline embeddings and counts question embeddings."""
+    def __init__(self, inner):
+        self.inner = inner
+        self.model = "counting"
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self.inner.embed_query(text)
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+
+def test_reorders_by_relevance(embeddings):
+    ranked, stats = LocalReranker(embeddings, budget_ms=5000).rerank("pump maintenance", DOCS, 2)
+    assert ranked[0].page_content == "weekly pump maintenance schedule"
+    assert len(ranked) == 2 and stats["fallback"] is False
+
+
+def test_reuses_the_retrievers_question_vector(embeddings):
+    counting = CountingEmbeddings(embeddings)
+    store = PortalFAISS.from_texts([d.page_content for d in DOCS], embeddings)
+    store.embedding_function = counting
+    store.similarity_search("pump schedule", k=3)
+    assert counting.queries == 1
+    LocalReranker(counting, budget_ms=5000).rerank("pump schedule", DOCS, 2)
+    assert counting.queries == 1
+    assert QUERY_VECTORS.get(counting, "pump schedule") is not None
+
+
+def test_scorer_error_keeps_retrieval_order(embeddings):
+    reranker = LocalReranker(embeddings, vector_lookup=lambda docs: 1 / 0)
+    ranked, stats = reranker.rerank("pump", DOCS, 2)
+    assert ranked == DOCS[:2]
+    assert stats["fallback"] is True and "division by zero" in stats["error"]
+
+
+def test_budget_miss_keeps_retrieval_order(embeddings):
+    def slow_lookup(docs):
+        time.sleep(0.3)
+        return None
+
+    reranker = LocalReranker(embeddings, vector_lookup=slow_lookup, budget_ms=20)
+    started = time.perf_counter()
+    ranked, stats = reranker.rerank("pump", DOCS, 2)
+    assert time.perf_counter() - started < 0.25
+    assert ranked == DOCS[:2] and stats["fallback"] is True
+
+
+def test_stored_vectors_are_used(embeddings):
+    vectors = np.array(embeddings.embed_documents([d.page_content for d in DOCS]), dtype=np.float32)
+    ranked, _ = LocalReranker(embeddings, vector_lookup=lambda docs: vectors, lexical_weight=0.0, budget_ms=5000).rerank("dog cat", DOCS, 1)
+    assert ranked[0].page_content == "dog cat mouse"
@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+from model.models import RetrievalOptions
+from src.document_chat.retrieval import ConversationalRAG
+from tests.conftest import build_index
+
+TEXTS = [
+    "apple banana cherry fruit",
+    "apple banana cherry salad",
+    "apple pie recipe",
+    "car truck bus",
+    "dog cat mouse",
+]
+
+
+@pytest.fixture
+def index_dir(tmp_path, model_loader):
+    build_index(tmp_path / "faiss" / "s1", model_loader, TEXTS)
+    return tmp_path / "faiss" / "s1"
+
+
+def test_options_fall_back_to_config():
+    options = RetrievalOptions.from_config({"top_k": 7, "search_type": "mmr", "hybrid": {"vector_weight": 0.2}}, k=3)
+    assert options.k == 3 and options.search_type == "mmr" and options.vector_weight == 0.2
+    assert RetrievalOptions.from_config({}).k == 4
+
+
+@pytest.mark.parametrize("search_type", ["similarity", "mmr"])
+def test_k_is_honored(index_dir, offline_models, search_type):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_faiss(str(index_dir), k=2, search_type=search_type, fetch_k=5)
+    assert len(rag.retriever.invoke("apple banana")) == 2
+
+
+def test_mmr_prefers_diverse_results(index_dir, offline_models):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_faiss(str(index_dir), k=2, search_type="mmr", fetch_k=5, lambda_mult=0.0)
+    contents = [d.page_content for d in rag.retriever.invoke("apple banana cherry")]
+    assert not {TEXTS[0], TEXTS[1]} <= set(contents)
+
+
+def test_score_threshold_drops_weak_hits(index_dir, offline_models):
+    rag = ConversationalRAG(session_id="s1")
+    rag.load_retriever_from_faiss(str(index_dir), k=5, search_type="similarity_score_threshold", score_threshold=0.5)
+    contents = [d.page_content for d in rag.retriever.invoke("dog cat mouse")]
+    assert contents == [TEXTS[4]]
+
+
+def test_chat_query_reports_k_and_rejects_bad_options(index_dir, offline_models, monkeypatch):
+    monkeypatch.setattr(api, "FAISS_BASE", str(index_dir.parent))
+    client = TestClient(api.app)
+    response = client.post("/chat/query", data={"question": "apple", "session_id": "s1", "k": 2})
+    assert response.status_code == 200, response.text
+    assert response.json()["k"] == 2 and response.json()["retrieval"]["k"] == 2
+    assert client.post("/chat/query", data={"question": "apple", "session_id": "s1", "search_type": "nope"}).status_code == 400
+    assert client.post("/chat/query", data={"question": "apple", "session_id": "missing"}).status_code == 404
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.vector_store import PortalFAISS
+from utils.vector_ops import (
+    build_index,
+    compress_vectors,
+    default_pq_m,
+    exact_rerank,
+    index_memory_bytes,
+    measure_recall,
+    min_training_vectors,
+)
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((600, 32)).astype(np.float32)
+
+
+def test_default_pq_m_divides_dim():
+    for dim in (32, 48, 768, 100):
+        m = default_pq_m(dim)
+        assert dim % m == 0 and m <= max(1, dim // 8)
+
+
+@pytest.mark.parametrize("mode", ["sq_fp16", "sq_int8", "pq"])
+def test_compressed_modes_are_smaller(vectors, mode):
+    index = compress_vectors(vectors, mode)
+    assert index.ntotal == len(vectors)
+    assert index_memory_bytes(index) < index_memory_bytes(compress_vectors(vectors, "flat"))
+
+
+def test_exact_rerank_restores_recall(vectors):
+    index = compress_vectors(vectors, "pq")
+    assert measure_recall(index, vectors, k=10, rerank_factor=4) >= measure_recall(index, vectors, k=10)
+    scores, ids = exact_rerank(vectors[3], np.arange(len(vectors)), vectors, 5)
+    assert ids[0] == 3 and scores[0] == pytest.approx(0.0)
+    assert list(scores) == sorted(scores)
+
+
+def test_pq_needs_training_vectors():
+    assert min_training_vectors("pq", 8) == 256
+    assert min_training_vectors("flat") == 0
+    assert build_index(32, "flat").ntotal == 0
+
+
+def _docs(n):
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+    return [Document(page_content=f"{words[i % 10]} {words[(i * 3) % 10]} chunk {i}", metadata={"source": "a.txt", "page": i})
+            for i in range(n)]
+
+
+def test_manager_falls_back_until_mode_can_be_trained(tmp_path, model_loader):
+    fm = FaissManager(tmp_path / "idx", model_loader, storage={"mode": "pq"})
+    docs = _docs(20)
+    fm.load_or_create(texts=[d.page_content for d in docs], metadatas=[d.metadata for d in docs])
+    assert fm.storage_report["effective_mode"] == "sq_fp16"
+    assert fm.storage_report["rerank_factor"] == 4
+
+
+def test_compressed_index_reloads_with_exact_rerank(tmp_path, model_loader, embeddings):
+    fm = FaissManager(tmp_path / "idx", model_loader, storage={"mode": "sq_int8"})
+    docs = _docs(30)
+    fm.load_or_create(texts=[d.page_content for d in docs], metadatas=[d.metadata for d in docs])
+    assert fm.storage_report["effective_mode"] == "sq_int8"
+
+    store = PortalFAISS.load_local(str(tmp_path / "idx"), embeddings)
+    assert store.raw_vectors is not None and store.rerank_factor == 4
+    hit = store.similarity_search(docs[7].page_content, k=1)[0]
+    assert hit.page_content == docs[7].page_content
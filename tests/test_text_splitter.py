@@ -0,0 +1,54 @@
+import pytest
+from langchain.schema import Document
+
+from src.document_ingestion.text_splitter import PageStreamSplitter, get_splitter, length_function
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog. It rests in the sun. Then it runs home again."
+PAGE = "\n\n".join(f"Section {i}. {PARAGRAPH}" for i in range(8))
+
+
+@pytest.mark.parametrize("size,overlap", [(120, 0), (200, 40), (60, 10)])
+def test_chunks_fit_and_offsets_point_into_the_page(size, overlap):
+    chunks = PageStreamSplitter(size, overlap).split_documents([Document(page_content=PAGE, metadata={"page": 3})])
+    assert len(chunks) > 1
+    for chunk in chunks:
+        md = chunk.metadata
+        assert len(chunk.page_content) <= size
+        assert PAGE[md["start_index"]:md["end_index"]] == chunk.page_content
+        assert md["page"] == 3
+        assert chunk.page_content == chunk.page_content.strip()
+    # every word of the page lands in some chunk
+    assert set(PAGE.split()) <= {w for c in chunks for w in c.page_content.split()}
+
+
+def test_paragraph_boundaries_are_preferred():
+    chunks = PageStreamSplitter(len(f"Section 0. {PARAGRAPH}") + 5, 0).split_text(PAGE)
+    assert all(PAGE[start:end].startswith("Section") for start, end in chunks)
+
+
+def test_overlap_carries_whole_pieces_up_to_chunk_overlap():
+    spans = PageStreamSplitter(100, 40).split_text(PAGE)
+    overlaps = [a[1] - b[0] for a, b in zip(spans, spans[1:])]
+    assert max(overlaps) <= 40 and any(o > 0 for o in overlaps)
+
+
+def test_pages_are_never_joined():
+    pages = [Document(page_content="short first page", metadata={"page": 0}),
+             Document(page_content="short second page", metadata={"page": 1})]
+    chunks = PageStreamSplitter(1000, 0).split_documents(pages)
+    assert [(c.page_content, c.metadata["page"]) for c in chunks] == [("short first page", 0), ("short second page", 1)]
+
+
+def test_text_without_whitespace_is_cut_hard():
+    spans = PageStreamSplitter(50, 0).split_text("x" * 175)
+    assert [end - start for start, end in spans] == [50, 50, 50, 25]
+
+
+def test_token_sizes_and_validation():
+    chunks = PageStreamSplitter(30, 5, length_unit="tokens").split_text(PAGE)
+    assert all(length_function("tokens")(PAGE[a:b]) <= 30 for a, b in chunks)
+    with pytest.raises(ValueError):
+        PageStreamSplitter(100, 100)
+    with pytest.raises(ValueError):
+        length_function("words")
+    assert get_splitter(100, 10) is get_splitter(100, 10)
@@ -0,0 +1,74 @@
+import pickle
+
+import faiss
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from src.document_chat.index_cache import IndexCache
+from src.document_ingestion.data_ingestion import FaissManager
+from src.document_ingestion.docstore import DOCSTORE_FILE, ChunkStore
+from src.document_ingestion.vector_store import DEFAULT_MMAP, PortalFAISS, mmap_enabled
+from tests.conftest import FakeModelLoader
+
+TEXTS = ["apple banana cherry", "dog cat mouse", "car truck bus"]
+
+
+def _build(path, embeddings):
+    store = PortalFAISS.from_texts(TEXTS, embeddings, metadatas=[{"source": "a.txt", "page": i} for i in range(3)])
+    store.save_local(str(path))
+    return store
+
+
+def test_save_writes_sqlite_docstore_not_pickle(tmp_path, embeddings):
+    _build(tmp_path, embeddings)
+    assert (tmp_path / DOCSTORE_FILE).exists()
+    assert not (tmp_path / "index.pkl").exists()
+    store = PortalFAISS.load_local(str(tmp_path), embeddings)
+    assert isinstance(store.docstore, ChunkStore)
+    assert store.similarity_search("dog cat", k=1)[0].page_content == "dog cat mouse"
+
+
+def test_mmap_store_becomes_writable_on_add(tmp_path, embeddings):
+    _build(tmp_path, embeddings)
+    store = PortalFAISS.load_local(str(tmp_path), embeddings, mmap=True)
+    assert store.mmapped
+    store.add_texts(["red green blue"], metadatas=[{"source": "b.txt", "page": 0}])
+    assert not store.mmapped and store.index.ntotal == 4
+    store.save_local(str(tmp_path))
+    reloaded = PortalFAISS.load_local(str(tmp_path), embeddings, mmap=True)
+    assert reloaded.similarity_search("red green", k=1)[0].page_content == "red green blue"
+
+
+def test_legacy_pickle_is_migrated_once(tmp_path, embeddings):
+    FAISS.from_texts(TEXTS, embeddings).save_local(str(tmp_path))
+    assert (tmp_path / "index.pkl").exists()
+    store = PortalFAISS.load_local(str(tmp_path), embeddings, allow_dangerous_deserialization=True)
+    assert not (tmp_path / "index.pkl").exists() and (tmp_path / DOCSTORE_FILE).exists()
+    assert store.similarity_search("car truck", k=1)[0].page_content == "car truck bus"
+
+
+def test_chunks_are_read_on_demand(tmp_path, embeddings):
+    _build(tmp_path, embeddings)
+    store = PortalFAISS.load_local(str(tmp_path), embeddings, cache_size=1)
+    docs = store.materialize([2, 0])
+    assert [d.page_content for d in docs] == [TEXTS[2], TEXTS[0]]
+    assert len(store.docstore._cache) == 1
+
+
+def test_one_mmap_default_for_writers_and_readers(tmp_path, embeddings):
+    assert mmap_enabled({}) is DEFAULT_MMAP
+    assert mmap_enabled({"mmap": False}) is False
+    loader = FakeModelLoader(embeddings)
+    loader.config["faiss"].pop("mmap", None)
+    assert FaissManager(tmp_path / "idx", loader).mmap is DEFAULT_MMAP
+
+
+def test_index_cache_reopens_changed_index(tmp_path, embeddings):
+    store = _build(tmp_path, embeddings)
+    cache = IndexCache(max_size=2)
+    first = cache.get(tmp_path, embeddings)
+    assert cache.get(tmp_path, embeddings) is first
+    store.add_texts(["red green blue"])
+    store.save_local(str(tmp_path))
+    second = cache.get(tmp_path, embeddings)
+    assert second is not first and second.index.ntotal == 4
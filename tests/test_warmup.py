@@ -0,0 +1,150 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.main as api
+from utils.warmup import DONE, FAILED, PENDING, SKIPPED, WarmUp
+
+
+def _stage(calls, name, error=None):
+    def stage(progress):
+        calls.append(name)
+        progress(step=name)
+        if error:
+            raise RuntimeError(error)
+    return stage
+
+
+def test_stages_run_in_order_and_report_details():
+    calls = []
+    warmup = WarmUp()
+    warmup.add("config", _stage(calls, "config"))
+    warmup.add("models", _stage(calls, "models"))
+    assert warmup.status() == "pending" and not warmup.ready
+    warmup.run()
+    report = warmup.report()
+    assert calls == ["config", "models"] and report["ready"] and report["finished"]
+    assert report["stages"]["models"]["status"] == DONE and report["stages"]["models"]["step"] == "models"
+
+
+def test_failed_required_stage_skips_the_rest_and_stays_unready():
+    calls = []
+    warmup = WarmUp()
+    warmup.add("config", _stage(calls, "config"))
+    warmup.add("models", _stage(calls, "models", error="no api key"))
+    warmup.add("pools", _stage(calls, "pools"))
+    warmup.run()
+    assert calls == ["config", "models"]
+    stages = warmup.report()["stages"]
+    assert stages["models"]["status"] == FAILED and stages["models"]["error"] == "no api key"
+    assert stages["pools"] == {**stages["pools"], "status": SKIPPED, "reason": "models failed"}
+    assert warmup.status() == "failed" and not warmup.ready
+
+
+def test_optional_stage_does_not_block_readiness():
+    calls = []
+    warmup = WarmUp()
+    warmup.add("models", _stage(calls, "models"))
+    warmup.add("indexes", _stage(calls, "indexes", error="missing"), required=False)
+    warmup.run()
+    assert warmup.ready and warmup.report()["stages"]["indexes"]["status"] == FAILED
+
+
+def test_optional_stage_may_still_run_once_ready():
+    release = threading.Event()
+    warmup = WarmUp()
+    warmup.add("models", lambda progress: None)
+    warmup.add("indexes", lambda progress: release.wait(5), required=False)
+    thread = threading.Thread(target=warmup.run)
+    thread.start()
+    try:
+        while warmup.stages["models"]["status"] != DONE:
+            threading.Event().wait(0.01)
+        assert warmup.ready and not warmup.report()["finished"]
+    finally:
+        release.set()
+        thread.join()
+    assert warmup.report()["finished"]
+
+
+def test_stop_interrupts_the_running_stage_and_skips_the_rest():
+    started = threading.Event()
+
+    def slow(progress):
+        started.set()
+        while True:
+            progress()
+            threading.Event().wait(0.01)
+
+    warmup = WarmUp()
+    warmup.add("slow", slow)
+    warmup.add("after", lambda progress: None)
+
+    async def main():
+        await warmup.start()
+        await asyncio.to_thread(started.wait, 5)
+        await warmup.stop()
+
+    asyncio.run(main())
+    stages = warmup.report()["stages"]
+    assert stages["slow"]["status"] == FAILED and stages["after"]["status"] == SKIPPED
+
+
+def test_disabled_warmup_is_ready_without_running():
+    warmup = WarmUp({"enabled": False})
+    warmup.add("models", lambda progress: pytest.fail("ran"))
+    asyncio.run(warmup.start())
+    assert warmup.ready and warmup.status() == "disabled"
+    assert warmup.stages["models"]["status"] == PENDING
+
+
+def test_ready_endpoint(offline_models, monkeypatch):
+    warmup = WarmUp()
+    warmup.add("models", lambda progress: progress(models=1))
+    monkeypatch.setattr(api, "_warmup", lambda: warmup)
+    client = TestClient(api.app)
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["status"] == "pending"
+    assert client.get("/health").status_code == 200
+
+    warmup.run()
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready" and response.json()["stages"]["models"]["models"] == 1
+
+
+def test_app_warmup_stages_run_offline(offline_models, monkeypatch):
+    api._warmup.cache_clear()
+    monkeypatch.setattr(api, "_config", lambda: {**api.load_config(), "warmup": {"pool_workers": False}})
+    try:
+        warmup = api._warmup()
+        assert list(warmup.stages) == ["config", "modules", "models", "pools", "indexes"]
+        assert not warmup.stages["indexes"]["required"]
+        warmup.run()
+        assert warmup.ready, warmup.report()
+    finally:
+        api._warmup.cache_clear()
+        api._jobs.cache_clear()
+
+
+class _Recorder:
+    def __init__(self, name, calls):
+        self.name, self.calls = name, calls
+        self.config = {"enabled": True}
+
+    async def start(self):
+        self.calls.append(f"{self.name}.start")
+
+    async def stop(self):
+        self.calls.append(f"{self.name}.stop")
+
+
+def test_lifespan_starts_jobs_then_warmup_and_stops_in_reverse(monkeypatch):
+    calls = []
+    monkeypatch.setattr(api, "_jobs", lambda: _Recorder("jobs", calls))
+    monkeypatch.setattr(api, "_warmup", lambda: _Recorder("warmup", calls))
+    with TestClient(api.app):
+        assert calls == ["jobs.start", "warmup.start"]
+    assert calls == ["jobs.start", "warmup.start", "warmup.stop", "jobs.stop"]
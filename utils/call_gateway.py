@@ -0,0 +1,305 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+from logger import GLOBAL_LOGGER as log
+from utils.token_utils import estimate_tokens
+
+T = TypeVar("T")
+
+DEFAULT_GATEWAY = {"enabled": True, "coalesce": True, "acquire_timeout_s": 60.0, "limits": {}}
+
+
+class GatewayTimeout(TimeoutError):
+    """No provider slot / token budget became free within acquire_timeout_s."""
+
+
+class _LeaderCancelled(Exception):
+    """Set on a coalesced call whose leader went away; its followers take the call over instead of failing."""
+
+
+class ProviderGate:
+    """
+    Concurrency cap plus token-per-minute bucket for one provider. A call takes a slot and
+    its estimated tokens up front; waiting callers queue here instead of collecting 429s.
+    """
+    def __init__(self, name: str, max_concurrent: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.tokens_per_minute = tokens_per_minute
+        self.in_flight = 0
+        self.tokens = float(tokens_per_minute or 0)
+        self.refilled_at = time.monotonic()
+        self.waited_s = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            self.tokens = min(self.tokens_per_minute, self.tokens + (now - self.refilled_at) * self.tokens_per_minute / 60.0)
+        self.refilled_at = now
+
+    def _try(self, tokens: int) -> float:
+        """Take a slot now (0.0) or return how long to wait before trying again; called under the lock."""
+        self._refill()
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return 0.05
+        if self.tokens_per_minute:
+            # a call larger than the whole budget waits for a full bucket rather than forever
+            tokens = min(tokens, self.tokens_per_minute)
+            if self.tokens < tokens:
+                return (tokens - self.tokens) * 60.0 / self.tokens_per_minute
+            self.tokens -= tokens
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, tokens: int, timeout: Optional[float] = None) -> None:
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._try(tokens)
+                if not wait:
+                    break
+                if timeout is not None and time.monotonic() - started + wait > timeout:
+                    raise GatewayTimeout(f"No capacity for provider '{self.name}' within {timeout}s")
+                self._cond.wait(wait)
+            self.waited_s += time.monotonic() - started
+
+    async def aacquire(self, tokens: int, timeout: Optional[float] = None) -> None:
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._try(tokens)
+                if not wait:
+                    self.waited_s += time.monotonic() - started
+                    return
+            if timeout is not None and time.monotonic() - started + wait > timeout:
+                raise GatewayTimeout(f"No capacity for provider '{self.name}' within {timeout}s")
+            await asyncio.sleep(min(wait, 0.25))
+
+    def release(self, refund: int = 0) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if self.tokens_per_minute and refund > 0:
+                self.tokens = min(self.tokens_per_minute, self.tokens + refund)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill()
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "tokens_available": round(self.tokens) if self.tokens_per_minute else None,
+                "tokens_per_minute": self.tokens_per_minute,
+                "waited_s": round(self.waited_s, 3),
+            }
+
+
+class CallGateway:
+    """
+    Process-wide gate for provider calls made by ModelLoader clients (config.yaml -> gateway):
+    per-provider concurrency + token budget, and single-flight coalescing so concurrent identical
+    calls (same provider, same input) share one in-flight request.
+    """
+    def __init__(self):
+        self.config: Dict[str, Any] = dict(DEFAULT_GATEWAY)
+        self._gates: Dict[str, ProviderGate] = {}
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        with self._lock:
+            self.config = {**DEFAULT_GATEWAY, **(config or {})}
+            for name, limits in (self.config.get("limits") or {}).items():
+                limits = limits or {}
+                gate = self._gates.get(name)
+                if gate is None or (gate.max_concurrent, gate.tokens_per_minute) != (limits.get("max_concurrent"), limits.get("tokens_per_minute")):
+                    self._gates[name] = ProviderGate(name, limits.get("max_concurrent"), limits.get("tokens_per_minute"))
+                    log.info("Provider limits configured", provider=name, **limits)
+
+    def gate(self, provider: str) -> ProviderGate:
+        with self._lock:
+            if provider not in self._gates:
+                self._gates[provider] = ProviderGate(provider)
+            return self._gates[provider]
+
+    @staticmethod
+    def key(provider: str, payload: Any) -> str:
+        return provider + ":" + hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _join(self, key: Optional[str]) -> Tuple[Future, bool]:
+        """The in-flight future for `key` and whether this caller leads (runs the call)."""
+        with self._lock:
+            current = self._in_flight.get(key) if key is not None else None
+            if current is not None and not current.done() and self.config.get("coalesce", True):
+                self.coalesced += 1
+                return current, False
+            future: Future = Future()
+            if key is not None:
+                self._in_flight[key] = future
+            return future, True
+
+    def _done(self, key: Optional[str], future: Future) -> None:
+        with self._lock:
+            if key is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def call(self, provider: str, key: Optional[str], tokens: int, fn: Callable[[], T], used: Callable[[T], int] = lambda _: 0) -> T:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderCancelled:
+                continue
+        gate = self.gate(provider)
+        try:
+            gate.acquire(tokens, self.config.get("acquire_timeout_s"))
+            refund = 0
+            try:
+                result = fn()
+                actual = used(result)
+                refund = tokens - actual if actual else 0
+            finally:
+                gate.release(refund)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else _LeaderCancelled("Coalesced call was interrupted"))
+            raise
+        finally:
+            self._done(key, future)
+
+    async def acall(self, provider: str, key: Optional[str], tokens: int, fn: Callable[[], Awaitable[T]], used: Callable[[T], int] = lambda _: 0) -> T:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shield: a follower going away must not cancel the call the others wait on
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                # the leader was cancelled: the first follower back runs the call again, the rest join it
+                continue
+        gate = self.gate(provider)
+        try:
+            await gate.aacquire(tokens, self.config.get("acquire_timeout_s"))
+            refund = 0
+            try:
+                result = await fn()
+                actual = used(result)
+                refund = tokens - actual if actual else 0
+            finally:
+                gate.release(refund)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else _LeaderCancelled("Coalesced call was cancelled"))
+            raise
+        finally:
+            self._done(key, future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            gates = dict(self._gates)
+            coalesced = self.coalesced
+        return {"coalesced": coalesced, "providers": {name: gate.snapshot() for name, gate in gates.items()}}
+
+
+GATEWAY = CallGateway()
+
+
+def _message_payload(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Any:
+    return [[m.type, m.content] for m in messages], stop, kwargs
+
+
+def _usage(result: ChatResult) -> int:
+    usage = getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+    return int(usage.get("total_tokens", 0)) if usage else 0
+
+
+class GatedChatModel(BaseChatModel):
+    """Chat model whose calls go through GATEWAY under `provider`'s limits (reserving prompt + max output tokens)."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: BaseChatModel
+    provider: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gated-{getattr(self.model, '_llm_type', 'chat')}"
+
+    def _reserve(self, messages: List[BaseMessage]) -> int:
+        prompt = sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+        max_output = getattr(self.model, "max_tokens", None) or getattr(self.model, "max_output_tokens", None)
+        return prompt + int(max_output or 0)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = GATEWAY.key(self.provider, _message_payload(messages, stop, kwargs))
+        return GATEWAY.call(
+            self.provider, key, self._reserve(messages),
+            lambda: ChatResult(generations=[ChatGeneration(message=self.model.invoke(messages, stop=stop, **kwargs))]),
+            _usage,
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        key = GATEWAY.key(self.provider, _message_payload(messages, stop, kwargs))
+
+        async def run() -> ChatResult:
+            return ChatResult(generations=[ChatGeneration(message=await self.model.ainvoke(messages, stop=stop, **kwargs))])
+
+        return await GATEWAY.acall(self.provider, key, self._reserve(messages), run, _usage)
+
+
+class GatedEmbeddings(Embeddings):
+    """Embeddings whose calls go through GATEWAY under `provider`'s limits; identical concurrent batches share one call."""
+    def __init__(self, embeddings: Embeddings, provider: str = "embedding"):
+        self.embeddings = embeddings
+        self.provider = provider
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.embeddings, name)
+
+    def _tokens(self, texts: List[str]) -> int:
+        return sum(estimate_tokens(t) for t in texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        return GATEWAY.call(self.provider, GATEWAY.key(self.provider, texts), self._tokens(texts), lambda: self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return GATEWAY.call(self.provider, GATEWAY.key(self.provider, ["q", text]), estimate_tokens(text), lambda: self.embeddings.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        return await GATEWAY.acall(self.provider, GATEWAY.key(self.provider, texts), self._tokens(texts), lambda: self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await GATEWAY.acall(self.provider, GATEWAY.key(self.provider, ["q", text]), estimate_tokens(text), lambda: self.embeddings.aembed_query(text))
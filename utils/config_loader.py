@@ -1,8 +1,27 @@
+import copy
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
 import yaml
 
-def load_config(config_path : str = r"config\config.yaml") -> dict:
-    with open(config_path,"r") as file:
-        config = yaml.safe_load(file)
-    #print(config)
-    return config
-load_config(r"config\config.yaml")
\ No newline at end of file
+# the repo's config/config.yaml, wherever the process was started from
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "config" / "config.yaml"
+
+# parsed config per path, re-read only when the file changes
+_PARSED: Dict[str, Tuple[int, dict]] = {}
+_PARSED_LOCK = threading.Lock()
+
+def load_config(config_path : Optional[str] = None) -> dict:
+    """config.yaml (config/config.yaml by default) as a dict; each caller gets its own copy, so it can be changed freely."""
+    config_path = str(config_path or CONFIG_PATH)
+    mtime_ns = os.stat(config_path).st_mtime_ns
+    with _PARSED_LOCK:
+        cached = _PARSED.get(config_path)
+        if cached is None or cached[0] != mtime_ns:
+            with open(config_path,"r") as file:
+                config = yaml.safe_load(file)
+            #print(config)
+            cached = _PARSED[config_path] = (mtime_ns, config)
+    return copy.deepcopy(cached[1])
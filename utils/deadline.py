@@ -0,0 +1,96 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from logger import GLOBAL_LOGGER as log
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A request ran out of time; `stage` is where, `timings` what every stage took until then."""
+    def __init__(self, stage: str, budget_s: Optional[float], timings: Dict[str, float]):
+        self.stage = stage
+        self.budget_s = budget_s
+        self.timings = timings
+        super().__init__(f"Deadline exceeded in stage '{stage}' (budget {budget_s}s)")
+
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away before the response was ready; its work was cancelled."""
+
+
+class Deadline:
+    """
+    Time budget of one request, shared by its stages (LLM generation, output repair, retrieval...).
+    Each stage runs as a task cancelled when the request budget or its own stage cap runs out,
+    which also aborts the in-flight provider call instead of letting it finish unused.
+    """
+    def __init__(self, seconds: Optional[float] = None, stage_limits: Optional[Dict[str, float]] = None):
+        self.seconds = seconds
+        self.stage_limits = dict(stage_limits or {})
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], name: str, seconds: Optional[float] = None) -> "Deadline":
+        """config.yaml -> deadlines: request budget by endpoint `name` (overridable) and stage caps."""
+        deadlines = config.get("deadlines", {}) or {}
+        return cls(seconds if seconds is not None else deadlines.get(name), deadlines.get("stages"))
+
+    def remaining(self) -> Optional[float]:
+        if self.seconds is None:
+            return None
+        return self.seconds - (time.monotonic() - self.started)
+
+    def _timeout(self, stage: str) -> Optional[float]:
+        limits = [t for t in (self.remaining(), self.stage_limits.get(stage)) if t is not None]
+        return min(limits) if limits else None
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        timeout = self._timeout(stage)
+        started = time.monotonic()
+        try:
+            if timeout is not None and timeout <= 0:
+                if asyncio.iscoroutine(awaitable):
+                    awaitable.close()
+                raise asyncio.TimeoutError
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.timings[stage] = round((time.monotonic() - started) * 1000, 1)
+            log.warning("Request stage timed out", stage=stage, timeout_s=timeout, timings_ms=self.timings)
+            raise DeadlineExceeded(stage, timeout, dict(self.timings)) from None
+        finally:
+            self.timings.setdefault(stage, round((time.monotonic() - started) * 1000, 1))
+
+    async def run_sync(self, stage: str, fn: Callable[..., T], *args: Any) -> T:
+        """Blocking work (parsing, local scoring) on a worker thread; the request stops waiting at the deadline."""
+        return await self.run(stage, asyncio.to_thread(fn, *args))
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget_s": self.seconds,
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000, 1),
+            "stages_ms": dict(self.timings),
+        }
+
+
+async def run_until_disconnect(is_disconnected: Callable[[], Awaitable[bool]], awaitable: Awaitable[T], poll_s: float = 0.5) -> T:
+    """
+    Await `awaitable` while polling the client connection (e.g. Starlette Request.is_disconnected);
+    if the client goes away the work is cancelled and ClientDisconnected raised.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_s)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                task.cancel()
+                log.warning("Client disconnected, request work cancelled")
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
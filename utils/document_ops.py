@@ -1,11 +1,13 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Iterable, List
-from fastapi import UploadFile
+from typing import TYPE_CHECKING, Iterable, List
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
+from utils.parse_cache import read_pdf_pages
+
+if TYPE_CHECKING:
+    from fastapi import UploadFile
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
 
@@ -16,10 +18,17 @@ def load_documents(paths: Iterable[Path]) -> List[Document]:
         for p in paths:
             ext = p.suffix.lower()
             if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
+                # one Document per page, from the parsed-text cache shared with analysis / comparison
+                docs.extend(
+                    Document(page_content=page["text"], metadata={"source": str(p), **page["metadata"]})
+                    for page in read_pdf_pages(p)
+                )
+                continue
             elif ext == ".docx":
+                from langchain_community.document_loaders import Docx2txtLoader
                 loader = Docx2txtLoader(str(p))
             elif ext == ".txt":
+                from langchain_community.document_loaders import TextLoader
                 loader = TextLoader(str(p), encoding="utf-8")
             else:
                 log.warning("Unsupported extension skipped", path=str(p))
@@ -1,11 +1,13 @@
 from __future__ import annotations
+import hashlib
+import os
 import re
 import uuid
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import uuid
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import DocumentPortalException
 
@@ -18,8 +20,58 @@ def generate_session_id(prefix: str = "session") -> str:
     ist = ZoneInfo("Asia/Kolkata")
     return f"{prefix}_{datetime.now(ist).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
-    """Save uploaded files (Streamlit-like) and return local paths."""
+def file_sha256(path, chunk_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's bytes, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def fsync_dir(path) -> None:
+    """Make a rename/creation in directory `path` durable (POSIX; a no-op where directories can't be opened)."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def fsync_file(path) -> None:
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+def replace_durably(tmp_path, path) -> None:
+    """Flush `tmp_path` to disk, then atomically rename it over `path`: readers see the old or the new file, never a torn one."""
+    fsync_file(tmp_path)
+    os.replace(tmp_path, path)
+    fsync_dir(Path(path).parent)
+
+def atomic_write(path, data: bytes) -> None:
+    """Write `data` to `path` via a temp file + fsync + rename."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
+
+class StoredUpload:
+    """An upload already on disk (e.g. kept by a queued job), readable again like the original upload."""
+    def __init__(self, path, name: Optional[str] = None):
+        self.path = Path(path)
+        self.name = name or self.path.name
+    def read(self) -> bytes:
+        return self.path.read_bytes()
+
+def save_uploaded_files(uploaded_files: Iterable, target_dir: Path, names: Optional[Dict[str, str]] = None) -> List[Path]:
+    """Save uploaded files (Streamlit-like) and return local paths; `names` collects saved path -> uploaded name."""
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
         saved: List[Path] = []
@@ -37,9 +89,13 @@ def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path
             with open(out, "wb") as f:
                 if hasattr(uf, "read"):
                     f.write(uf.read())
-                else:
+                elif hasattr(uf, "getbuffer"):
                     f.write(uf.getbuffer())  # fallback
+                else:
+                    f.write(uf.get_buffer())  # api FastAPIFileAdapter
             saved.append(out)
+            if names is not None:
+                names[str(out)] = name
             log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
         return saved
     except Exception as e:
@@ -0,0 +1,86 @@
+"""
+Import-time budget for the service entry points (config.yaml -> import_budget).
+
+    python -m utils.import_budget              # every configured module
+    python -m utils.import_budget api.main     # just these
+
+Each module is imported in a fresh interpreter with `python -X importtime`. The check fails when
+the cumulative import time (best of `runs`) is over its budget, or when a module that has to stay
+deferred (provider SDKs, FAISS, pandas, PDF parsers) got imported. Exit status 1 on failure.
+"""
+from __future__ import annotations
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.config_loader import load_config
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_IMPORT_BUDGET = {
+    "runs": 3,
+    "modules": {"api.main": 800},
+    "deferred": ["langchain_google_genai", "langchain_groq", "langchain_community", "faiss", "pandas", "fitz", "pypdf"],
+}
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """Cumulative microseconds per imported module from `-X importtime` output."""
+    cumulative: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, total_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        cumulative[name] = int(total_us)
+    return cumulative
+
+
+def measure_import(module: str) -> Dict[str, int]:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def check_module(module: str, budget_ms: float, deferred: List[str], runs: int = 3) -> Dict[str, Any]:
+    best: Optional[Dict[str, int]] = None
+    for _ in range(max(1, runs)):
+        timings = measure_import(module)
+        if best is None or timings[module] < best[module]:
+            best = timings
+    imported_ms = round(best[module] / 1000, 1)
+    loaded = sorted(name for name in deferred if name in best)
+    return {
+        "module": module,
+        "import_ms": imported_ms,
+        "budget_ms": budget_ms,
+        "deferred_imported": loaded,
+        "slowest": sorted(((name, round(us / 1000, 1)) for name, us in best.items() if name != module),
+                          key=lambda item: -item[1])[:5],
+        "ok": imported_ms <= budget_ms and not loaded,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    config = {**DEFAULT_IMPORT_BUDGET, **(load_config().get("import_budget", {}) or {})}
+    modules: Dict[str, float] = config["modules"]
+    selected = (argv if argv is not None else sys.argv[1:]) or list(modules)
+    failed = False
+    for module in selected:
+        report = check_module(module, modules.get(module, max(modules.values())), config["deferred"], config["runs"])
+        failed |= not report["ok"]
+        print(f"{'OK  ' if report['ok'] else 'FAIL'} {module}: {report['import_ms']} ms (budget {report['budget_ms']} ms)")
+        if report["deferred_imported"]:
+            print(f"     imported at startup, should be deferred: {', '.join(report['deferred_imported'])}")
+        print("     slowest: " + ", ".join(f"{name} {ms} ms" for name, ms in report["slowest"]))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
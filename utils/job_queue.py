@@ -0,0 +1,340 @@
+from __future__ import annotations
+import asyncio
+import inspect
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_JOBS_PATH = "data/jobs.sqlite"
+DEFAULT_JOBS = {
+    "enabled": True,
+    "path": DEFAULT_JOBS_PATH,
+    "files_dir": "data/jobs",
+    "workers": 4,
+    "tenant_max_running": 2,
+    "max_attempts": 3,
+    "poll_interval_s": 1.0,
+    "stale_after_s": 60.0,
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+TERMINAL = (SUCCEEDED, FAILED, CANCELLED)
+
+Job = Dict[str, Any]
+Progress = Callable[..., None]
+Handler = Callable[[str, Dict[str, Any], Progress], Union[Any, Awaitable[Any]]]
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once cancellation was requested; the job ends as cancelled."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """
+    Persistent job table in SQLite (WAL), shared by every worker process on the host.
+    A job is claimed atomically (BEGIN IMMEDIATE), highest priority first then FIFO, skipping tenants
+    already at their running limit. Running jobs carry a heartbeat; a job whose heartbeat went stale
+    (its process died) is queued again, up to max_attempts.
+    """
+    _COLUMNS = (
+        "id", "kind", "tenant", "priority", "status", "payload", "result", "error", "progress",
+        "attempts", "cancel_requested", "worker", "created_at", "started_at", "finished_at", "updated_at",
+    )
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_JOBS_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, kind TEXT NOT NULL, "
+                "tenant TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, "
+                "payload TEXT NOT NULL, result TEXT, error TEXT, progress TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, worker TEXT, heartbeat REAL, "
+                "created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT, updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs (tenant, status)")
+
+    def _row(self, row: Optional[tuple]) -> Optional[Job]:
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        for field in ("payload", "result", "progress"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, kind: str, payload: Dict[str, Any], tenant: str = "default", priority: int = 0, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = _now()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, tenant, priority, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, tenant, priority, QUEUED, json.dumps(payload), now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def list(self, tenant: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+        clauses, args = [], []
+        for column, value in (("tenant", tenant), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs {where} ORDER BY seq DESC LIMIT ?", (*args, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, worker: str, tenant_max_running: Optional[int] = None) -> Optional[Job]:
+        """Take the next runnable job (priority, then submission order) and mark it running."""
+        limit = tenant_max_running or -1
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs j WHERE status = ? AND (? < 0 OR "
+                    "(SELECT COUNT(*) FROM jobs r WHERE r.tenant = j.tenant AND r.status = ?) < ?) "
+                    "ORDER BY priority DESC, seq LIMIT 1",
+                    (QUEUED, limit, RUNNING, limit),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                now = _now()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1, "
+                    "started_at = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, worker, time.time(), now, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat = ? WHERE status = ? AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), RUNNING, *job_ids),
+            )
+
+    def progress(self, job_id: str, progress: Dict[str, Any]) -> bool:
+        """Store the job's latest progress; returns whether cancellation was requested."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(progress, default=str), time.time(), _now(), job_id),
+            )
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        now = _now()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result, default=str) if result is not None else None, error, now, now, job_id),
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job now, or flag a running one for its worker; returns the job status after the call."""
+        now = _now()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, now, now, job_id, QUEUED),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?", (now, job_id, RUNNING)
+            )
+        job = self.get(job_id)
+        return job["status"] if job else None
+
+    def requeue_stale(self, stale_after_s: float, max_attempts: int) -> int:
+        """Jobs left running by a dead worker process go back to the queue, or fail once out of attempts."""
+        cutoff = time.time() - stale_after_s
+        now = _now()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                failed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? "
+                    "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                    (FAILED, "Worker stopped while running the job (attempts exhausted)", now, now, RUNNING, cutoff, max_attempts),
+                ).rowcount
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, updated_at = ? WHERE status = ? AND heartbeat < ?",
+                    (QUEUED, now, RUNNING, cutoff),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if failed or requeued:
+            log.warning("Stale jobs recovered", requeued=requeued, failed=failed)
+        return requeued
+
+    def release(self, worker: str) -> int:
+        """Queue again the jobs `worker` was running, without counting the interrupted attempt."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, attempts = MAX(attempts - 1, 0), updated_at = ? "
+                "WHERE status = ? AND worker = ?",
+                (QUEUED, _now(), RUNNING, worker),
+            ).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    Background execution of long-running work (config.yaml -> jobs). Handlers are registered by job
+    kind and called as handler(job_id, payload, progress); coroutine handlers run on the event loop,
+    plain functions on a worker thread. `progress(stage, **details)` records progress and raises
+    JobCancelled once the job was cancelled. Job input files live under files_dir/<job id> so a job
+    queued before a restart still finds them; they are removed when the job ends.
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_JOBS, **(config or {})}
+        self.store = JobStore(self.config["path"])
+        self.files_base = Path(self.config["files_dir"])
+        self.handlers: Dict[str, Handler] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self.handlers[kind] = handler
+
+    def files_dir(self, job_id: str) -> Path:
+        return self.files_base / job_id
+
+    def submit(self, kind: str, payload: Dict[str, Any], tenant: str = "default", priority: int = 0, job_id: Optional[str] = None) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.submit(kind, payload, tenant=tenant, priority=priority, job_id=job_id)
+        log.info("Job queued", job_id=job_id, kind=kind, tenant=tenant, priority=priority)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        status = self.store.cancel(job_id)
+        task = self._running.get(job_id)
+        job = self.store.get(job_id) if task is not None else None
+        # coroutine handlers stop at once; thread handlers at their next progress call
+        if job is not None and inspect.iscoroutinefunction(self.handlers.get(job["kind"])):
+            task.cancel()
+        return status
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self.store.requeue_stale(self.config["stale_after_s"], self.config["max_attempts"])
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(max(1, self.config["workers"]))]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        log.info("Job workers started", workers=self.config["workers"], worker=self.worker_id, kinds=sorted(self.handlers))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # jobs interrupted by the shutdown start over on the next start, here or in another process
+        released = self.store.release(self.worker_id)
+        if released:
+            log.info("Running jobs returned to the queue", jobs=released, worker=self.worker_id)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.config["poll_interval_s"])
+            self.store.heartbeat(list(self._running))
+            self.store.requeue_stale(self.config["stale_after_s"], self.config["max_attempts"])
+
+    async def _worker(self, slot: int) -> None:
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.worker_id, self.config["tenant_max_running"])
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.config["poll_interval_s"])
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._run(job))
+            self._running[job["id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # the worker itself is stopping: leave the job to be recovered
+                    task.cancel()
+                    raise
+            finally:
+                self._running.pop(job["id"], None)
+            # a finished job may unblock its tenant's next one
+            self._wakeup.set()
+
+    def _progress(self, job_id: str, started: float) -> Progress:
+        def progress(stage: str, **details: Any) -> None:
+            cancelled = self.store.progress(job_id, {"stage": stage, "elapsed_s": round(time.monotonic() - started, 2), **details})
+            if cancelled:
+                raise JobCancelled(job_id)
+        return progress
+
+    async def _run(self, job: Job) -> None:
+        job_id, kind = job["id"], job["kind"]
+        started = time.monotonic()
+        handler = self.handlers.get(kind)
+        log.info("Job started", job_id=job_id, kind=kind, tenant=job["tenant"], attempt=job["attempts"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind: {kind}")
+            progress = self._progress(job_id, started)
+            if inspect.iscoroutinefunction(handler):
+                result = await handler(job_id, job["payload"], progress)
+            else:
+                result = await asyncio.to_thread(handler, job_id, job["payload"], progress)
+            self.store.finish(job_id, SUCCEEDED, result=result)
+            log.info("Job succeeded", job_id=job_id, kind=kind, elapsed_s=round(time.monotonic() - started, 2))
+        except (JobCancelled, asyncio.CancelledError) as e:
+            if isinstance(e, asyncio.CancelledError) and not self.store.get(job_id)["cancel_requested"]:
+                raise
+            self.store.finish(job_id, CANCELLED)
+            log.info("Job cancelled", job_id=job_id, kind=kind)
+        except Exception as e:
+            self.store.finish(job_id, FAILED, error=str(e))
+            log.error("Job failed", job_id=job_id, kind=kind, error=str(e))
+        shutil.rmtree(self.files_dir(job_id), ignore_errors=True)
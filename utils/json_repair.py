@@ -0,0 +1,216 @@
+from __future__ import annotations
+import ast
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from pydantic import ValidationError
+
+from logger import GLOBAL_LOGGER as log
+
+# Reasoning models (qwen3 on groq) prefix answers with <think>...</think>, which may hold a draft of the JSON;
+# a block left unclosed (output cut short) is taken to run up to the JSON
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+_THINK_UNCLOSED = re.compile(r"<think>.*?(?=\{\s*\"|\[\s*[\[{\"\]])", re.DOTALL | re.IGNORECASE)
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_WORD = re.compile(r"[A-Za-z_]\w*")
+_PYTHON_LITERALS = {"true": "True", "false": "False", "null": "None"}
+
+OUTCOMES = ("clean", "repaired", "llm_fixed", "failed")
+
+
+class ParseOutcomes:
+    """Process-wide count of structured output parses by parser label and outcome."""
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, label: str, outcome: str) -> None:
+        with self._lock:
+            self._counts[(label, outcome)] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            counts = dict(self._counts)
+        labels = sorted({label for label, _ in counts})
+        return {label: {outcome: counts.get((label, outcome), 0) for outcome in OUTCOMES} for label in labels}
+
+
+PARSE_OUTCOMES = ParseOutcomes()
+
+
+def strip_reasoning(text: str) -> str:
+    """Model output without its <think> blocks: closed ones first, then an unclosed one up to the JSON."""
+    return _THINK_UNCLOSED.sub("", _THINK_BLOCK.sub("", text))
+
+
+def _python_literals(text: str) -> str:
+    """JSON true / false / null spelled as Python literals, outside string literals ('...' or "...")."""
+    out: List[str] = []
+    quote: Optional[str] = None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                out.append(text[i : i + 2])
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+            out.append(ch)
+            i += 1
+        elif ch in "'\"":
+            quote = ch
+            out.append(ch)
+            i += 1
+        else:
+            word = _WORD.match(text, i)
+            if word:
+                out.append(_PYTHON_LITERALS.get(word.group(), word.group()))
+                i = word.end()
+            else:
+                out.append(ch)
+                i += 1
+    return "".join(out)
+
+
+def _outermost(text: str) -> str:
+    """The first JSON object / array in `text` up to its matching bracket (closed if the output was cut off)."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("No JSON object or array in model output")
+    stack: List[str] = []
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not stack or stack.pop() != ch:
+                raise ValueError("Unbalanced brackets in model output")
+            if not stack:
+                return text[start : i + 1]
+    # truncated output: close what is open
+    return text[start:].rstrip().rstrip(",") + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any:
+    """
+    Local best-effort parse of LLM JSON output: drops reasoning blocks and code fences, takes the
+    outermost object / array, then tolerates trailing commas, smart quotes and Python-style literals.
+    Raises ValueError when nothing sensible comes out.
+    """
+    text = strip_reasoning(text)
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    candidate = _outermost(text.translate(_SMART_QUOTES))
+    for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError:
+            pass
+    try:
+        # single-quoted keys / strings and True / False / None
+        return ast.literal_eval(_TRAILING_COMMA.sub(r"\1", _python_literals(candidate)))
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"Model output is not repairable JSON: {e}") from e
+
+
+class RepairingJsonOutputParser(JsonOutputParser):
+    """
+    JsonOutputParser that validates against `pydantic_object` and repairs common defects locally
+    (repair_json) before paying for an LLM fix through `fixer` (an OutputFixingParser).
+    Outcomes are counted in PARSE_OUTCOMES under `label`.
+    """
+    fixer: Optional[Any] = None
+    label: str = "json"
+    record: bool = True
+
+    def _validated(self, value: Any) -> Any:
+        if self.pydantic_object is not None:
+            self.pydantic_object.model_validate(value)
+        return value
+
+    def _record(self, outcome: str) -> None:
+        if self.record:
+            PARSE_OUTCOMES.record(self.label, outcome)
+
+    def parse_local(self, text: str) -> Any:
+        """Strict parse, then local repair; OutputParserException when both fail."""
+        try:
+            value = self._validated(super().parse_result([Generation(text=text)]))
+            self._record("clean")
+            return value
+        except (OutputParserException, ValidationError):
+            pass
+        try:
+            value = self._validated(repair_json(text))
+        except (ValueError, ValidationError) as e:
+            raise OutputParserException(f"Invalid json output: {e}", llm_output=text) from e
+        self._record("repaired")
+        log.info("Model output repaired locally", parser=self.label)
+        return value
+
+    def _fixer_input(self, text: str, error: Optional[Exception]) -> str:
+        if self.fixer is None:
+            self._record("failed")
+            raise error or OutputParserException("No fixer configured", llm_output=text)
+        # the fixer gets the output without the reasoning block, which can be most of its tokens
+        return strip_reasoning(text)
+
+    def fix(self, text: str, error: Optional[Exception] = None) -> Any:
+        """LLM repair round trip through `fixer`, for output parse_local gave up on."""
+        text = self._fixer_input(text, error)
+        try:
+            value = self.fixer.parse(text)
+        except Exception:
+            self._record("failed")
+            raise
+        self._record("llm_fixed")
+        return value
+
+    async def afix(self, text: str, error: Optional[Exception] = None) -> Any:
+        text = self._fixer_input(text, error)
+        try:
+            value = await self.fixer.aparse(text)
+        except Exception:
+            self._record("failed")
+            raise
+        self._record("llm_fixed")
+        return value
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        text = result[0].text
+        try:
+            return self.parse_local(text)
+        except OutputParserException as e:
+            return self.fix(text, e)
+
+    async def aparse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        text = result[0].text
+        try:
+            return self.parse_local(text)
+        except OutputParserException as e:
+            return await self.afix(text, e)
@@ -0,0 +1,317 @@
+from __future__ import annotations
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+
+from logger import GLOBAL_LOGGER as log
+
+# Sync calls race on these threads; a losing call cannot be interrupted and finishes in the background
+_ROUTER_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-router")
+
+DEFAULT_ROUTER = {
+    "latency_window": 50,
+    "min_samples": 5,
+    "hedge": True,
+    "hedge_delay_s": 2.0,
+    "hedge_min_s": 0.25,
+    "failure_threshold": 3,
+    "cooldown_s": 30.0,
+}
+
+
+class ProviderStats:
+    """
+    Moving window of call latencies plus a circuit breaker for one provider.
+    The circuit opens after `failure_threshold` consecutive failures; after `cooldown_s`
+    a single trial call is let through (half-open) and its outcome closes or re-opens it.
+    """
+    def __init__(self, window: int = 50, failure_threshold: int = 3, cooldown_s: float = 30.0):
+        self.latencies: deque = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing or time.monotonic() - self.opened_at >= self.cooldown_s else "open"
+
+    def acquire(self) -> bool:
+        """Whether a call may go to this provider now (claims the trial call of a half-open circuit)."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown_s:
+                return False
+            self.probing = True
+            return True
+
+    def available(self) -> bool:
+        with self._lock:
+            return self.opened_at is None or (not self.probing and time.monotonic() - self.opened_at >= self.cooldown_s)
+
+    def success(self, latency_s: float) -> None:
+        with self._lock:
+            self.latencies.append(latency_s)
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def abandoned(self, latency_s: Optional[float]) -> None:
+        """
+        A call cancelled before it answered. After losing a race `latency_s` is recorded (at least what
+        the winner took: this provider was no faster); None when the caller gave up, which says nothing.
+        """
+        with self._lock:
+            if latency_s is not None:
+                self.latencies.append(latency_s)
+            self.probing = False
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "state": self.state,
+            "samples": len(self.latencies),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "consecutive_failures": self.failures,
+        }
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model routing each call across several providers (config.yaml -> llm_router):
+    the provider with the lowest recent p50 goes first, a hedge call to the next provider is
+    fired when the first is slower than its own p95, the first response wins, failures fail over
+    to the next provider, and providers that keep failing are skipped until their circuit cools down.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    providers: Dict[str, BaseChatModel]
+    latency_window: int = DEFAULT_ROUTER["latency_window"]
+    min_samples: int = DEFAULT_ROUTER["min_samples"]
+    hedge: bool = DEFAULT_ROUTER["hedge"]
+    hedge_delay_s: float = DEFAULT_ROUTER["hedge_delay_s"]
+    hedge_min_s: float = DEFAULT_ROUTER["hedge_min_s"]
+    failure_threshold: int = DEFAULT_ROUTER["failure_threshold"]
+    cooldown_s: float = DEFAULT_ROUTER["cooldown_s"]
+
+    _stats: Dict[str, ProviderStats] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._stats = {
+            name: ProviderStats(self.latency_window, self.failure_threshold, self.cooldown_s) for name in self.providers
+        }
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def _order(self) -> List[str]:
+        """Providers with a closed (or trial-ready) circuit, fastest recent p50 first; unknown ones rank at hedge_delay_s."""
+        names = [name for name in self.providers if self._stats[name].available()]
+        rank = {name: i for i, name in enumerate(self.providers)}
+
+        def p50(name: str) -> float:
+            value = self._stats[name].quantile(0.5, self.min_samples)
+            return self.hedge_delay_s if value is None else value
+
+        return sorted(names, key=lambda name: (p50(name), rank[name]))
+
+    def _hedge_after(self, name: str) -> float:
+        p95 = self._stats[name].quantile(0.95, self.min_samples)
+        return max(self.hedge_min_s, self.hedge_delay_s if p95 is None else p95)
+
+    def _next(self, queue: List[str]) -> Optional[str]:
+        while queue:
+            name = queue.pop(0)
+            if self._stats[name].acquire():
+                return name
+        return None
+
+    @staticmethod
+    def _result(message: BaseMessage, name: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"provider": name})
+
+    def _failed(self, errors: Dict[str, str]) -> RuntimeError:
+        log.error("All LLM providers failed", errors=errors, providers=self.stats())
+        return RuntimeError(f"All LLM providers failed or are unavailable: {errors or 'circuits open'}")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        queue = self._order()
+        pending: Dict[Future, str] = {}
+        started_at: Dict[Future, float] = {}
+        errors: Dict[str, str] = {}
+        race: Dict[str, Optional[float]] = {"winner_s": None}
+        hedged = False
+
+        def launch() -> bool:
+            name = self._next(queue)
+            if name is None:
+                return False
+            started = time.monotonic()
+            future = _ROUTER_POOL.submit(self.providers[name].invoke, messages, stop=stop, **kwargs)
+            # every call reports its outcome, also one that lost the race and finished later
+            future.add_done_callback(lambda f, name=name: self._settle(name, f, started, race))
+            pending[future] = name
+            started_at[future] = started
+            return True
+
+        launch()
+        while pending:
+            first = next(iter(pending.values()))
+            can_hedge = self.hedge and not hedged and len(pending) == 1 and queue
+            done, _ = wait(list(pending), timeout=self._hedge_after(first) if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                if hedged:
+                    log.info("LLM call hedged", slow_provider=first, hedge_provider=list(pending.values())[-1])
+                continue
+            for future in done:
+                name = pending.pop(future)
+                if future.exception() is None:
+                    race["winner_s"] = time.monotonic() - started_at[future]
+                    for loser in pending:
+                        loser.cancel()
+                    return self._result(future.result(), name)
+                errors[name] = repr(future.exception())
+                log.warning("LLM provider failed, failing over", provider=name, error=errors[name])
+                if not pending:
+                    launch()
+        raise self._failed(errors)
+
+    def _settle(self, name: str, future: Future, started: float, race: Dict[str, Optional[float]]) -> None:
+        if future.cancelled():
+            winner_s = race["winner_s"]
+            self._stats[name].abandoned(None if winner_s is None else max(time.monotonic() - started, winner_s))
+        elif future.exception() is not None:
+            self._stats[name].failure()
+        else:
+            self._stats[name].success(time.monotonic() - started)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        queue = self._order()
+        pending: Dict[asyncio.Task, str] = {}
+        started_at: Dict[asyncio.Task, float] = {}
+        errors: Dict[str, str] = {}
+        race: Dict[str, Optional[float]] = {"winner_s": None}
+        hedged = False
+
+        def launch() -> bool:
+            name = self._next(queue)
+            if name is None:
+                return False
+            started = time.monotonic()
+            task = asyncio.ensure_future(self.providers[name].ainvoke(messages, stop=stop, **kwargs))
+            task.add_done_callback(lambda t, name=name: self._settle(name, t, started, race))
+            pending[task] = name
+            started_at[task] = started
+            return True
+
+        launch()
+        try:
+            while pending:
+                first = next(iter(pending.values()))
+                can_hedge = self.hedge and not hedged and len(pending) == 1 and queue
+                done, _ = await asyncio.wait(
+                    list(pending), timeout=self._hedge_after(first) if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = launch()
+                    if hedged:
+                        log.info("LLM call hedged", slow_provider=first, hedge_provider=list(pending.values())[-1])
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        race["winner_s"] = time.monotonic() - started_at[task]
+                        return self._result(task.result(), name)
+                    errors[name] = repr(task.exception())
+                    log.warning("LLM provider failed, failing over", provider=name, error=errors[name])
+                    if not pending:
+                        launch()
+            raise self._failed(errors)
+        finally:
+            # losers (and everything, if the caller was cancelled) stop their provider calls
+            for task in pending:
+                task.cancel()
+
+
+class SimulatedChatModel(BaseChatModel):
+    """Offline stand-in for a provider (llm provider "simulated"): fixed reply after a latency, failing at `error_rate`."""
+    response: str = "{}"
+    latency_s: float = 0.1
+    jitter_s: float = 0.0
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+
+    _rng: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _draw(self) -> Tuple[float, bool]:
+        delay = max(0.0, self.latency_s + self._rng.uniform(-self.jitter_s, self.jitter_s))
+        return delay, self._rng.random() < self.error_rate
+
+    def _reply(self, fails: bool) -> ChatResult:
+        if fails:
+            raise RuntimeError("Simulated provider error")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        delay, fails = self._draw()
+        time.sleep(delay)
+        return self._reply(fails)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        delay, fails = self._draw()
+        await asyncio.sleep(delay)
+        return self._reply(fails)
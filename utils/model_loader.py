@@ -1,18 +1,36 @@
 import os
 import sys
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
+from langchain_core.embeddings import Embeddings
 #from langchain_openai import ChatOpenAI
 
 from utils.config_loader import load_config
+from utils.call_gateway import GATEWAY, GatedChatModel, GatedEmbeddings
+from utils.llm_router import DEFAULT_ROUTER, RoutedChatModel, SimulatedChatModel
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 
 log = CustomLogger().get_Logger(__name__)
 
+# One router per process, so provider latency windows and circuit states outlive a request
+_ROUTER: Optional[RoutedChatModel] = None
+_ROUTER_LOCK = threading.Lock()
+
+# Model registry: one client per model per process. Provider clients own their HTTP / gRPC
+# connection pools, so they are created once (at warm-up or on first use) and shared by every request.
+_CLIENTS: Dict[Tuple[str, str], Any] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def registered_models() -> List[str]:
+    """Clients created so far in this process, as "kind:name"."""
+    with _CLIENTS_LOCK:
+        return sorted(f"{kind}:{name}" for kind, name in _CLIENTS)
+
+
 class ModelLoader:
     """
     A Utility class to load Embedding Model and LLM
@@ -22,8 +40,18 @@ class ModelLoader:
         load_dotenv()
         self._vaildate_env()
         self.config = load_config()
+        self.gateway_config = self.config.get("gateway", {}) or {}
+        GATEWAY.configure(self.gateway_config)
         log.info("Configuration loaded successfully", config_keys = list(self.config.keys()))
 
+    def _gated(self, client, provider: str):
+        """Route the client's calls through the shared gateway (limits + coalescing) unless gateway.enabled is false."""
+        if not self.gateway_config.get("enabled", True):
+            return client
+        if isinstance(client, Embeddings):
+            return GatedEmbeddings(client, provider)
+        return GatedChatModel(model=client, provider=provider)
+
     def _vaildate_env(self):
         """
         Validate necessary environment variables.
@@ -37,6 +65,13 @@ class ModelLoader:
             raise DocumentPortalException("Missing environment variables", sys)
         log.info("Environment variables validated", available_keys = [k for k in self.api_keys if self.api_keys[k] ])
 
+    def _registered(self, kind: str, name: str, create: Callable[[], Any]):
+        """The process-wide client for (kind, name), created by `create` the first time."""
+        with _CLIENTS_LOCK:
+            if (kind, name) not in _CLIENTS:
+                _CLIENTS[(kind, name)] = create()
+            return _CLIENTS[(kind, name)]
+
     def load_embedding(self):
         """
         Method to load Embedding Model
@@ -44,7 +79,11 @@ class ModelLoader:
         try:
             log.info("Loading embedding model...")
             model_name = self.config["embedding_model"]["model_name"]
-            return GoogleGenerativeAIEmbeddings(model=model_name)
+            # provider SDKs are imported on first use: together they take about a second to import
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            return self._registered(
+                "embedding", model_name, lambda: self._gated(GoogleGenerativeAIEmbeddings(model=model_name), "embedding")
+            )
         except Exception as e:
             log.error("Error loading embedding model",str(e))
             raise DocumentPortalException("Failed to load embedding model",sys)
@@ -52,12 +91,32 @@ class ModelLoader:
     def load_llm(self):
         """
         Method to load LLM
+        With llm_router.enabled the process-wide router over llm_router.providers is returned instead.
         """
+        router_config = self.config.get("llm_router", {}) or {}
+        if router_config.get("enabled"):
+            return self.load_router()
+        provider_key = os.getenv("LLM_PROVIDER",'groq')
+        return self._registered("llm", provider_key, lambda: self._gated(self._load_provider(provider_key), provider_key))
+
+    def load_router(self) -> RoutedChatModel:
+        """Latency-aware, hedging, failing-over router over the providers listed in llm_router.providers."""
+        global _ROUTER
+        with _ROUTER_LOCK:
+            if _ROUTER is None:
+                router_config = {**DEFAULT_ROUTER, **(self.config.get("llm_router", {}) or {})}
+                names = router_config.pop("providers", None) or list(self.config["llm"])
+                router_config.pop("enabled", None)
+                _ROUTER = RoutedChatModel(
+                    providers={name: self._gated(self._load_provider(name), name) for name in names}, **router_config
+                )
+                log.info("LLM router loaded", providers=names, hedge=_ROUTER.hedge)
+            return _ROUTER
+
+    def _load_provider(self, provider_key: str):
         llm_block = self.config["llm"]
         log.info("Loading LLM ")
 
-        provider_key = os.getenv("LLM_PROVIDER",'groq')
-
         if provider_key not in llm_block:
             log.error('No provider key found', provider_key=provider_key)
             raise ValueError(f"Provider: {provider_key} not found in config")
@@ -71,6 +130,7 @@ class ModelLoader:
         log.info("Loading LLM", provider=provider, model=model_name,temperature=temperature,max_tokens =max_output_tokens)
 
         if provider == 'google':
+            from langchain_google_genai import ChatGoogleGenerativeAI
             return ChatGoogleGenerativeAI(
                 model = model_name,
                 api_key = self.api_keys["GOOGLE_API_KEY"],
@@ -80,6 +140,7 @@ class ModelLoader:
             )
 
         elif provider =='groq':
+            from langchain_groq import ChatGroq
             return ChatGroq(
                 model=model_name,
                 api_key=self.api_keys["GROQ_API_KEY"],
@@ -87,6 +148,15 @@ class ModelLoader:
                 max_tokens=max_output_tokens
             )
         
+        elif provider == 'simulated':
+            # offline stand-in with configurable latency / error rate, for router and load testing
+            return SimulatedChatModel(
+                response=llm_config.get('response', '{}'),
+                latency_s=llm_config.get('latency_s', 0.1),
+                jitter_s=llm_config.get('jitter_s', 0.0),
+                error_rate=llm_config.get('error_rate', 0.0)
+            )
+
         else:
             log.error("Unsupported LLM provider", provider = provider)
             raise ValueError(f"Unsupported LLM provider:{provider}")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from logger import GLOBAL_LOGGER as log
+from utils.config_loader import load_config
+from utils.file_io import file_sha256
+
+DEFAULT_CACHE_PATH = "data/parse_cache.sqlite"
+
+Page = Dict[str, Any]  # {"text": str, "metadata": {"page": int, "page_label": str, "total_pages": int}}
+
+
+@lru_cache(maxsize=1)
+def parser_version() -> str:
+    """Bumped with the extraction code below or the PyMuPDF build, so stale text is never served."""
+    import fitz  # PyMuPDF, imported on first use: it is slow to load and most processes never parse
+    return f"pymupdf-{fitz.VersionBind}-1"
+
+
+def parse_pdf(path: Union[str, Path]) -> List[Page]:
+    """Per-page text of a PDF with PyMuPDF (page numbers 0-based, as the chunk metadata uses)."""
+    import fitz
+    with fitz.open(str(path)) as f:
+        if f.needs_pass:
+            raise ValueError(f"PDF is encrypted: {Path(path).name}")
+        pages: List[Page] = []
+        for page_num in range(f.page_count):
+            page = f.load_page(page_num)
+            pages.append({
+                "text": page.get_text(),
+                "metadata": {"page": page_num, "page_label": page.get_label() or str(page_num + 1), "total_pages": f.page_count},
+            })
+        return pages
+
+
+class ParsedTextCache:
+    """
+    Parsed PDF pages keyed by (content SHA-256, parser version) in one SQLite file shared by
+    analysis, comparison and chat, so a file is parsed once however often and wherever it is uploaded.
+    Each document is a single zlib-compressed JSON row.
+    """
+    def __init__(self, path: Union[str, Path] = DEFAULT_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "sha256 TEXT NOT NULL, parser TEXT NOT NULL, pages INTEGER NOT NULL, data BLOB NOT NULL, "
+                "parsed_at TEXT NOT NULL, PRIMARY KEY (sha256, parser)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+
+    def get(self, sha256: str, parser: Optional[str] = None) -> Optional[List[Page]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM parsed WHERE sha256 = ? AND parser = ?", (sha256, parser or parser_version())
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def put(self, sha256: str, pages: List[Page], parser: Optional[str] = None) -> None:
+        data = zlib.compress(json.dumps(pages, ensure_ascii=False).encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed (sha256, parser, pages, data, parsed_at) VALUES (?, ?, ?, ?, ?)",
+                (sha256, parser or parser_version(), len(pages), data, datetime.now(timezone.utc).isoformat()),
+            )
+            self._conn.commit()
+
+    def pdf_pages(self, path: Union[str, Path]) -> List[Page]:
+        sha256 = file_sha256(path)
+        pages = self.get(sha256)
+        if pages is not None:
+            log.info("Parsed PDF served from cache", path=str(path), pages=len(pages))
+            return pages
+        started = time.perf_counter()
+        pages = parse_pdf(path)
+        self.put(sha256, pages)
+        log.info("PDF parsed and cached", path=str(path), pages=len(pages), parse_ms=round((time.perf_counter() - started) * 1000, 1))
+        return pages
+
+    def prune(self) -> int:
+        """Drop entries written by other parser versions."""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM parsed WHERE parser != ?", (parser_version(),)).rowcount
+            self._conn.commit()
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_CACHE: Optional[ParsedTextCache] = None
+_CACHE_PID: Optional[int] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_parse_cache() -> Optional[ParsedTextCache]:
+    """Process-wide cache from config.yaml -> parse_cache; None when disabled."""
+    global _CACHE, _CACHE_PID
+    with _CACHE_LOCK:
+        # a forked parse worker must not share the parent's SQLite connection
+        if _CACHE is not None and _CACHE_PID != os.getpid():
+            _CACHE = None
+        if _CACHE is None:
+            config = load_config().get("parse_cache", {}) or {}
+            if not config.get("enabled", True):
+                return None
+            _CACHE = ParsedTextCache(config.get("path") or DEFAULT_CACHE_PATH)
+            _CACHE_PID = os.getpid()
+            removed = _CACHE.prune()
+            if removed:
+                log.info("Stale parsed documents dropped", removed=removed, parser=parser_version())
+        return _CACHE
+
+
+def read_pdf_pages(path: Union[str, Path]) -> List[Page]:
+    """Per-page text + metadata of a PDF, parsed at most once per content and parser version."""
+    cache = get_parse_cache()
+    return cache.pdf_pages(path) if cache is not None else parse_pdf(path)
+
+
+def pdf_text(path: Union[str, Path]) -> str:
+    """Whole-document text with --Page N-- markers, as document analysis sends it to the model."""
+    return "\n".join(f"\n--Page {page['metadata']['page']+1}--\n{page['text']}" for page in read_pdf_pages(path))
@@ -0,0 +1,33 @@
+from __future__ import annotations
+from typing import List, Sequence
+
+from langchain.schema import Document
+
+# ~4 characters per token holds well enough for English prose with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for prompt budgeting."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def trim_docs_to_budget(docs: Sequence[Document], max_tokens: int) -> List[Document]:
+    """
+    Keep documents in rank order until the token budget is spent.
+    The last document that does not fit is cut at a whitespace boundary.
+    """
+    kept: List[Document] = []
+    remaining = max_tokens
+    for doc in docs:
+        cost = estimate_tokens(doc.page_content)
+        if cost <= remaining:
+            kept.append(doc)
+            remaining -= cost
+            continue
+        if remaining > 0:
+            cut = doc.page_content[: remaining * CHARS_PER_TOKEN]
+            cut = cut.rsplit(None, 1)[0] if " " in cut else cut
+            if cut:
+                kept.append(Document(page_content=cut, metadata={**doc.metadata, "truncated": True}, id=doc.id))
+        break
+    return kept
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import faiss
+
+from logger import GLOBAL_LOGGER as log
+
+STORAGE_MODES = ("flat", "sq_fp16", "sq_int8", "pq")
+RAW_VECTORS_FILE = "vectors.f32"
+
+
+# ----------------------------- #
+# Index construction            #
+# ----------------------------- #
+def default_pq_m(dim: int) -> int:
+    """Largest sub-quantizer count <= dim/8 that divides dim (8 dims per PQ code byte)."""
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+def min_training_vectors(mode: str, pq_nbits: int = 8) -> int:
+    """Number of vectors a storage mode needs before it can be trained."""
+    if mode == "pq":
+        return 2 ** pq_nbits
+    if mode == "sq_int8":
+        return 1
+    return 0
+
+def build_index(dim: int, mode: str = "flat", *, pq_m: Optional[int] = None, pq_nbits: int = 8) -> faiss.Index:
+    """Create an empty L2 index for the requested storage mode."""
+    if mode == "flat":
+        return faiss.IndexFlatL2(dim)
+    if mode == "sq_fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    if mode == "sq_int8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    if mode == "pq":
+        return faiss.IndexPQ(dim, pq_m or default_pq_m(dim), pq_nbits, faiss.METRIC_L2)
+    raise ValueError(f"Unsupported storage mode: {mode}. Expected one of {STORAGE_MODES}")
+
+def compress_vectors(vectors: np.ndarray, mode: str, *, pq_m: Optional[int] = None, pq_nbits: int = 8) -> faiss.Index:
+    """Train a compressed index on `vectors` and add them to it."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = build_index(vectors.shape[1], mode, pq_m=pq_m, pq_nbits=pq_nbits)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Resident size of the stored codes plus any trained codebook."""
+    codes = int(index.ntotal) * int(index.sa_code_size())
+    if isinstance(index, faiss.IndexPQ):
+        codes += int(index.pq.centroids.size()) * 4
+    return codes
+
+
+# ----------------------------- #
+# Raw (exact) vector file       #
+# ----------------------------- #
+def append_raw_vectors(path: Path, vectors: np.ndarray) -> None:
+    """Append float32 rows to the raw vector file kept next to a compressed index."""
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+def open_raw_vectors(path: Path, dim: int) -> Optional[np.ndarray]:
+    """Memory-map the raw vector file; rows are paged in only when indexed."""
+    path = Path(path)
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    rows = path.stat().st_size // (4 * dim)
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
+
+
+# ----------------------------- #
+# Search helpers                #
+# ----------------------------- #
+def exact_rerank(query: np.ndarray, ids: np.ndarray, raw_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-score candidate ids with exact squared L2 against the raw vectors."""
+    ids = ids[(ids >= 0) & (ids < raw_vectors.shape[0])]
+    if ids.size == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    candidates = np.asarray(raw_vectors[np.sort(ids)], dtype=np.float32)
+    distances = ((candidates - query.reshape(1, -1)) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return distances[order].astype(np.float32), np.sort(ids)[order].astype(np.int64)
+
+def measure_recall(
+    index: faiss.Index,
+    raw_vectors: np.ndarray,
+    *,
+    k: int = 10,
+    sample: int = 100,
+    rerank_factor: int = 0,
+    seed: int = 0
+) -> float:
+    """
+    Recall@k of `index` against brute force over the raw vectors.
+    Queries are sampled from the stored vectors themselves.
+    """
+    total = raw_vectors.shape[0]
+    if total == 0:
+        return 1.0
+    k = min(k, total)
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(total, size=min(sample, total), replace=False))
+    queries = np.ascontiguousarray(raw_vectors[picks], dtype=np.float32)
+
+    _, exact = faiss.knn(queries, np.ascontiguousarray(raw_vectors, dtype=np.float32), k)
+    fetch = k * rerank_factor if rerank_factor > 1 else k
+    _, approx = index.search(queries, min(fetch, total))
+
+    hits = 0
+    for q, row_exact, row_approx in zip(queries, exact, approx):
+        if rerank_factor > 1:
+            _, row_approx = exact_rerank(q, row_approx, raw_vectors, k)
+        hits += len(set(row_exact.tolist()) & set(row_approx[:k].tolist()))
+    recall = hits / float(len(picks) * k)
+    log.info("Index recall measured", k=k, queries=len(picks), rerank_factor=rerank_factor, recall=round(recall, 4))
+    return recall
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_WARMUP = {
+    "enabled": True,
+    "hot_sessions": [],
+    "shared_index": False,
+    "wait_for_indexes": False,
+    "pool_workers": True,
+}
+
+PENDING, RUNNING, DONE, FAILED, SKIPPED = "pending", "running", "done", "failed", "skipped"
+
+# stage(progress): progress(**details) adds details to the stage's entry in the report
+Stage = Callable[[Callable[..., None]], None]
+
+
+class WarmUpStopped(Exception):
+    """Raised from a stage's progress callback once the app is shutting down."""
+
+
+def _ms(since: float) -> float:
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+class WarmUp:
+    """
+    Startup warm-up (config.yaml -> warmup), reported by GET /ready. Stages are registered by name
+    and run once, in order, on a worker thread after startup, so the app answers /health at once.
+    The process is ready when every required stage is done; optional stages (e.g. hot indexes) keep
+    running after that. A failed required stage skips the stages after it and keeps the process unready.
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**DEFAULT_WARMUP, **(config or {})}
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._steps: List[Tuple[str, Stage]] = []
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+        self._started: Optional[float] = None
+        self._total_ms: Optional[float] = None
+
+    def add(self, name: str, stage: Stage, required: bool = True) -> None:
+        self._steps.append((name, stage))
+        self.stages[name] = {"status": PENDING, "required": required}
+
+    def _update(self, name: str, **details: Any) -> None:
+        with self._lock:
+            self.stages[name].update(details)
+
+    def _progress(self, name: str, **details: Any) -> None:
+        if self._stopped:
+            raise WarmUpStopped("shutting down")
+        self._update(name, **details)
+
+    async def start(self) -> None:
+        if self._task is not None or not self.config["enabled"]:
+            return
+        self._task = asyncio.create_task(asyncio.to_thread(self.run))
+
+    async def stop(self) -> None:
+        # the running stage stops at its next progress call
+        self._stopped = True
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def run(self) -> None:
+        self._started = time.monotonic()
+        log.info("Warm-up started", stages=[name for name, _ in self._steps])
+        blocked: Optional[str] = None
+        for name, stage in self._steps:
+            if self._stopped or blocked:
+                self._update(name, status=SKIPPED, reason="shutting down" if self._stopped else f"{blocked} failed")
+                continue
+            self._update(name, status=RUNNING)
+            started = time.monotonic()
+            try:
+                stage(partial(self._progress, name))
+                self._update(name, status=DONE, ms=_ms(started))
+                log.info("Warm-up stage done", stage=name, ms=_ms(started))
+            except Exception as e:
+                self._update(name, status=FAILED, ms=_ms(started), error=str(e))
+                if isinstance(e, WarmUpStopped):
+                    continue
+                log.error("Warm-up stage failed", stage=name, required=self.stages[name]["required"], error=str(e))
+                if self.stages[name]["required"]:
+                    blocked = name
+        self._total_ms = _ms(self._started)
+        log.info("Warm-up finished", ready=self.ready, ms=self._total_ms)
+
+    @property
+    def ready(self) -> bool:
+        if not self.config["enabled"]:
+            return True
+        with self._lock:
+            return all(stage["status"] == DONE for stage in self.stages.values() if stage["required"])
+
+    def status(self) -> str:
+        if not self.config["enabled"]:
+            return "disabled"
+        if self.ready:
+            return "ready"
+        with self._lock:
+            if any(stage["status"] == FAILED and stage["required"] for stage in self.stages.values()):
+                return "failed"
+        return "warming" if self._started is not None else "pending"
+
+    def report(self) -> Dict[str, Any]:
+        status = self.status()
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+        return {
+            "ready": status in ("ready", "disabled"),
+            "status": status,
+            "elapsed_ms": self._total_ms if self._total_ms is not None
+                          else (_ms(self._started) if self._started is not None else None),
+            "finished": self._total_ms is not None,
+            "stages": stages,
+        }